@@ -120,6 +120,24 @@ def arg_parser():
         "-tv",
         default=None,
         help="define the value of test dataset(E.g 0.1)")
+    parser.add_argument(
+        "--pack_dataset",
+        "-pd",
+        action="store_true",
+        default=False,
+        help="pack dataset into record files for fast loading")
+    parser.add_argument(
+        "--file_list",
+        "-fl",
+        type=_text_type,
+        default=None,
+        help="define the file list(or annotation file of COCO) to be packed")
+    parser.add_argument(
+        "--shard_size",
+        "-ss",
+        type=int,
+        default=256,
+        help="define the max size(MB) of each packed record file")
     parser.add_argument(
         "--start_restful",
         "-sr",
@@ -245,6 +263,26 @@ def main():
         pdx.tools.split.dataset_split(dataset_dir, dataset_format, val_value,
                                       test_value, save_dir)
 
+    if args.pack_dataset:
+        assert args.dataset_dir is not None, "--dataset_dir should be defined while packing dataset"
+        assert args.format is not None, "--format should be defined while packing dataset"
+        assert args.save_dir is not None, "--save_dir should be defined to save packed dataset"
+
+        dataset_format = args.format.lower()
+        if not dataset_format in ["coco", "imagenet", "voc", "seg"]:
+            logging.error(
+                "The dataset format is not correct defined.(support COCO/ImageNet/VOC/Seg)"
+            )
+        if not osp.exists(args.dataset_dir):
+            logging.error("The path of dataset to be packed doesn't exist.")
+
+        pdx.tools.pack.dataset_pack(
+            args.dataset_dir,
+            dataset_format,
+            args.save_dir,
+            file_list=args.file_list,
+            shard_size=args.shard_size * 1024**2)
+
     if args.start_restful:
 
         assert args.port is not None, "--port should be defined while start restful server"
@@ -20,5 +20,9 @@ from .easydata_cls import EasyDataCls
 from .easydata_det import EasyDataDet
 from .easydata_seg import EasyDataSeg
 from .dataset import generate_minibatch
+from .dataset import pack_images
 from .analysis import Seg
 from .change_det_dataset import ChangeDetDataset
+from .record import PackedImageNet
+from .record import PackedDetection
+from .record import PackedSegDataset
@@ -0,0 +1,155 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import os
+import os.path as osp
+import json
+import pickle
+import hashlib
+import shutil
+import tempfile
+import numpy as np
+import paddlex.utils.logging as logging
+from .record_store import DetRecordStore
+
+# 缓存格式发生变化时需递增该版本号，旧缓存会因key不同而自动失效
+CACHE_VERSION = 2
+
+
+def _stat_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "-1:-1"
+    return "{}:{}".format(st.st_mtime_ns, st.st_size)
+
+
+def get_cache_key(data_dir, file_list, label_list, ann_files):
+    """根据file_list、label_list的内容以及标注文件的修改时间计算缓存的key。
+
+    Args:
+        data_dir (str): 数据集所在的目录路径。
+        file_list (str): 数据集文件列表的路径。
+        label_list (str): 类别信息文件的路径。
+        ann_files (list): 参与解析的标注文件路径。
+
+    Returns:
+        str: 缓存的key。
+    """
+    md5 = hashlib.md5()
+    md5.update("v{}".format(CACHE_VERSION).encode())
+    md5.update(osp.abspath(data_dir).encode())
+    for path in [file_list, label_list]:
+        with open(path, 'rb') as f:
+            md5.update(f.read())
+    for ann_file in ann_files:
+        md5.update(ann_file.encode())
+        md5.update(_stat_signature(ann_file).encode())
+    return md5.hexdigest()
+
+
+def save_det_records(cache_dir, key, file_list, annotations):
+    """将检测数据集的样本记录编译为列式的numpy数组并保存至缓存目录。
+
+    样本记录先转换为`DetRecordStore`，其各列数组分别保存为.npy文件；
+    COCO格式的标注字典及多边形标注单独序列化保存。
+    写入先在临时目录完成，再原子地重命名为最终目录，避免并发写入时读到不完整的缓存。
+
+    Args:
+        cache_dir (str): 缓存的根目录。
+        key (str): 由`get_cache_key`计算得到的缓存key。
+        file_list (list|DetRecordStore): 数据集的样本记录，每个元素为[im_fname, (im_info, label_info)]。
+        annotations (dict): COCO格式的标注字典。
+    """
+    cache_path = osp.join(cache_dir, key)
+    if osp.exists(cache_path):
+        return
+    if not osp.exists(cache_dir):
+        os.makedirs(cache_dir)
+    if isinstance(file_list, DetRecordStore):
+        store = file_list
+    else:
+        store = DetRecordStore.from_records(file_list)
+    arrays = {
+        'offsets': store.offsets,
+        'im_id': store.im_ids,
+        'image_shape': store.image_shapes,
+        'poly_flags': store.poly_flags
+    }
+    arrays.update(store.columns)
+    meta = {'version': CACHE_VERSION, 'im_fnames': store.im_fnames}
+    tmp_path = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        for name, value in arrays.items():
+            np.save(osp.join(tmp_path, name + '.npy'), value)
+        with open(osp.join(tmp_path, 'annotations.pkl'), 'wb') as f:
+            pickle.dump(
+                (annotations, store.polys),
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL)
+        with open(osp.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp_path, cache_path)
+    except OSError as e:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not osp.exists(cache_path):
+            logging.warning("Failed to save annotation cache to {}: {}".format(
+                cache_path, e))
+        return
+    logging.info("Annotation cache is saved in {}".format(cache_path))
+
+
+def load_det_records(cache_dir, key):
+    """从缓存目录加载检测数据集的样本记录。
+
+    列式数组以内存映射（mmap）的方式打开并直接作为`DetRecordStore`的底层数据，
+    不会将整个数据集读入内存。
+
+    Args:
+        cache_dir (str): 缓存的根目录。
+        key (str): 由`get_cache_key`计算得到的缓存key。
+
+    Returns:
+        tuple|None: (DetRecordStore, annotations)，缓存不存在或无法读取时返回None。
+    """
+    cache_path = osp.join(cache_dir, key)
+    if not osp.isdir(cache_path):
+        return None
+    try:
+        with open(osp.join(cache_path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['version'] != CACHE_VERSION:
+            return None
+
+        def _load(name):
+            return np.load(osp.join(cache_path, name + '.npy'), mmap_mode='r')
+
+        columns = dict()
+        if len(meta['im_fnames']) > 0:
+            for name in DetRecordStore.COLUMNS:
+                columns[name] = _load(name)
+        with open(osp.join(cache_path, 'annotations.pkl'), 'rb') as f:
+            annotations, polys = pickle.load(f)
+        store = DetRecordStore(meta['im_fnames'],
+                               _load('im_id'),
+                               _load('image_shape'),
+                               _load('offsets'), columns,
+                               _load('poly_flags'), polys)
+    except Exception as e:
+        logging.warning("Failed to load annotation cache from {}: {}".format(
+            cache_path, e))
+        return None
+    logging.info("Annotation cache is loaded from {}".format(cache_path))
+    return store, annotations
@@ -94,12 +94,8 @@ class ChangeDetDataset(Dataset):
     def iterator(self):
         self._epoch += 1
         self._pos = 0
-        files = copy.deepcopy(self.file_list)
-        if self.shuffle:
-            random.shuffle(files)
-        files = files[:self.num_samples]
-        self.num_samples = len(files)
-        for f in files:
+        for idx in self.epoch_indices():
+            f = self.file_list[idx]
             label_path = f[2]
             image1 = seg_transforms.Compose.read_img(f[0])
             image2 = seg_transforms.Compose.read_img(f[1])
@@ -23,6 +23,76 @@ import paddlex.utils.logging as logging
 import paddlex as pst
 from .voc import VOCDetection
 from .dataset import is_pic
+from .dataset import parallel_map
+from .record_store import DetRecordStore
+
+
+def parse_coco_image(img_id, img_anno, instances, catid2clsid, data_dir):
+    """将COCO标注中单张图像的标注信息转换为样本记录。
+
+    Args:
+        img_id (int): 图像id。
+        img_anno (dict): 图像的标注信息。
+        instances (list): 图像中非crowd的实例标注。
+        catid2clsid (dict): COCO类别id到类别id的映射。
+        data_dir (str): 数据集所在的目录路径。
+
+    Returns:
+        list|None: [im_fname, (im_info, label_info)]，图像不是合法的图片格式时返回None。
+    """
+    im_fname = osp.join(data_dir, img_anno['file_name'])
+    if not is_pic(im_fname):
+        return None
+    im_w = float(img_anno['width'])
+    im_h = float(img_anno['height'])
+
+    bboxes = []
+    for inst in instances:
+        x, y, box_w, box_h = inst['bbox']
+        x1 = max(0, x)
+        y1 = max(0, y)
+        x2 = min(im_w - 1, x1 + max(0, box_w - 1))
+        y2 = min(im_h - 1, y1 + max(0, box_h - 1))
+        if inst['area'] > 0 and x2 >= x1 and y2 >= y1:
+            bboxes.append((inst, [x1, y1, x2, y2]))
+        else:
+            logging.warning(
+                "Found an invalid bbox in annotations: im_id: {}, area: {} x1: {}, y1: {}, x2: {}, y2: {}."
+                .format(img_id, float(inst['area']), x1, y1, x2, y2))
+    num_bbox = len(bboxes)
+    gt_bbox = np.zeros((num_bbox, 4), dtype=np.float32)
+    gt_class = np.zeros((num_bbox, 1), dtype=np.int32)
+    gt_score = np.ones((num_bbox, 1), dtype=np.float32)
+    is_crowd = np.zeros((num_bbox, 1), dtype=np.int32)
+    difficult = np.zeros((num_bbox, 1), dtype=np.int32)
+    gt_poly = [None] * num_bbox
+
+    for i, (box, clean_bbox) in enumerate(bboxes):
+        catid = box['category_id']
+        gt_class[i][0] = catid2clsid[catid]
+        gt_bbox[i, :] = clean_bbox
+        is_crowd[i][0] = box['iscrowd']
+        if 'segmentation' in box:
+            gt_poly[i] = box['segmentation']
+
+    im_info = {
+        'im_id': np.array([img_id]).astype('int32'),
+        'image_shape': np.array([im_h, im_w]).astype('int32'),
+    }
+    label_info = {
+        'is_crowd': is_crowd,
+        'gt_class': gt_class,
+        'gt_bbox': gt_bbox,
+        'gt_score': gt_score,
+        'gt_poly': gt_poly,
+        'difficult': difficult
+    }
+
+    if None in gt_poly:
+        del label_info['gt_poly']
+
+    coco_rec = (im_info, label_info)
+    return [im_fname, coco_rec]
 
 
 class CocoDetection(VOCDetection):
@@ -38,6 +108,10 @@ class CocoDetection(VOCDetection):
         parallel_method (str): 数据集中样本在预处理过程中并行处理的方式，支持'thread'
             线程和'process'进程两种方式。默认为'process'（Windows和Mac下会强制使用thread，该参数无效）。
         shuffle (bool): 是否需要对数据集中样本打乱顺序。默认为False。
+        num_parse_workers (int): 构建数据集时并行解析标注的进程数，解析结果与串行解析完全一致。
+            默认为1，即串行解析（Windows和Mac下会强制串行解析）。
+        compact_records (bool): 是否以列式numpy数组（`DetRecordStore`）保存全部样本的标注，可大幅降低
+            标注数量较多时的内存占用，且fork出的数据处理子进程可直接共享这部分内存。默认为False。
     """
 
     def __init__(self,
@@ -47,7 +121,9 @@ class CocoDetection(VOCDetection):
                  num_workers='auto',
                  buffer_size=100,
                  parallel_method='process',
-                 shuffle=False):
+                 shuffle=False,
+                 num_parse_workers=1,
+                 compact_records=False):
         from pycocotools.coco import COCO
 
         try:
@@ -78,64 +154,19 @@ class CocoDetection(VOCDetection):
         for label, cid in sorted(cname2cid.items(), key=lambda d: d[1]):
             self.labels.append(label)
         logging.info("Starting to read file list from dataset...")
+        samples = list()
         for img_id in img_ids:
             img_anno = coco.loadImgs(img_id)[0]
-            im_fname = osp.join(data_dir, img_anno['file_name'])
-            if not is_pic(im_fname):
-                continue
-            im_w = float(img_anno['width'])
-            im_h = float(img_anno['height'])
             ins_anno_ids = coco.getAnnIds(imgIds=img_id, iscrowd=False)
             instances = coco.loadAnns(ins_anno_ids)
-
-            bboxes = []
-            for inst in instances:
-                x, y, box_w, box_h = inst['bbox']
-                x1 = max(0, x)
-                y1 = max(0, y)
-                x2 = min(im_w - 1, x1 + max(0, box_w - 1))
-                y2 = min(im_h - 1, y1 + max(0, box_h - 1))
-                if inst['area'] > 0 and x2 >= x1 and y2 >= y1:
-                    inst['clean_bbox'] = [x1, y1, x2, y2]
-                    bboxes.append(inst)
-                else:
-                    logging.warning(
-                        "Found an invalid bbox in annotations: im_id: {}, area: {} x1: {}, y1: {}, x2: {}, y2: {}."
-                        .format(img_id, float(inst['area']), x1, y1, x2, y2))
-            num_bbox = len(bboxes)
-            gt_bbox = np.zeros((num_bbox, 4), dtype=np.float32)
-            gt_class = np.zeros((num_bbox, 1), dtype=np.int32)
-            gt_score = np.ones((num_bbox, 1), dtype=np.float32)
-            is_crowd = np.zeros((num_bbox, 1), dtype=np.int32)
-            difficult = np.zeros((num_bbox, 1), dtype=np.int32)
-            gt_poly = [None] * num_bbox
-
-            for i, box in enumerate(bboxes):
-                catid = box['category_id']
-                gt_class[i][0] = catid2clsid[catid]
-                gt_bbox[i, :] = box['clean_bbox']
-                is_crowd[i][0] = box['iscrowd']
-                if 'segmentation' in box:
-                    gt_poly[i] = box['segmentation']
-
-            im_info = {
-                'im_id': np.array([img_id]).astype('int32'),
-                'image_shape': np.array([im_h, im_w]).astype('int32'),
-            }
-            label_info = {
-                'is_crowd': is_crowd,
-                'gt_class': gt_class,
-                'gt_bbox': gt_bbox,
-                'gt_score': gt_score,
-                'gt_poly': gt_poly,
-                'difficult': difficult
-            }
-
-            if None in gt_poly:
-                del label_info['gt_poly']
-
-            coco_rec = (im_info, label_info)
-            self.file_list.append([im_fname, coco_rec])
+            samples.append(
+                (img_id, img_anno, instances, catid2clsid, data_dir))
+        recs = parallel_map(parse_coco_image, samples, num_parse_workers)
+        for rec in recs:
+            if rec is not None:
+                self.file_list.append(rec)
+        if compact_records:
+            self.file_list = DetRecordStore.from_records(self.file_list)
         if not len(self.file_list) > 0:
             raise Exception('not found any coco record in %s' % (ann_file))
         logging.info("{} samples in file {}".format(
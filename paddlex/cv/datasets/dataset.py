@@ -13,7 +13,11 @@
 # limitations under the License.
 
 from threading import Thread
+from threading import Event
+from threading import Semaphore
 import multiprocessing
+import traceback
+import weakref
 import collections
 import numpy as np
 import six
@@ -29,6 +33,17 @@ class EndSignal():
     pass
 
 
+class EpochEndSignal():
+    def __init__(self, epoch, num_tasks):
+        self.epoch = epoch
+        self.num_tasks = num_tasks
+
+
+class ErrorSignal():
+    def __init__(self, message):
+        self.message = message
+
+
 def is_pic(img_name):
     valid_suffix = ['JPEG', 'jpeg', 'JPG', 'jpg', 'BMP', 'bmp', 'PNG', 'png']
     suffix = img_name.split('.')[-1]
@@ -59,44 +74,145 @@ def get_encoding(path):
     return file_encoding
 
 
+def copy_record(record):
+    """复制单个样本的标注信息，供数据处理算子原地修改而不影响数据集中保存的原始记录。
+
+    与`copy.deepcopy`不同，np.ndarray直接调用`copy()`，仅对list等可变容器做深拷贝，
+    复制的开销只与该样本的标注数量相关。
+
+    Args:
+        record (dict|np.ndarray|None): 样本的im_info、label_info或标注图。
+
+    Returns:
+        dict|np.ndarray|None: 复制后的记录。
+    """
+    if isinstance(record, np.ndarray):
+        return record.copy()
+    if not isinstance(record, dict):
+        return copy.deepcopy(record)
+    new_record = dict()
+    for k, v in record.items():
+        if isinstance(v, np.ndarray):
+            new_record[k] = v.copy()
+        elif isinstance(v, (list, dict)):
+            new_record[k] = copy.deepcopy(v)
+        else:
+            new_record[k] = v
+    return new_record
+
+
+def parallel_map(func, args_list, num_workers=1):
+    """使用进程池并行解析标注，结果顺序与`args_list`的顺序保持一致。
+
+    `args_list`会被切分为若干分片依次分发给各个进程，各分片的结果按原顺序合并，
+    因此调用方在主进程中按顺序分配图像id、标注id时，可得到与串行解析完全相同的结果。
+
+    Args:
+        func (callable): 模块级的解析函数，需可被pickle。
+        args_list (list): 每个元素为传入`func`的参数元组。
+        num_workers (int): 解析的进程数。小于等于1时在当前进程中串行解析。默认为1。
+
+    Returns:
+        list: `func`在每组参数上的返回值。
+    """
+    if num_workers > 1 and (platform.platform().startswith("Windows") or
+                            platform.platform().startswith("Darwin")):
+        logging.debug(
+            "Parallel annotation parsing is not supported in Windows and Mac platform, force to parse serially."
+        )
+        num_workers = 1
+    num_workers = min(num_workers, len(args_list))
+    if num_workers <= 1:
+        return [func(*args) for args in args_list]
+    chunksize = max(1, len(args_list) // (num_workers * 4))
+    pool = multiprocessing.Pool(num_workers)
+    try:
+        results = pool.starmap(func, args_list, chunksize=chunksize)
+    finally:
+        pool.close()
+        pool.join()
+    return results
+
+
+def reorder(results, window=None):
+    """将(样本序号, 处理结果)按样本序号重新排列后依次返回处理结果。
+
+    尚未轮到的结果暂存在缓冲区中；每按序返回（或跳过无效的）一个样本就释放一次`window`，
+    由生产端在发送样本前获取`window`，从而将缓冲区中的样本数限制在`window`的初始值以内。
+
+    Args:
+        results (iterable): (样本序号, 处理结果)的迭代器，处理结果为None表示该样本无效。
+        window (threading.Semaphore): 限制缓冲区大小的信号量。默认为None。
+    """
+    pending = dict()
+    next_seq = 0
+    for seq, result in results:
+        pending[seq] = result
+        while next_seq in pending:
+            result = pending.pop(next_seq)
+            next_seq += 1
+            if window is not None:
+                window.release()
+            if result is not None:
+                yield result
+
+
+def unordered(results, window=None):
+    """按到达的先后顺序依次返回(样本序号, 处理结果)中有效的处理结果，每返回一个释放一次`window`。
+    """
+    for _, result in results:
+        if window is not None:
+            window.release()
+        if result is not None:
+            yield result
+
+
 def multithread_reader(mapper,
                        reader,
                        num_workers=4,
                        buffer_size=1024,
                        batch_size=8,
-                       drop_last=True):
+                       drop_last=True,
+                       ordered=False,
+                       reorder_buffer_size=None):
     from queue import Queue
     end = EndSignal()
+    if reorder_buffer_size is None:
+        reorder_buffer_size = buffer_size
+    profiler = getattr(mapper, 'profiler', None)
 
     # define a worker to read samples from reader to in_queue
-    def read_worker(reader, in_queue):
-        for i in reader():
-            in_queue.put(i)
+    def read_worker(reader, in_queue, window):
+        for i, sample in enumerate(reader()):
+            if window is not None:
+                window.acquire()
+            in_queue.put((i, sample))
         in_queue.put(end)
 
     # define a worker to handle samples from in_queue by mapper
     # and put mapped samples into out_queue
     def handle_worker(in_queue, out_queue, mapper):
-        sample = in_queue.get()
-        while not isinstance(sample, EndSignal):
-            if len(sample) == 2:
-                r = mapper(sample[0], sample[1])
-            elif len(sample) == 3:
-                r = mapper(sample[0], sample[1], sample[2])
+        task = in_queue.get()
+        while not isinstance(task, EndSignal):
+            seq, sample = task
+            r = map_sample(mapper, sample)
+            result = (seq, r if is_valid(r) else None)
+            if profiler is None:
+                out_queue.put(result)
             else:
-                raise Exception('The sample\'s length must be 2 or 3.')
-            if is_valid(r):
-                out_queue.put(r)
-            sample = in_queue.get()
+                # 结果队列已满，即训练进程取数据慢于数据处理时阻塞
+                profiler.timed_put(out_queue.put, result)
+            task = in_queue.get()
         in_queue.put(end)
         out_queue.put(end)
 
-    def xreader():
+    def batches():
         in_queue = Queue(buffer_size)
         out_queue = Queue(buffer_size)
+        window = Semaphore(reorder_buffer_size) if ordered else None
         # start a read worker in a thread
         target = read_worker
-        t = Thread(target=target, args=(reader, in_queue))
+        t = Thread(target=target, args=(reader, in_queue, window))
         t.daemon = True
         t.start()
         # start several handle_workers
@@ -110,99 +226,453 @@ def multithread_reader(mapper,
         for w in workers:
             w.start()
 
+        def results():
+            finish = 0
+            while finish < num_workers:
+                item = out_queue.get()
+                if isinstance(item, EndSignal):
+                    finish += 1
+                else:
+                    yield item
+
+        if ordered:
+            samples = reorder(results(), window)
+        else:
+            samples = unordered(results())
         batch_data = []
-        sample = out_queue.get()
-        while not isinstance(sample, EndSignal):
+        for sample in samples:
             batch_data.append(sample)
             if len(batch_data) == batch_size:
                 batch_data = generate_minibatch(batch_data, mapper=mapper)
                 yield batch_data
                 batch_data = []
-            sample = out_queue.get()
-        finish = 1
-        while finish < num_workers:
-            sample = out_queue.get()
-            if isinstance(sample, EndSignal):
-                finish += 1
-            else:
-                batch_data.append(sample)
-                if len(batch_data) == batch_size:
-                    batch_data = generate_minibatch(batch_data, mapper=mapper)
-                    yield batch_data
-                    batch_data = []
         if not drop_last and len(batch_data) != 0:
             batch_data = generate_minibatch(batch_data, mapper=mapper)
             yield batch_data
             batch_data = []
 
+    def xreader():
+        if profiler is None:
+            return batches()
+        # 统计训练进程等待数据的时间
+        return profiler.timed_batches(batches())
+
     return xreader
 
 
+def map_sample(mapper, sample):
+    if sample is None:
+        raise ValueError("sample has None")
+    if len(sample) == 2:
+        return mapper(sample[0], sample[1])
+    elif len(sample) == 3:
+        return mapper(sample[0], sample[1], sample[2])
+    else:
+        raise Exception('The sample\'s length must be 2 or 3.')
+
+
+def collate_in_worker(mapper, samples, mem_mgr):
+    """在数据处理进程中对一组处理后的样本执行batch_transforms并补齐，
+    补齐后的图像直接写入新申请的共享内存。
+    """
+    from .shared_queue import SharedBatch, SharedBatchAllocator
+    alloc = SharedBatchAllocator(mem_mgr)
+    try:
+        batch_data = generate_minibatch(samples, mapper=mapper, alloc=alloc)
+        batch = SharedBatch(mem_mgr, batch_data, alloc.buffer)
+    except Exception:
+        alloc.free()
+        raise
+    return batch
+
+
+def _worker_loop(mapper, task_queue, result_queue, mem_mgr, seed):
+    from .shared_queue import SharedSample
+    # 各进程使用不同的随机种子，避免所有进程产生完全相同的数据增强序列
+    np.random.seed(seed)
+    random.seed(seed)
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        epoch, seq, samples, seeds, collate = task
+        try:
+            results = list()
+            for i, sample in enumerate(samples):
+                if seeds is not None:
+                    np.random.seed(seeds[i])
+                    random.seed(seeds[i])
+                r = map_sample(mapper, sample)
+                if is_valid(r):
+                    results.append(r)
+            if len(results) == 0:
+                result = None
+            elif collate:
+                result = collate_in_worker(mapper, results, mem_mgr)
+            else:
+                # 样本中的数组直接写入共享内存，避免pickle序列化整张图像
+                result = SharedSample(mem_mgr, results[0])
+        except Exception:
+            result = ErrorSignal(traceback.format_exc())
+        profiler = getattr(mapper, 'profiler', None)
+        if profiler is None:
+            result_queue.put((epoch, seq, result))
+        else:
+            # 结果队列已满，即训练进程取数据慢于数据处理时阻塞
+            profiler.timed_put(result_queue.put, (epoch, seq, result))
+
+
+def _shutdown_workers(workers, task_queue):
+    from queue import Empty, Full
+    while True:
+        try:
+            task_queue.get_nowait()
+        except Empty:
+            break
+    for _ in workers:
+        try:
+            task_queue.put(None, timeout=1)
+        except Full:
+            break
+    for w in workers:
+        w.join(timeout=1)
+        if w.is_alive():
+            w.terminate()
+
+
+def mapper_signature(mapper):
+    # 进程池中的进程持有fork时mapper的副本，之后在主进程中对以下内容的修改进程内不可见，
+    # 发生变化时需重建进程池
+    ops = getattr(mapper, 'transforms', None) or []
+    batch_transforms = getattr(mapper, 'batch_transforms', None)
+    # 解码图像缓存需在进程创建前设置，缓存变化时同样需要重建进程池
+    cache = getattr(mapper, 'image_cache', None)
+    profiler = getattr(mapper, 'profiler', None)
+    mixup_buffer = getattr(mapper, 'mixup_buffer', None)
+    return (id(mapper), tuple(id(op) for op in ops), id(batch_transforms),
+            tuple(id(op) for op in batch_transforms or []), id(cache),
+            id(profiler), getattr(mapper, 'fused', None),
+            getattr(mapper, 'reduced_decode', None), id(mixup_buffer))
+
+
+class WorkerPool(object):
+    """常驻的数据处理进程池，在多个epoch及多次评估之间复用，避免每个epoch重新创建进程。
+
+    主进程通过有界的任务队列向进程池依次发送样本，队列满时发送端阻塞；处理结果经由共享内存
+    队列返回，同样受`buffer_size`限制。每个样本附带epoch序号和样本序号，提前中断的epoch
+    遗留的结果会被丢弃，不会混入下一个epoch。
+
+    处理结果以`SharedSample`的形式返回，其中的数组以原始字节保存在共享内存中；
+    主进程组batch时将其补齐后写入`batch_ring`中预先申请的共享内存batch缓冲区。
+
+    Args:
+        mapper (callable): 样本处理函数，即数据集的transforms。
+        num_workers (int): 进程数。默认为4。
+        buffer_size (int): 任务队列和结果队列的长度。默认为1024。
+        memsize (int): 结果队列使用的共享内存大小（字节）。默认为3GB。
+    """
+
+    def __init__(self,
+                 mapper,
+                 num_workers=4,
+                 buffer_size=1024,
+                 memsize=3 * 1024**3):
+        from .shared_queue import SharedQueue, SharedMemoryMgr
+        self.mapper = mapper
+        self.num_workers = num_workers
+        self.buffer_size = buffer_size
+        self.signature = mapper_signature(mapper)
+        self._epoch = 0
+        self._task_queue = multiprocessing.Queue(buffer_size)
+        self._mem_mgr = SharedMemoryMgr(capacity=memsize)
+        self._result_queue = SharedQueue(buffer_size, mem_mgr=self._mem_mgr)
+        self._batch_ring = None
+        self._retained = collections.deque()
+        self._base_seed = int(np.random.randint(0, 2**31 - 1))
+        seeds = np.random.randint(0, 2**31 - 1, size=num_workers)
+        self._workers = list()
+        for i in range(num_workers):
+            p = multiprocessing.Process(
+                target=_worker_loop,
+                args=(mapper, self._task_queue, self._result_queue,
+                      self._mem_mgr, int(seeds[i])))
+            p.daemon = True
+            p.start()
+            self._workers.append(p)
+        self._finalizer = weakref.finalize(self, _shutdown_workers,
+                                           self._workers, self._task_queue)
+
+    def _put(self, task, stop_event, window):
+        from queue import Full
+        if window is not None:
+            while not window.acquire(timeout=0.1):
+                if stop_event.is_set():
+                    return False
+        while not stop_event.is_set():
+            try:
+                self._task_queue.put(task, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _put_result(self, item, stop_event):
+        # 与_put相同，消费方提前停止时放弃写入，避免阻塞在已满的结果队列上
+        from queue import Full
+        while not stop_event.is_set():
+            if self._result_queue.full():
+                stop_event.wait(0.1)
+                continue
+            try:
+                self._result_queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def _feed(self, reader, epoch, stop_event, window, batch_size,
+              drop_last):
+        num_tasks = 0
+        num_samples = 0
+        samples = list()
+        seeds = list()
+        try:
+            for sample in reader():
+                samples.append(sample)
+                # 每个样本使用由epoch和样本序号确定的随机种子，
+                # 数据增强的结果与样本被分配到哪个进程无关
+                seeds.append((self._base_seed + epoch * 1000003 + num_samples)
+                             % (2**32))
+                num_samples += 1
+                if len(samples) < batch_size:
+                    continue
+                task = (epoch, num_tasks, samples, seeds, batch_size > 1)
+                if not self._put(task, stop_event, window):
+                    return
+                num_tasks += 1
+                samples = list()
+                seeds = list()
+            if len(samples) > 0 and not drop_last:
+                task = (epoch, num_tasks, samples, seeds, batch_size > 1)
+                if not self._put(task, stop_event, window):
+                    return
+                num_tasks += 1
+            self._put_result(EpochEndSignal(epoch, num_tasks), stop_event)
+        except Exception:
+            self._put_result(
+                (epoch, num_tasks, ErrorSignal(traceback.format_exc())),
+                stop_event)
+
+    def imap(self, reader, window=None, batch_size=1, drop_last=True):
+        """处理`reader`产生的一个epoch的样本，按完成的先后顺序返回(样本序号, 处理结果)。
+
+        `batch_size`为1时处理结果为`SharedSample`；大于1时每`batch_size`个样本在同一个进程中
+        组成batch并执行batch_transforms和补齐，处理结果为`SharedBatch`，序号为batch的序号。
+        处理结果为None表示该样本（或batch中的全部样本）无效。
+
+        Args:
+            reader (callable): 调用后返回样本迭代器的函数，如数据集的`iterator`。
+            window (threading.Semaphore): 限制未取走任务数的信号量，每发送一个任务前获取一次，
+                由`reorder`或`unordered`释放。默认为None，即不限制。
+            batch_size (int): 每个任务包含的样本数。默认为1。
+            drop_last (bool): 是否丢弃最后不足`batch_size`个样本的任务。默认为True。
+        """
+        self._epoch += 1
+        epoch = self._epoch
+        stop_event = Event()
+        feeder = Thread(
+            target=self._feed,
+            args=(reader, epoch, stop_event, window, batch_size, drop_last))
+        feeder.daemon = True
+        feeder.start()
+        num_expected = None
+        num_received = 0
+        try:
+            while num_expected is None or num_received < num_expected:
+                item = self._result_queue.get()
+                if isinstance(item, EpochEndSignal):
+                    if item.epoch == epoch:
+                        num_expected = item.num_tasks
+                    continue
+                item_epoch, seq, result = item
+                if item_epoch != epoch:
+                    continue
+                if isinstance(result, ErrorSignal):
+                    raise ValueError(
+                        "multiprocess reader raises an exception:\n{}".format(
+                            result.message))
+                num_received += 1
+                yield seq, result
+        finally:
+            stop_event.set()
+            feeder.join()
+            self._drain_tasks(epoch)
+
+    def _drain_tasks(self, epoch):
+        # 提前中断的epoch尚未被进程取走的任务直接丢弃，不再占用进程处理
+        from queue import Empty
+        while True:
+            try:
+                task = self._task_queue.get_nowait()
+            except Empty:
+                break
+            if task is None or task[0] != epoch:
+                # 不属于该epoch的任务（正常情况下不会出现）放回队列
+                self._task_queue.put(task)
+                break
+
+    def batch_ring(self, size):
+        """获取由`size`块共享内存batch缓冲区组成的环形缓冲，数量变化时重新创建。
+        """
+        from .shared_queue import BatchBufferRing
+        if self._batch_ring is not None and self._batch_ring.size() != size:
+            self._batch_ring.release()
+            self._batch_ring = None
+        if self._batch_ring is None:
+            self._batch_ring = BatchBufferRing(self._mem_mgr, size)
+        return self._batch_ring
+
+    def retain(self, batch, max_num):
+        """持有最近产出的`max_num`个`SharedBatch`，更早的归还其共享内存。
+        """
+        self._retained.append(batch)
+        while len(self._retained) > max_num:
+            self._retained.popleft().free()
+
+    def close(self):
+        """通知所有进程退出并等待其结束。
+        """
+        self._finalizer()
+        if self._batch_ring is not None:
+            self._batch_ring.release()
+            self._batch_ring = None
+        while len(self._retained) > 0:
+            self._retained.popleft().free()
+
+
+def get_worker_pool(owner, mapper, num_workers, buffer_size):
+    """获取`owner`上缓存的进程池；数据处理算子或进程数发生变化时重新创建。
+    """
+    pool = getattr(owner, '_worker_pool', None)
+    if pool is not None:
+        if pool.signature == mapper_signature(
+                mapper) and pool.num_workers == num_workers:
+            return pool
+        pool.close()
+    pool = WorkerPool(mapper, num_workers=num_workers, buffer_size=buffer_size)
+    owner._worker_pool = pool
+    return pool
+
+
+class _PoolHolder(object):
+    pass
+
+
 def multiprocess_reader(mapper,
                         reader,
                         num_workers=4,
                         buffer_size=1024,
                         batch_size=8,
-                        drop_last=True):
-    from .shared_queue import SharedQueue as Queue
+                        drop_last=True,
+                        pool_owner=None,
+                        ordered=False,
+                        reorder_buffer_size=None,
+                        num_batch_buffers=4,
+                        batch_in_workers=False):
+    """基于常驻进程池的多进程reader。
 
-    def _read_into_queue(samples, mapper, queue):
-        end = EndSignal()
-        try:
-            for sample in samples:
-                if sample is None:
-                    raise ValueError("sample has None")
-                if len(sample) == 2:
-                    result = mapper(sample[0], sample[1])
-                elif len(sample) == 3:
-                    result = mapper(sample[0], sample[1], sample[2])
-                else:
-                    raise Exception('The sample\'s length must be 2 or 3.')
-                if is_valid(result):
-                    queue.put(result)
-            queue.put(end)
-        except:
-            queue.put("")
-            six.reraise(*sys.exc_info())
+    进程池在第一次读取时创建并缓存在`pool_owner`上（未指定时缓存在返回的reader中），
+    之后的epoch直接复用，只向其发送样本记录。`ordered`为True时按`reader`的顺序输出样本，
+    乱序到达的结果最多缓存`reorder_buffer_size`个（默认与`buffer_size`相同）。
 
-    def queue_reader():
-        queue = Queue(buffer_size, memsize=3 * 1024**3)
-        total_samples = [[] for i in range(num_workers)]
-        for i, sample in enumerate(reader()):
-            index = i % num_workers
-            total_samples[index].append(sample)
-        for i in range(num_workers):
-            p = multiprocessing.Process(
-                target=_read_into_queue,
-                args=(total_samples[i], mapper, queue))
-            p.start()
+    batch中的图像（及分割标注）补齐后直接写入`num_batch_buffers`块循环使用的共享内存
+    缓冲区，返回的是缓冲区上的视图，在其后第`num_batch_buffers`个batch产出前有效；
+    需要长期持有batch数据时应自行拷贝。`num_batch_buffers`为0时每个batch使用新申请的内存。
 
-        finish_num = 0
-        batch_data = list()
-        while finish_num < num_workers:
-            sample = queue.get()
-            if isinstance(sample, EndSignal):
-                finish_num += 1
-            elif sample == "":
-                raise ValueError("multiprocess reader raises an exception")
+    `batch_in_workers`为True时，每`batch_size`个连续样本作为一个任务发送给同一个进程，
+    batch_transforms及补齐均在该进程中完成，主进程只接收组好的batch；
+    此时batch中的无效样本被直接丢弃，相应batch的样本数会少于`batch_size`。
+    """
+    if pool_owner is None:
+        pool_owner = _PoolHolder()
+    if reorder_buffer_size is None:
+        reorder_buffer_size = buffer_size
+
+    def batch_reader(pool):
+        # 队列中的元素为整个batch，按batch数限制缓冲区大小，无序模式下同样限制，
+        # 避免大量batch占满共享内存
+        window_size = reorder_buffer_size if ordered else buffer_size
+        window = Semaphore(max(window_size // batch_size, 1))
+        results = pool.imap(reader, window, batch_size, drop_last)
+        if ordered:
+            batches = reorder(results, window)
+        else:
+            batches = unordered(results, window)
+        for batch in batches:
+            if num_batch_buffers > 0:
+                # 只有补齐后的图像（及分割标注）使用复用的缓冲区，gt_box、im_id等字段可能被
+                # 调用方（如评估）长期保留，需拷贝出来
+                batch_data = batch.samples(copy_unpacked=True)
+                pool.retain(batch, num_batch_buffers)
             else:
-                batch_data.append(sample)
-                if len(batch_data) == batch_size:
-                    batch_data = generate_minibatch(batch_data, mapper=mapper)
-                    yield batch_data
-                    batch_data = []
+                batch_data = batch.samples(copy=True)
+                batch.free()
+            yield batch_data
+
+    def batches():
+        pool = get_worker_pool(pool_owner, mapper, num_workers, buffer_size)
+        if batch_in_workers and batch_size > 1:
+            for batch_data in batch_reader(pool):
+                yield batch_data
+            return
+        window = Semaphore(reorder_buffer_size) if ordered else None
+        alloc = None
+        if num_batch_buffers > 0:
+            alloc = pool.batch_ring(num_batch_buffers).alloc
+        results = pool.imap(reader, window)
+        if ordered:
+            samples = reorder(results, window)
+        else:
+            samples = unordered(results)
+        batch_data = list()
+        for sample in samples:
+            batch_data.append(sample)
+            if len(batch_data) == batch_size:
+                batch_data = assemble_minibatch(
+                    batch_data, mapper=mapper, alloc=alloc)
+                yield batch_data
+                batch_data = []
         if len(batch_data) != 0 and not drop_last:
-            batch_data = generate_minibatch(batch_data, mapper=mapper)
+            batch_data = assemble_minibatch(
+                batch_data, mapper=mapper, alloc=alloc)
             yield batch_data
             batch_data = []
 
+    def queue_reader():
+        profiler = getattr(mapper, 'profiler', None)
+        if profiler is None:
+            return batches()
+        # 统计训练进程等待数据的时间
+        return profiler.timed_batches(batches())
+
     return queue_reader
 
 
-def generate_minibatch(batch_data, label_padding_value=255, mapper=None):
+def generate_minibatch(batch_data,
+                       label_padding_value=255,
+                       mapper=None,
+                       alloc=None):
     if mapper is not None and mapper.batch_transforms is not None:
         for op in mapper.batch_transforms:
             batch_data = op(batch_data)
+    profiler = getattr(mapper, 'profiler', None)
+    if profiler is not None:
+        shapes = np.array([data[0].shape[1:3] for data in batch_data])
+        profiler.record_padding(
+            int(np.prod(shapes, axis=1).sum()),
+            len(shapes) * int(np.prod(shapes.max(axis=0))))
+    if alloc is not None:
+        return pack_minibatch(batch_data, alloc, label_padding_value)
     # if batch_size is 1, do not pad the image
     if len(batch_data) == 1:
         return batch_data
@@ -253,6 +723,179 @@ def generate_minibatch(batch_data, label_padding_value=255, mapper=None):
     return padding_batch
 
 
+def _alloc_arrays(specs):
+    return [np.empty(shape, dtype=dtype) for shape, dtype in specs]
+
+
+def _copy_padded(dst, src, padding_value):
+    _, h, w = src.shape
+    dst[:, :h, :w] = src
+    dst[:, h:, :] = padding_value
+    dst[:, :h, w:] = padding_value
+
+
+def pack_minibatch(batch_data, alloc, label_padding_value=255):
+    """将batch中的图像（及分割训练时的标注）补齐后写入`alloc`申请的连续缓冲区。
+
+    返回结果与`generate_minibatch`相同，区别在于各样本的图像总是形状为(N, C, H, W)的
+    同一块缓冲区的切片，不需要补齐时也会写入该缓冲区。
+
+    Args:
+        batch_data (list): 经batch_transforms处理后的batch数据。
+        alloc (callable): 缓冲区申请函数，输入为[(shape, dtype), ...]，返回对应的np.ndarray列表。
+        label_padding_value (int): 分割标注的补齐值。默认为255。
+
+    Returns:
+        list: 补齐后的batch数据。
+    """
+    shapes = [data[0].shape for data in batch_data]
+    need_padding = len(batch_data) > 1 and len(
+        set(shape[1:] for shape in shapes)) > 1
+    max_shape = tuple(np.array(shapes).max(axis=0))
+    num = len(batch_data)
+    first = batch_data[0]
+    with_label = len(first) > 1 and isinstance(
+        first[1], np.ndarray) and first[1].ndim == 3
+    if need_padding:
+        specs = [((num, ) + max_shape, np.float32)]
+        if with_label:
+            specs.append(((num, 1) + max_shape[1:], np.int64))
+    else:
+        specs = [((num, ) + first[0].shape, first[0].dtype)]
+        if with_label:
+            specs.append(((num, ) + first[1].shape, first[1].dtype))
+    buffers = alloc(specs)
+    images = buffers[0]
+    labels = buffers[1] if with_label else None
+    padding_batch = []
+    for i, data in enumerate(batch_data):
+        _copy_padded(images[i], data[0], 0)
+        fields = (images[i], ) + tuple(data[1:])
+        if labels is not None:
+            _copy_padded(labels[i], data[1], label_padding_value)
+            fields = (images[i], labels[i]) + tuple(data[2:])
+            if need_padding:
+                fields = fields[:2]
+        elif need_padding and len(data) > 1 and isinstance(data[1],
+                                                           (list, tuple)):
+            # 与generate_minibatch一致，在分割评估/预测的`im_info`中记录补齐前的大小
+            _, im_h, im_w = data[0].shape
+            if len(data[1]) == 0 or 'padding' not in [
+                    data[1][j][0] for j in range(len(data[1]))
+            ]:
+                data[1].append(('padding', [im_h, im_w]))
+        padding_batch.append(fields)
+    return padding_batch
+
+
+def pack_images(batch_data, alloc):
+    """预测时将batch中的图像补齐后直接写入`alloc`申请的缓冲区，省去补齐及`np.array`组batch的两次拷贝。
+
+    Args:
+        batch_data (list): 经transforms处理后的batch数据。
+        alloc (callable): 缓冲区申请函数，参见`pack_minibatch`。
+
+    Returns:
+        tuple: (padding_batch, im)，补齐后的batch数据及形状为(N, C, H, W)的图像数组。
+    """
+    buffers = list()
+
+    def record(specs):
+        arrays = alloc(specs)
+        buffers.extend(arrays)
+        return arrays
+
+    padding_batch = pack_minibatch(batch_data, record)
+    return padding_batch, buffers[0]
+
+
+def assemble_minibatch(samples, label_padding_value=255, mapper=None,
+                       alloc=None):
+    """由进程池返回的`SharedSample`组成batch。
+
+    图像及分割标注直接从共享内存补齐写入batch缓冲区，其余数组拷贝后即归还样本占用的共享内存。
+
+    Args:
+        samples (list): `SharedSample`组成的列表。
+        label_padding_value (int): 分割标注的补齐值。默认为255。
+        mapper (callable): 数据集的transforms，用于执行其中的batch_transforms。默认为None。
+        alloc (callable): batch缓冲区申请函数，参见`pack_minibatch`。默认为None，即使用新申请的内存。
+
+    Returns:
+        list: 补齐后的batch数据。
+    """
+    try:
+        batch_data = list()
+        for sample in samples:
+            fields = list(sample.fields())
+            for i in range(1, len(fields)):
+                if not isinstance(fields[i], np.ndarray):
+                    continue
+                if i == 1 and fields[i].ndim == 3:
+                    continue
+                fields[i] = fields[i].copy()
+            batch_data.append(tuple(fields))
+        return generate_minibatch(
+            batch_data,
+            label_padding_value=label_padding_value,
+            mapper=mapper,
+            alloc=alloc if alloc is not None else _alloc_arrays)
+    finally:
+        for sample in samples:
+            sample.free()
+
+
+def read_image_shape(im_file):
+    """只读取文件头获取图像的(h, w)。
+
+    Args:
+        im_file (str|RecordImage|np.ndarray): 图像文件路径、打包数据集中的图像数据或已解码的图像。
+
+    Returns:
+        tuple: 图像的(h, w)；读取失败时返回None。
+    """
+    if isinstance(im_file, np.ndarray):
+        return im_file.shape[:2]
+    from paddlex.cv.transforms.image_cache import jpeg_shape
+    shape = jpeg_shape(im_file)
+    if shape is not None:
+        return shape
+    import io
+    from PIL import Image
+    try:
+        if isinstance(im_file, str):
+            f = open(im_file, 'rb')
+        else:
+            f = io.BytesIO(bytes(im_file))
+        with f:
+            w, h = Image.open(f).size
+    except Exception:
+        return None
+    return h, w
+
+
+def padding_ratio(shapes, batches):
+    """估计各batch补齐到最大高、宽后，补齐部分占batch总像素的比例。
+
+    图像均按短边缩放到相同大小估计（与ResizeByShort等保持宽高比的缩放一致）。
+
+    Args:
+        shapes (np.ndarray): 各样本原图的(h, w)，形状为(n, 2)。
+        batches (list): 各batch的样本索引列表。
+
+    Returns:
+        float: 补齐部分占全部batch像素的比例。
+    """
+    scaled = shapes / shapes.min(axis=1, keepdims=True)
+    valid = 0.
+    total = 0.
+    for batch in batches:
+        batch_shapes = scaled[batch]
+        valid += np.prod(batch_shapes, axis=1).sum()
+        total += len(batch) * np.prod(batch_shapes.max(axis=0))
+    return 1. - valid / total if total > 0 else 0.
+
+
 class Dataset:
     def __init__(self,
                  transforms=None,
@@ -273,10 +916,19 @@ class Dataset:
         self.buffer_size = buffer_size
         self.parallel_method = parallel_method
         self.shuffle = shuffle
+        self.ordered = False
+        self.reorder_buffer_size = None
+        self.batch_in_workers = False
+        self.num_buckets = None
+        self.bucket_shuffle = True
 
     def generator(self, batch_size=1, drop_last=True):
         self.batch_size = batch_size
         parallel_reader = multithread_reader
+        # 分桶时按顺序输出，避免多线程/多进程读取打乱batch的组成
+        ordered = self.ordered or bool(self.num_buckets and batch_size > 1)
+        kwargs = dict(
+            ordered=ordered, reorder_buffer_size=self.reorder_buffer_size)
         if self.parallel_method == "process":
             if platform.platform().startswith("Windows"):
                 logging.debug(
@@ -284,13 +936,158 @@ class Dataset:
                 )
             else:
                 parallel_reader = multiprocess_reader
+                # 进程池缓存在数据集上，训练的各个epoch及多次评估共用同一组进程
+                kwargs['pool_owner'] = self
+                kwargs['batch_in_workers'] = self.batch_in_workers
         return parallel_reader(
             self.transforms,
             self.iterator,
             num_workers=self.num_workers,
             buffer_size=self.buffer_size,
             batch_size=batch_size,
-            drop_last=drop_last)
+            drop_last=drop_last,
+            **kwargs)
+
+    def epoch_indices(self):
+        """生成当前epoch的样本索引序列。
+
+        仅对索引进行打乱，不复制`file_list`；在相同随机种子下，得到的样本顺序与
+        直接对`file_list`调用`random.shuffle`一致。
+
+        Returns:
+            list: 当前epoch依次读取的样本在`file_list`中的索引。
+        """
+        indices = list(range(len(self.file_list)))
+        if self.shuffle:
+            random.shuffle(indices)
+        indices = indices[:self.num_samples]
+        self.num_samples = len(indices)
+        return self.bucket_indices(indices)
+
+    def image_shapes(self):
+        """返回数据集中各样本原图的(h, w)，结果会被缓存。
+
+        检测数据集直接使用标注中的图像大小，其余数据集只读取图像文件头；无法获取时记为(1, 1)。
+
+        Returns:
+            np.ndarray: 形状为(n, 2)，与`file_list`一一对应。
+        """
+        if getattr(self, '_image_shapes', None) is not None and len(
+                self._image_shapes) == len(self.file_list):
+            return self._image_shapes
+        shapes = np.ones((len(self.file_list), 2), dtype='float64')
+        for i, sample in enumerate(self.file_list):
+            shape = None
+            if len(sample) > 1 and isinstance(
+                    sample[1], (list, tuple)) and len(sample[1]) > 0 and \
+                    isinstance(sample[1][0], dict):
+                shape = sample[1][0].get('image_shape')
+            if shape is None or np.min(shape) <= 0:
+                shape = read_image_shape(sample[0])
+            if shape is not None and np.min(shape) > 0:
+                shapes[i] = shape[:2]
+        self._image_shapes = shapes
+        return shapes
+
+    def bucket_indices(self, indices):
+        """按宽高比分桶重排一个epoch的样本索引，使同一batch内的样本形状相近。
+
+        各桶内的样本依次组成batch，各桶剩余的不足一个batch的样本按宽高比排序后组成batch，
+        打乱时再打乱完整batch的顺序，不完整的batch始终位于最后。未开启分桶时直接返回`indices`。
+
+        Args:
+            indices (list): 当前epoch依次读取的样本索引。
+
+        Returns:
+            list: 重排后的样本索引。
+        """
+        batch_size = getattr(self, 'batch_size', 1)
+        if not self.num_buckets or batch_size <= 1 or len(indices) == 0:
+            return indices
+        shapes = self.image_shapes()
+        ratios = np.log(shapes[:, 1] / shapes[:, 0])
+        edges = np.quantile(ratios,
+                            np.linspace(0, 1, self.num_buckets + 1)[1:-1])
+        indices = np.asarray(indices)
+        buckets = np.searchsorted(edges, ratios[indices], side='right')
+        batches = list()
+        rest = list()
+        for b in range(self.num_buckets):
+            members = indices[buckets == b]
+            if not self.bucket_shuffle:
+                members = members[np.argsort(
+                    ratios[members], kind='stable')]
+            num_full = len(members) // batch_size * batch_size
+            batches.extend(
+                members[i:i + batch_size].tolist()
+                for i in range(0, num_full, batch_size))
+            rest.extend(members[num_full:].tolist())
+        rest = np.asarray(rest, dtype='int64')
+        rest = rest[np.argsort(ratios[rest], kind='stable')].tolist()
+        batches.extend(rest[i:i + batch_size]
+                       for i in range(0, len(rest), batch_size))
+        last = list()
+        if len(batches[-1]) < batch_size:
+            last = batches.pop()
+        if self.shuffle:
+            random.shuffle(batches)
+        if not getattr(self, '_bucket_logged', False):
+            self._bucket_logged = True
+            shuffled = np.random.RandomState(0).permutation(indices)
+            before = padding_ratio(shapes, [
+                shuffled[i:i + batch_size]
+                for i in range(0, len(shuffled), batch_size)
+            ])
+            after = padding_ratio(shapes, batches + [last] if last else batches)
+            logging.info(
+                "Bucketing samples into {} buckets by aspect ratio, estimated "
+                "padding {:.1f}% -> {:.1f}% of batch pixels.".format(
+                    self.num_buckets, before * 100, after * 100))
+        return [i for batch in batches for i in batch] + last
+
+    def set_bucketing(self, num_buckets=2, shuffle=True):
+        """设置是否按宽高比分桶组batch，减少batch内补齐的像素。
+
+        ResizeByShort、ResizeStepScaling等保持宽高比的缩放后，batch内图像的形状由原图宽高比
+        决定，横竖图混合的batch会有大量像素用于补齐。开启后按原图宽高比的分位数将样本分为
+        `num_buckets`个桶，每个batch尽量只包含同一个桶的样本，并在首次使用时打印估计的补齐比例；
+        开启性能统计（transforms的set_profile）后，实际的补齐比例也会在统计报表中给出。
+        开启分桶后多线程/多进程读取会自动按顺序输出样本（与`set_ordered`相同），batch的组成与
+        分桶结果完全一致。
+
+        Args:
+            num_buckets (int): 分桶的数量，为0或None时关闭分桶。默认为2。
+            shuffle (bool): 桶内是否保持随机顺序；为False时桶内按宽高比排序，补齐最少，
+                但每个epoch的batch组成相同。默认为True。
+        """
+        self.num_buckets = num_buckets
+        self.bucket_shuffle = shuffle
+
+    def set_ordered(self, ordered=True, buffer_size=None):
+        """设置多线程/多进程读取时是否按数据集迭代的顺序输出样本。
+
+        有序模式下各batch的样本组成与串行读取完全一致；多进程读取时每个样本还会使用由epoch和
+        样本序号确定的随机种子，数据增强结果不受进程调度的影响。
+
+        Args:
+            ordered (bool): 是否按顺序输出样本。默认为True。
+            buffer_size (int): 等待重排的样本缓冲区大小，以样本数为单位；越大越能容忍单个样本
+                处理耗时的波动。默认为None，即与数据集的`buffer_size`相同。
+        """
+        self.ordered = ordered
+        self.reorder_buffer_size = buffer_size
+
+    def set_batch_in_workers(self, batch_in_workers=True):
+        """设置多进程读取时是否在数据处理进程中组batch。
+
+        开启后连续的batch_size个样本由同一个进程处理，batch_transforms（如BatchRandomShape、
+        GenerateYoloTarget）及补齐也在该进程中完成，主进程只负责接收组好的batch，
+        适用于batch_transforms耗时较多的场景，如YOLOv3的训练。多线程读取时该设置无效。
+
+        Args:
+            batch_in_workers (bool): 是否在数据处理进程中组batch。默认为True。
+        """
+        self.batch_in_workers = batch_in_workers
 
     def set_num_samples(self, num_samples):
         if num_samples > len(self.file_list):
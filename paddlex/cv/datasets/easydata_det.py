@@ -24,6 +24,71 @@ from paddlex.utils import path_normalization
 from .voc import VOCDetection
 from .dataset import is_pic
 from .dataset import get_encoding
+from .dataset import parallel_map
+from .record_store import DetRecordStore
+
+
+def mask2polygon(mask):
+    contours, hierarchy = cv2.findContours(
+        (mask).astype(np.uint8), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    segmentation = []
+    for contour in contours:
+        contour_list = contour.flatten().tolist()
+        if len(contour_list) > 4:
+            segmentation.append(contour_list)
+    return segmentation
+
+
+def parse_easydata_det(img_file, json_file, cname2cid):
+    """解析单个EasyData格式的检测标注文件。
+
+    Args:
+        img_file (str): 图像文件路径，用于读取图像宽高。
+        json_file (str): json标注文件路径。
+        cname2cid (dict): 类别名称到类别id的映射。
+
+    Returns:
+        dict: 包含'im_w'、'im_h'、'gt_bbox'、'gt_class'、'gt_poly'以及'objects'的字典，
+            其中'objects'为每个标注框的(x1, y1, x2, y2, category_id, segmentation)，
+            用于生成COCO格式的标注。
+    """
+    from pycocotools.mask import decode
+    with open(json_file, mode='r', \
+              encoding=get_encoding(json_file)) as j:
+        json_info = json.load(j)
+    im = cv2.imread(img_file)
+    im_w = im.shape[1]
+    im_h = im.shape[0]
+    objs = json_info['labels']
+    gt_bbox = np.zeros((len(objs), 4), dtype=np.float32)
+    gt_class = np.zeros((len(objs), 1), dtype=np.int32)
+    gt_poly = [None] * len(objs)
+    objects = list()
+    for i, obj in enumerate(objs):
+        cname = obj['name']
+        gt_class[i][0] = cname2cid[cname]
+        x1 = max(0, obj['x1'])
+        y1 = max(0, obj['y1'])
+        x2 = min(im_w - 1, obj['x2'])
+        y2 = min(im_h - 1, obj['y2'])
+        gt_bbox[i] = [x1, y1, x2, y2]
+        if 'mask' in obj:
+            mask_dict = {}
+            mask_dict['size'] = [im_h, im_w]
+            mask_dict['counts'] = obj['mask'].encode()
+            mask = decode(mask_dict)
+            gt_poly[i] = mask2polygon(mask)
+        segmentation = [[x1, y1, x1, y2, x2, y2, x2, y1]] \
+            if gt_poly[i] is None else gt_poly[i]
+        objects.append((x1, y1, x2, y2, cname2cid[cname], segmentation))
+    return {
+        'im_w': im_w,
+        'im_h': im_h,
+        'gt_bbox': gt_bbox,
+        'gt_class': gt_class,
+        'gt_poly': gt_poly,
+        'objects': objects
+    }
 
 
 class EasyDataDet(VOCDetection):
@@ -41,6 +106,10 @@ class EasyDataDet(VOCDetection):
         parallel_method (str): 数据集中样本在预处理过程中并行处理的方式，支持'thread'
             线程和'process'进程两种方式。默认为'process'（Windows和Mac下会强制使用thread，该参数无效）。
         shuffle (bool): 是否需要对数据集中样本打乱顺序。默认为False。
+        num_parse_workers (int): 构建数据集时并行解析标注文件的进程数，解析结果与串行解析完全一致。
+            默认为1，即串行解析（Windows和Mac下会强制串行解析）。
+        compact_records (bool): 是否以列式numpy数组（`DetRecordStore`）保存全部样本的标注，可大幅降低
+            标注数量较多时的内存占用，且fork出的数据处理子进程可直接共享这部分内存。默认为False。
     """
 
     def __init__(self,
@@ -51,7 +120,9 @@ class EasyDataDet(VOCDetection):
                  num_workers='auto',
                  buffer_size=100,
                  parallel_method='process',
-                 shuffle=False):
+                 shuffle=False,
+                 num_parse_workers=1,
+                 compact_records=False):
         super(VOCDetection, self).__init__(
             transforms=transforms,
             num_workers=num_workers,
@@ -82,9 +153,7 @@ class EasyDataDet(VOCDetection):
                 'name': k
             })
 
-        from pycocotools.mask import decode
-        ct = 0
-        ann_ct = 0
+        samples = list()
         with open(file_list, encoding=get_encoding(file_list)) as f:
             for line in f:
                 img_file, json_file = [osp.join(data_dir, x) \
@@ -98,71 +167,55 @@ class EasyDataDet(VOCDetection):
                 if not osp.exists(img_file):
                     raise IOError('The image file {} is not exist!'.format(
                         img_file))
-                with open(json_file, mode='r', \
-                          encoding=get_encoding(json_file)) as j:
-                    json_info = json.load(j)
-                im_id = np.array([ct])
-                im = cv2.imread(img_file)
-                im_w = im.shape[1]
-                im_h = im.shape[0]
-                objs = json_info['labels']
-                gt_bbox = np.zeros((len(objs), 4), dtype=np.float32)
-                gt_class = np.zeros((len(objs), 1), dtype=np.int32)
-                gt_score = np.ones((len(objs), 1), dtype=np.float32)
-                is_crowd = np.zeros((len(objs), 1), dtype=np.int32)
-                difficult = np.zeros((len(objs), 1), dtype=np.int32)
-                gt_poly = [None] * len(objs)
-                for i, obj in enumerate(objs):
-                    cname = obj['name']
-                    gt_class[i][0] = cname2cid[cname]
-                    x1 = max(0, obj['x1'])
-                    y1 = max(0, obj['y1'])
-                    x2 = min(im_w - 1, obj['x2'])
-                    y2 = min(im_h - 1, obj['y2'])
-                    gt_bbox[i] = [x1, y1, x2, y2]
-                    is_crowd[i][0] = 0
-                    if 'mask' in obj:
-                        mask_dict = {}
-                        mask_dict['size'] = [im_h, im_w]
-                        mask_dict['counts'] = obj['mask'].encode()
-                        mask = decode(mask_dict)
-                        gt_poly[i] = self.mask2polygon(mask)
-                    annotations['annotations'].append({
-                        'iscrowd': 0,
-                        'image_id': int(im_id[0]),
-                        'bbox': [x1, y1, x2 - x1 + 1, y2 - y1 + 1],
-                        'area': float((x2 - x1 + 1) * (y2 - y1 + 1)),
-                        'segmentation': [[x1, y1, x1, y2, x2, y2, x2, y1]]
-                        if gt_poly[i] is None else gt_poly[i],
-                        'category_id': cname2cid[cname],
-                        'id': ann_ct,
-                        'difficult': 0
-                    })
-                    ann_ct += 1
-                im_info = {
-                    'im_id': im_id,
-                    'image_shape': np.array([im_h, im_w]).astype('int32'),
-                }
-                label_info = {
-                    'is_crowd': is_crowd,
-                    'gt_class': gt_class,
-                    'gt_bbox': gt_bbox,
-                    'gt_score': gt_score,
-                    'difficult': difficult
-                }
-                if None not in gt_poly:
-                    label_info['gt_poly'] = gt_poly
-                voc_rec = (im_info, label_info)
-                if len(objs) != 0:
-                    self.file_list.append([img_file, voc_rec])
-                    ct += 1
-                    annotations['images'].append({
-                        'height': im_h,
-                        'width': im_w,
-                        'id': int(im_id[0]),
-                        'file_name': osp.split(img_file)[1]
-                    })
+                samples.append((img_file, json_file, cname2cid))
+        recs = parallel_map(parse_easydata_det, samples, num_parse_workers)
+
+        ct = 0
+        ann_ct = 0
+        for (img_file, json_file, _), rec in zip(samples, recs):
+            im_id = np.array([ct])
+            im_w = rec['im_w']
+            im_h = rec['im_h']
+            gt_poly = rec['gt_poly']
+            num_objs = len(gt_poly)
+            for x1, y1, x2, y2, cid, segmentation in rec['objects']:
+                annotations['annotations'].append({
+                    'iscrowd': 0,
+                    'image_id': int(im_id[0]),
+                    'bbox': [x1, y1, x2 - x1 + 1, y2 - y1 + 1],
+                    'area': float((x2 - x1 + 1) * (y2 - y1 + 1)),
+                    'segmentation': segmentation,
+                    'category_id': cid,
+                    'id': ann_ct,
+                    'difficult': 0
+                })
+                ann_ct += 1
+            im_info = {
+                'im_id': im_id,
+                'image_shape': np.array([im_h, im_w]).astype('int32'),
+            }
+            label_info = {
+                'is_crowd': np.zeros((num_objs, 1), dtype=np.int32),
+                'gt_class': rec['gt_class'],
+                'gt_bbox': rec['gt_bbox'],
+                'gt_score': np.ones((num_objs, 1), dtype=np.float32),
+                'difficult': np.zeros((num_objs, 1), dtype=np.int32)
+            }
+            if None not in gt_poly:
+                label_info['gt_poly'] = gt_poly
+            voc_rec = (im_info, label_info)
+            if num_objs != 0:
+                self.file_list.append([img_file, voc_rec])
+                ct += 1
+                annotations['images'].append({
+                    'height': im_h,
+                    'width': im_w,
+                    'id': int(im_id[0]),
+                    'file_name': osp.split(img_file)[1]
+                })
 
+        if compact_records:
+            self.file_list = DetRecordStore.from_records(self.file_list)
         if not len(self.file_list) > 0:
             raise Exception('not found any voc record in %s' % (file_list))
         logging.info("{} samples in file {}".format(
@@ -174,11 +227,4 @@ class EasyDataDet(VOCDetection):
         self.coco_gt.createIndex()
 
     def mask2polygon(self, mask):
-        contours, hierarchy = cv2.findContours(
-            (mask).astype(np.uint8), cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        segmentation = []
-        for contour in contours:
-            contour_list = contour.flatten().tolist()
-            if len(contour_list) > 4:
-                segmentation.append(contour_list)
-        return segmentation
+        return mask2polygon(mask)
@@ -24,6 +24,42 @@ from paddlex.utils import path_normalization
 from .dataset import Dataset
 from .dataset import get_encoding
 from .dataset import is_pic
+from .dataset import parallel_map
+from .dataset import copy_record
+
+
+def parse_easydata_seg(img_file, json_file, cname2cid):
+    """解析单个EasyData格式的语义分割标注文件。
+
+    Args:
+        img_file (str): 图像文件路径，用于读取图像宽高。
+        json_file (str): json标注文件路径。
+        cname2cid (dict): 类别名称到类别id的映射。
+
+    Returns:
+        np.ndarray: 形状为(h, w)的uint8标注图。
+    """
+    from pycocotools.mask import decode
+    with open(json_file, mode='r', \
+              encoding=get_encoding(json_file)) as j:
+        json_info = json.load(j)
+    im = cv2.imread(img_file)
+    im_w = im.shape[1]
+    im_h = im.shape[0]
+    objs = json_info['labels']
+    lable_npy = np.zeros([im_h, im_w]).astype('uint8')
+    for i, obj in enumerate(objs):
+        cname = obj['name']
+        cid = cname2cid[cname]
+        mask_dict = {}
+        mask_dict['size'] = [im_h, im_w]
+        mask_dict['counts'] = obj['mask'].encode()
+        mask = decode(mask_dict)
+        mask *= cid
+        conflict_index = np.where(((lable_npy > 0) & (mask == cid)) == True)
+        mask[conflict_index] = 0
+        lable_npy += mask
+    return lable_npy
 
 
 class EasyDataSeg(Dataset):
@@ -39,6 +75,8 @@ class EasyDataSeg(Dataset):
         parallel_method (str): 数据集中样本在预处理过程中并行处理的方式，支持'thread'
             线程和'process'进程两种方式。默认为'process'（Windows和Mac下会强制使用thread，该参数无效）。
         shuffle (bool): 是否需要对数据集中样本打乱顺序。默认为False。
+        num_parse_workers (int): 构建数据集时并行解析标注文件的进程数，解析结果与串行解析完全一致。
+            默认为1，即串行解析（Windows和Mac下会强制串行解析）。
     """
 
     def __init__(self,
@@ -49,7 +87,8 @@ class EasyDataSeg(Dataset):
                  num_workers='auto',
                  buffer_size=100,
                  parallel_method='process',
-                 shuffle=False):
+                 shuffle=False,
+                 num_parse_workers=1):
         super(EasyDataSeg, self).__init__(
             transforms=transforms,
             num_workers=num_workers,
@@ -58,9 +97,9 @@ class EasyDataSeg(Dataset):
             shuffle=shuffle)
         self.file_list = list()
         self.labels = list()
+        self.label_cache = None
         self._epoch = 0
 
-        from pycocotools.mask import decode
         cname2cid = {}
         label_id = 0
         with open(label_list, encoding=get_encoding(label_list)) as fr:
@@ -69,6 +108,7 @@ class EasyDataSeg(Dataset):
                 label_id += 1
                 self.labels.append(line.strip())
 
+        samples = list()
         with open(file_list, encoding=get_encoding(file_list)) as f:
             for line in f:
                 img_file, json_file = [osp.join(data_dir, x) \
@@ -82,40 +122,38 @@ class EasyDataSeg(Dataset):
                 if not osp.exists(img_file):
                     raise IOError('The image file {} is not exist!'.format(
                         img_file))
-                with open(json_file, mode='r', \
-                          encoding=get_encoding(json_file)) as j:
-                    json_info = json.load(j)
-                im = cv2.imread(img_file)
-                im_w = im.shape[1]
-                im_h = im.shape[0]
-                objs = json_info['labels']
-                lable_npy = np.zeros([im_h, im_w]).astype('uint8')
-                for i, obj in enumerate(objs):
-                    cname = obj['name']
-                    cid = cname2cid[cname]
-                    mask_dict = {}
-                    mask_dict['size'] = [im_h, im_w]
-                    mask_dict['counts'] = obj['mask'].encode()
-                    mask = decode(mask_dict)
-                    mask *= cid
-                    conflict_index = np.where(((lable_npy > 0) &
-                                               (mask == cid)) == True)
-                    mask[conflict_index] = 0
-                    lable_npy += mask
-                self.file_list.append([img_file, lable_npy])
+                samples.append((img_file, json_file, cname2cid))
+        label_npys = parallel_map(parse_easydata_seg, samples,
+                                  num_parse_workers)
+        for (img_file, _, _), lable_npy in zip(samples, label_npys):
+            self.file_list.append([img_file, lable_npy])
         self.num_samples = len(self.file_list)
         logging.info("{} samples in file {}".format(
             len(self.file_list), file_list))
 
+    def set_label_cache(self, cache_dir=None, compress=False):
+        """将解析得到的标注图集中保存到一个缓存文件中，不再以独立数组常驻内存并在每个epoch拷贝。
+
+        各数据读取进程通过内存映射共享该文件，每个样本的标注为文件中的一段切片；
+        开启`compress`后以游程编码（RLE）保存，大面积同类区域的标注占用的内存可降低一个数量级以上。
+
+        Args:
+            cache_dir (str): 缓存文件的保存目录。默认为None，即保存在共享内存（/dev/shm）或临时目录中，
+                进程退出时删除。
+            compress (bool): 是否以游程编码压缩标注，读取时需展开。默认为False。
+        """
+        from paddlex.cv.transforms.label_cache import build_label_cache
+        self.label_cache = build_label_cache(
+            [f[1] for f in self.file_list], cache_dir, compress)
+
     def iterator(self):
         self._epoch += 1
         self._pos = 0
-        files = copy.deepcopy(self.file_list)
-        if self.shuffle:
-            random.shuffle(files)
-        files = files[:self.num_samples]
-        self.num_samples = len(files)
-        for f in files:
-            lable_npy = f[1]
+        for idx in self.epoch_indices():
+            f = self.file_list[idx]
+            if self.label_cache is None:
+                lable_npy = copy_record(f[1])
+            else:
+                lable_npy = self.label_cache[idx]
             sample = [f[0], None, lable_npy]
             yield sample
@@ -86,12 +86,8 @@ class ImageNet(Dataset):
     def iterator(self):
         self._epoch += 1
         self._pos = 0
-        files = copy.deepcopy(self.file_list)
-        if self.shuffle:
-            random.shuffle(files)
-        files = files[:self.num_samples]
-        self.num_samples = len(files)
-        for f in files:
+        for idx in self.epoch_indices():
+            f = self.file_list[idx]
             records = f[1]
             sample = [f[0], records]
             yield sample
@@ -0,0 +1,395 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import os
+import os.path as osp
+import json
+import mmap
+import pickle
+import random
+import numpy as np
+import paddlex.utils.logging as logging
+from .dataset import Dataset
+from .imagenet import ImageNet
+from .voc import VOCDetection
+from .seg_dataset import SegDataset
+
+RECORD_VERSION = 1
+# 索引中每条记录的字段：分片序号、图像偏移、图像字节数、标注偏移、标注字节数、扩展名序号
+_SHARD, _IM_OFFSET, _IM_SIZE, _LABEL_OFFSET, _LABEL_SIZE, _EXT = range(6)
+
+# 每个进程中已打开的分片文件，fork出的子进程直接继承
+_shard_mmaps = dict()
+
+
+def _open_shard(path):
+    mm = _shard_mmaps.get(path, None)
+    if mm is None:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            # 按分片顺序读取，提示内核进行预读
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        _shard_mmaps[path] = mm
+    return mm
+
+
+class RecordImage(object):
+    """打包文件中的一段编码数据（图像或分割标注文件的原始字节）。
+
+    对象本身只记录分片路径和偏移量，可以低开销地在进程间传递；在使用它的进程中通过mmap
+    读取，`np.asarray(record)`得到指向文件映射的uint8数组，不额外拷贝数据。
+    transforms在解码图像时可直接接收该对象。
+
+    Args:
+        path (str): 分片文件路径。
+        offset (int): 数据在分片文件中的起始位置。
+        size (int): 数据的字节数。
+        ext (str): 原始文件的扩展名，如'.jpg'。
+    """
+    __slots__ = ['path', 'offset', 'size', 'ext']
+
+    def __init__(self, path, offset, size, ext):
+        self.path = path
+        self.offset = offset
+        self.size = size
+        self.ext = ext
+
+    def __array__(self, dtype=None, copy=None):
+        mm = _open_shard(self.path)
+        arr = np.frombuffer(
+            mm, dtype='uint8', count=self.size, offset=self.offset)
+        if dtype is not None and np.dtype(dtype) != arr.dtype:
+            arr = arr.astype(dtype)
+        return arr
+
+    def __bytes__(self):
+        mm = _open_shard(self.path)
+        return mm[self.offset:self.offset + self.size]
+
+    def __repr__(self):
+        return "RecordImage({}, offset={}, size={})".format(
+            self.path, self.offset, self.size)
+
+
+def _encode_png(label):
+    import io
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.fromarray(label).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+class RecordWriter(object):
+    """将样本的图像及标注文件依次写入分片文件。
+
+    Args:
+        save_dir (str): 打包文件的保存目录。
+        shard_size (int): 单个分片文件的最大字节数。默认为256MB。
+    """
+
+    def __init__(self, save_dir, shard_size=256 * 1024**2):
+        if not osp.exists(save_dir):
+            os.makedirs(save_dir)
+        self.save_dir = save_dir
+        self.shard_size = shard_size
+        self.shards = list()
+        self.exts = list()
+        self.index = list()
+        self._file = None
+        self._offset = 0
+
+    def _next_shard(self):
+        if self._file is not None:
+            self._file.close()
+        name = "data-{:05d}.rec".format(len(self.shards))
+        self.shards.append(name)
+        self._file = open(osp.join(self.save_dir, name), 'wb')
+        self._offset = 0
+
+    def _write(self, data):
+        offset = self._offset
+        self._file.write(data)
+        self._offset += len(data)
+        return offset
+
+    def add(self, im_file, label_file=None):
+        """写入一个样本的图像文件及分割标注文件（可选）的原始字节。
+
+        分割标注也可以是已解析的标注图（如EasyDataSeg），此时以PNG格式无损编码后写入。
+        """
+        with open(im_file, 'rb') as f:
+            im_data = f.read()
+        label_data = None
+        if isinstance(label_file, np.ndarray):
+            label_data = _encode_png(label_file)
+        elif label_file is not None:
+            with open(label_file, 'rb') as f:
+                label_data = f.read()
+        size = len(im_data) + (len(label_data) if label_data else 0)
+        if self._file is None or (self._offset > 0 and
+                                  self._offset + size > self.shard_size):
+            self._next_shard()
+        ext = osp.splitext(im_file)[-1].lower()
+        if ext not in self.exts:
+            self.exts.append(ext)
+        im_offset = self._write(im_data)
+        label_offset, label_size = 0, -1
+        if label_data is not None:
+            label_offset = self._write(label_data)
+            label_size = len(label_data)
+        self.index.append([
+            len(self.shards) - 1, im_offset,
+            len(im_data), label_offset, label_size, self.exts.index(ext)
+        ])
+
+    def close(self, dataset_type, labels, annotations):
+        """写入索引及元信息。
+
+        Args:
+            dataset_type (str): 数据集类型，为'imagenet'、'det'或'seg'。
+            labels (list): 类别名称。
+            annotations (list|tuple): 各样本的标注信息，检测数据集为(样本标注列表, COCO格式的标注字典)。
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        index = np.array(self.index, dtype='int64').reshape((-1, 6))
+        np.save(osp.join(self.save_dir, 'index.npy'), index)
+        with open(osp.join(self.save_dir, 'annotations.pkl'), 'wb') as f:
+            pickle.dump(annotations, f, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {
+            'version': RECORD_VERSION,
+            'type': dataset_type,
+            'num_samples': len(index),
+            'shards': self.shards,
+            'exts': self.exts,
+            'labels': labels
+        }
+        with open(osp.join(self.save_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+
+def load_records(record_dir, dataset_type):
+    """读取打包目录中的元信息、索引及标注。
+
+    Returns:
+        tuple: (meta, images, label_files, annotations)，其中images和label_files为各样本的
+            `RecordImage`（无分割标注时为None）。
+    """
+    with open(osp.join(record_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['version'] != RECORD_VERSION:
+        raise Exception("The version of packed dataset {} is {}, but {} is "
+                        "required, please pack the dataset again.".format(
+                            record_dir, meta['version'], RECORD_VERSION))
+    if meta['type'] != dataset_type:
+        raise Exception("The packed dataset {} is a {} dataset, not {}.".
+                        format(record_dir, meta['type'], dataset_type))
+    index = np.load(osp.join(record_dir, 'index.npy'))
+    with open(osp.join(record_dir, 'annotations.pkl'), 'rb') as f:
+        annotations = pickle.load(f)
+    shards = [osp.join(record_dir, name) for name in meta['shards']]
+    exts = meta['exts']
+    images = list()
+    label_files = list()
+    for rec in index.tolist():
+        path = shards[rec[_SHARD]]
+        images.append(
+            RecordImage(path, rec[_IM_OFFSET], rec[_IM_SIZE], exts[rec[
+                _EXT]]))
+        if rec[_LABEL_SIZE] >= 0:
+            label_files.append(
+                RecordImage(path, rec[_LABEL_OFFSET], rec[_LABEL_SIZE],
+                            '.png'))
+        else:
+            label_files.append(None)
+    return meta, index, images, label_files, annotations
+
+
+class RecordMixin(object):
+    """打包数据集的公共逻辑：按分片读取、分片级及缓冲区级打乱。
+    """
+
+    def _init_records(self, record_dir, shuffle_buffer_size):
+        self.record_dir = record_dir
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self._epoch = 0
+
+    def _set_shards(self, index):
+        shards = index[:, _SHARD]
+        self._shard_indices = [
+            np.flatnonzero(shards == i).tolist()
+            for i in range(int(shards.max()) + 1 if len(shards) else 0)
+        ]
+
+    def epoch_indices(self):
+        """生成当前epoch的样本索引序列。
+
+        打乱时先打乱分片的顺序，各分片内按文件顺序读取，再经过大小为`shuffle_buffer_size`
+        的缓冲区随机输出；读取始终在少数几个分片内顺序进行，便于系统预读。
+
+        Returns:
+            list: 当前epoch依次读取的样本在`file_list`中的索引。
+        """
+        if not self.shuffle:
+            indices = list(range(len(self.file_list)))
+        else:
+            shard_order = list(range(len(self._shard_indices)))
+            random.shuffle(shard_order)
+            stream = [i for s in shard_order for i in self._shard_indices[s]]
+            # 打包后追加的样本（如背景图片）不在分片中，随机插入读取序列
+            extra = list(range(len(stream), len(self.file_list)))
+            for i in extra:
+                stream.insert(random.randint(0, len(stream)), i)
+            indices = list()
+            buf = list()
+            for i in stream:
+                if len(buf) < self.shuffle_buffer_size:
+                    buf.append(i)
+                    continue
+                pos = random.randint(0, len(buf) - 1)
+                indices.append(buf[pos])
+                buf[pos] = i
+            random.shuffle(buf)
+            indices.extend(buf)
+        indices = indices[:self.num_samples]
+        self.num_samples = len(indices)
+        return self.bucket_indices(indices)
+
+
+class PackedImageNet(RecordMixin, ImageNet):
+    """读取由`paddlex.tools.pack_dataset`打包的分类数据集。
+
+    Args:
+        record_dir (str): 打包文件所在的目录路径。
+        transforms (paddlex.cls.transforms): 数据集中每个样本的预处理/增强算子。
+        num_workers (int|str): 数据集中样本在预处理过程中的线程或进程数。默认为'auto'。
+        buffer_size (int): 数据集中样本在预处理过程中队列的缓存长度，以样本数为单位。默认为8。
+        parallel_method (str): 数据集中样本在预处理过程中并行处理的方式，支持'thread'
+            线程和'process'进程两种方式。默认为'process'（Windows和Mac下会强制使用thread，该参数无效）。
+        shuffle (bool): 是否需要对数据集中样本打乱顺序。默认为False。
+        shuffle_buffer_size (int): 打乱顺序时缓冲区的大小，以样本数为单位。默认为1000。
+    """
+
+    def __init__(self,
+                 record_dir,
+                 transforms=None,
+                 num_workers='auto',
+                 buffer_size=8,
+                 parallel_method='process',
+                 shuffle=False,
+                 shuffle_buffer_size=1000):
+        Dataset.__init__(
+            self,
+            transforms=transforms,
+            num_workers=num_workers,
+            buffer_size=buffer_size,
+            parallel_method=parallel_method,
+            shuffle=shuffle)
+        self._init_records(record_dir, shuffle_buffer_size)
+        meta, index, images, _, annotations = load_records(record_dir,
+                                                           'imagenet')
+        self._set_shards(index)
+        self.labels = meta['labels']
+        self.file_list = [[im, label] for im, label in zip(images, annotations)]
+        self.num_samples = len(self.file_list)
+        logging.info("{} samples in packed dataset {}".format(
+            self.num_samples, record_dir))
+
+
+class PackedDetection(RecordMixin, VOCDetection):
+    """读取由`paddlex.tools.pack_dataset`打包的检测数据集（由VOC、COCO等格式打包）。
+
+    Args:
+        record_dir (str): 打包文件所在的目录路径。
+        transforms (paddlex.det.transforms): 数据集中每个样本的预处理/增强算子。
+        num_workers (int|str): 数据集中样本在预处理过程中的线程或进程数。默认为'auto'。
+        buffer_size (int): 数据集中样本在预处理过程中队列的缓存长度，以样本数为单位。默认为100。
+        parallel_method (str): 数据集中样本在预处理过程中并行处理的方式，支持'thread'
+            线程和'process'进程两种方式。默认为'process'（Windows和Mac下会强制使用thread，该参数无效）。
+        shuffle (bool): 是否需要对数据集中样本打乱顺序。默认为False。
+        shuffle_buffer_size (int): 打乱顺序时缓冲区的大小，以样本数为单位。默认为1000。
+    """
+
+    def __init__(self,
+                 record_dir,
+                 transforms=None,
+                 num_workers='auto',
+                 buffer_size=100,
+                 parallel_method='process',
+                 shuffle=False,
+                 shuffle_buffer_size=1000):
+        from pycocotools.coco import COCO
+        Dataset.__init__(
+            self,
+            transforms=transforms,
+            num_workers=num_workers,
+            buffer_size=buffer_size,
+            parallel_method=parallel_method,
+            shuffle=shuffle)
+        self._init_records(record_dir, shuffle_buffer_size)
+        meta, index, images, _, annotations = load_records(record_dir, 'det')
+        self._set_shards(index)
+        self.labels = meta['labels']
+        records, coco_annotations = annotations
+        self.file_list = [[im, rec] for im, rec in zip(images, records)]
+        self.num_samples = len(self.file_list)
+        self.coco_gt = COCO()
+        self.coco_gt.dataset = coco_annotations
+        self.coco_gt.createIndex()
+        logging.info("{} samples in packed dataset {}".format(
+            self.num_samples, record_dir))
+
+
+class PackedSegDataset(RecordMixin, SegDataset):
+    """读取由`paddlex.tools.pack_dataset`打包的语义分割数据集。
+
+    Args:
+        record_dir (str): 打包文件所在的目录路径。
+        transforms (paddlex.seg.transforms): 数据集中每个样本的预处理/增强算子。
+        num_workers (int|str): 数据集中样本在预处理过程中的线程或进程数。默认为'auto'。
+        buffer_size (int): 数据集中样本在预处理过程中队列的缓存长度，以样本数为单位。默认为100。
+        parallel_method (str): 数据集中样本在预处理过程中并行处理的方式，支持'thread'
+            线程和'process'进程两种方式。默认为'process'（Windows和Mac下会强制使用thread，该参数无效）。
+        shuffle (bool): 是否需要对数据集中样本打乱顺序。默认为False。
+        shuffle_buffer_size (int): 打乱顺序时缓冲区的大小，以样本数为单位。默认为1000。
+    """
+
+    def __init__(self,
+                 record_dir,
+                 transforms=None,
+                 num_workers='auto',
+                 buffer_size=100,
+                 parallel_method='process',
+                 shuffle=False,
+                 shuffle_buffer_size=1000):
+        Dataset.__init__(
+            self,
+            transforms=transforms,
+            num_workers=num_workers,
+            buffer_size=buffer_size,
+            parallel_method=parallel_method,
+            shuffle=shuffle)
+        self._init_records(record_dir, shuffle_buffer_size)
+        meta, index, images, label_files, _ = load_records(record_dir, 'seg')
+        self._set_shards(index)
+        self.labels = meta['labels']
+        self.label_cache = None
+        self.file_list = [[im, label]
+                          for im, label in zip(images, label_files)]
+        self.num_samples = len(self.file_list)
+        logging.info("{} samples in packed dataset {}".format(
+            self.num_samples, record_dir))
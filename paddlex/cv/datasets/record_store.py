@@ -0,0 +1,174 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import numpy as np
+
+
+class DetRecord(object):
+    """`DetRecordStore`中单个样本的轻量视图。
+
+    行为与检测数据集`file_list`中的元素[im_fname, (im_info, label_info)]一致，
+    访问`record[1]`时才根据偏移量从列式数组中切片生成im_info和label_info，
+    其中的np.ndarray均为共享底层数据的只读视图。
+    """
+    __slots__ = ['store', 'index']
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, i):
+        if i == 0 or i == -2:
+            return self.store.im_fnames[self.index]
+        if i == 1 or i == -1:
+            return self.store.get_infos(self.index)
+        raise IndexError("DetRecord index out of range")
+
+    def __iter__(self):
+        yield self[0]
+        yield self[1]
+
+
+class DetRecordStore(object):
+    """以列式numpy数组保存检测数据集全部样本标注的容器，可替代`file_list`使用。
+
+    所有样本的标注框按样本顺序拼接保存在若干个连续数组中，`offsets[i]`至
+    `offsets[i + 1]`为第i个样本的标注在数组中的范围。相比每个样本一个dict、
+    每个字段一个小数组的存储方式，每个标注框仅占用数十字节，且底层数据在fork出的
+    子进程间共享，不会因为引用计数的变化被逐页复制。
+
+    Args:
+        im_fnames (list): 每个样本的图像路径。
+        im_ids (np.ndarray): 每个样本的图像id，形状为(M, 1)。
+        image_shapes (np.ndarray): 每个样本的图像高、宽，形状为(M, 2)。
+        offsets (np.ndarray): 每个样本标注的起始位置，形状为(M + 1, )。
+        columns (dict): 各标注字段拼接后的数组，键为`COLUMNS`中的字段名。
+        poly_flags (np.ndarray): 每个样本的label_info中是否包含'gt_poly'字段，形状为(M, )。
+        polys (dict): 样本序号到非空'gt_poly'的映射。
+    """
+    COLUMNS = ['gt_bbox', 'gt_class', 'gt_score', 'is_crowd', 'difficult']
+
+    def __init__(self, im_fnames, im_ids, image_shapes, offsets, columns,
+                 poly_flags, polys):
+        self.im_fnames = im_fnames
+        self.im_ids = self._readonly(im_ids)
+        self.image_shapes = self._readonly(image_shapes)
+        self.offsets = self._readonly(offsets)
+        self.columns = {
+            name: self._readonly(value)
+            for name, value in columns.items()
+        }
+        self.poly_flags = self._readonly(poly_flags)
+        self.polys = polys
+        self._extra = list()
+
+    @staticmethod
+    def _readonly(arr):
+        # 转为新的np.ndarray视图：不修改传入数组的标记，np.memmap切片也不再携带memmap类型
+        arr = np.asarray(arr).view(np.ndarray)
+        arr.flags.writeable = False
+        return arr
+
+    @classmethod
+    def from_records(cls, file_list):
+        """由[im_fname, (im_info, label_info)]组成的`file_list`构建容器。
+
+        Args:
+            file_list (list): 检测数据集的样本记录。
+
+        Returns:
+            DetRecordStore: 构建得到的容器。
+        """
+        num_objs = [len(rec[1][1]['gt_bbox']) for rec in file_list]
+        offsets = np.zeros((len(file_list) + 1, ), dtype=np.int64)
+        offsets[1:] = np.cumsum(num_objs)
+        columns = dict()
+        if len(file_list) > 0:
+            for name in cls.COLUMNS:
+                columns[name] = np.concatenate(
+                    [rec[1][1][name] for rec in file_list], axis=0)
+            im_ids = np.concatenate([rec[1][0]['im_id'] for rec in file_list])
+        else:
+            im_ids = np.zeros((0, ), dtype=np.int64)
+        im_ids = im_ids.reshape((-1, 1))
+        image_shapes = np.array(
+            [rec[1][0]['image_shape'] for rec in file_list],
+            dtype=np.int32).reshape((-1, 2))
+        poly_flags = np.array(
+            ['gt_poly' in rec[1][1] for rec in file_list], dtype=np.bool_)
+        polys = dict()
+        for i, rec in enumerate(file_list):
+            gt_poly = rec[1][1].get('gt_poly', None)
+            if gt_poly:
+                polys[i] = gt_poly
+        im_fnames = [rec[0] for rec in file_list]
+        return cls(im_fnames, im_ids, image_shapes, offsets, columns,
+                   poly_flags, polys)
+
+    def get_infos(self, index):
+        """获取第index个样本的(im_info, label_info)，其中的数组为底层数据的视图。
+        """
+        start, end = self.offsets[index], self.offsets[index + 1]
+        im_info = {
+            'im_id': self.im_ids[index],
+            'image_shape': self.image_shapes[index],
+        }
+        label_info = dict()
+        for name, value in self.columns.items():
+            label_info[name] = value[start:end]
+        if self.poly_flags[index]:
+            label_info['gt_poly'] = self.polys.get(index, [])
+        return (im_info, label_info)
+
+    def __len__(self):
+        return len(self.im_fnames) + len(self._extra)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index >= len(self.im_fnames):
+            return self._extra[index - len(self.im_fnames)]
+        return DetRecord(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, record):
+        """追加一个[im_fname, (im_info, label_info)]形式的样本记录，如背景图片。
+        """
+        self._extra.append(record)
+
+    def to_list(self):
+        """转换为由[im_fname, (im_info, label_info)]组成的list。
+
+        im_info中的数组为独立的拷贝，label_info中的标注数组仍为底层数据的只读视图。
+        """
+        file_list = list()
+        for i in range(len(self.im_fnames)):
+            im_info, label_info = self.get_infos(i)
+            im_info = {k: v.copy() for k, v in im_info.items()}
+            file_list.append([self.im_fnames[i], (im_info, label_info)])
+        return file_list + self._extra
+
+    def nbytes(self):
+        """返回列式数组占用的字节数。
+        """
+        arrays = [self.im_ids, self.image_shapes, self.offsets,
+                  self.poly_flags] + list(self.columns.values())
+        return sum(arr.nbytes for arr in arrays)
@@ -54,6 +54,7 @@ class SegDataset(Dataset):
             shuffle=shuffle)
         self.file_list = list()
         self.labels = list()
+        self.label_cache = None
         self._epoch = 0
 
         if label_list is not None:
@@ -83,15 +84,29 @@ class SegDataset(Dataset):
         logging.info("{} samples in file {}".format(
             len(self.file_list), file_list))
 
+    def set_label_cache(self, cache_dir=None, compress=False):
+        """预先解码全部标注并缓存，之后每个样本的标注直接从缓存文件的内存映射中切片读取，
+        省去每个epoch重复读取和解码标注图像的开销。
+
+        标注按uint8保存在一个缓存文件中，fork出的数据读取进程共享同一份文件映射；
+        未压缩时各样本的标注为指向文件映射的只读数组。需在开始训练前调用。
+
+        Args:
+            cache_dir (str): 缓存文件的保存目录，再次创建数据集时标注未变化则直接复用。默认为None，
+                即保存在共享内存（/dev/shm）或临时目录中，进程退出时删除。
+            compress (bool): 是否对标注进行游程编码（RLE）压缩，可大幅降低内存占用，读取时需展开。
+                默认为False。
+        """
+        from paddlex.cv.transforms.label_cache import build_label_cache
+        self.label_cache = build_label_cache(
+            [f[1] for f in self.file_list], cache_dir, compress)
+
     def iterator(self):
         self._epoch += 1
         self._pos = 0
-        files = copy.deepcopy(self.file_list)
-        if self.shuffle:
-            random.shuffle(files)
-        files = files[:self.num_samples]
-        self.num_samples = len(files)
-        for f in files:
-            label_path = f[1]
+        for idx in self.epoch_indices():
+            f = self.file_list[idx]
+            label_path = f[1] if self.label_cache is None else \
+                self.label_cache[idx]
             sample = [f[0], None, label_path]
             yield sample
@@ -17,9 +17,16 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-__all__ = ['SharedBuffer', 'SharedMemoryMgr', 'SharedQueue']
+__all__ = [
+    'SharedBuffer', 'SharedMemoryMgr', 'SharedQueue', 'SharedSample',
+    'SharedBatch', 'SharedBatchAllocator', 'BatchBufferRing'
+]
 
 from .sharedmemory import SharedBuffer
 from .sharedmemory import SharedMemoryMgr
 from .sharedmemory import SharedMemoryError
 from .queue import SharedQueue
+from .batch_buffer import SharedSample
+from .batch_buffer import SharedBatch
+from .batch_buffer import SharedBatchAllocator
+from .batch_buffer import BatchBufferRing
@@ -0,0 +1,300 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# utils for passing numpy arrays between processes through SharedMemoryMgr
+#    without pickling the array data
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ALIGNMENT = 64
+
+
+def _aligned(size):
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _nbytes(shape, dtype):
+    return int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+
+
+def _array_view(base, offset, shape, dtype):
+    """ view 'base[offset:]' as an array with 'shape' and 'dtype'
+    """
+    size = _nbytes(shape, dtype)
+    if size == 0:
+        return np.empty(shape, dtype=dtype)
+    return base[offset:offset + size].view(dtype).reshape(shape)
+
+
+def _region_offset(region, arr):
+    """ offset of 'arr' in 'region' if 'arr' is a contiguous array in it
+    """
+    if region is None or not arr.flags.c_contiguous or arr.nbytes == 0:
+        return None
+    start = region.__array_interface__['data'][0]
+    pos = arr.__array_interface__['data'][0]
+    if pos >= start and pos + arr.nbytes <= start + region.nbytes:
+        return pos - start
+    return None
+
+
+def specs_size(specs):
+    """ offsets of arrays with (shape, dtype) in 'specs' and the total bytes
+    """
+    offsets = list()
+    size = 0
+    for shape, dtype in specs:
+        offsets.append(size)
+        size = _aligned(size + _nbytes(shape, dtype))
+    return offsets, size
+
+
+def split_buffer(base, specs, offsets):
+    """ split 'base' into uninitialized arrays with (shape, dtype) in 'specs'
+    """
+    return [
+        _array_view(base, offset, shape, dtype)
+        for (shape, dtype), offset in zip(specs, offsets)
+    ]
+
+
+class SharedBatch(object):
+    """ a list of samples whose numpy arrays are stored on shared memory as
+        raw bytes, other fields are pickled together with this object
+
+        arrays already placed in 'batch_buffer' (e.g. padded images written
+        by 'SharedBatchAllocator') are referred to in place, the others are
+        copied into one new SharedBuffer
+
+        note that:
+            the receiver should call 'self.free' after using the arrays
+            returned by 'self.samples', otherwise the buffers are freed when
+            this object is garbage collected
+    """
+
+    def __init__(self, mem_mgr, samples, batch_buffer=None):
+        """ Init, called in the producer process
+
+            Args:
+                mem_mgr (SharedMemoryMgr): manager to allocate buffer from
+                samples (list): samples, each of which is a tuple of fields
+                batch_buffer (SharedBuffer): buffer which some of the
+                    arrays are already placed in, owned by this object after
+        """
+        region = None
+        if batch_buffer is not None:
+            region = batch_buffer.get(0, batch_buffer.capacity())
+        layouts = list()
+        size = 0
+        for sample in samples:
+            layout = list()
+            for field in sample:
+                if isinstance(field, np.ndarray) and not field.dtype.hasobject:
+                    offset = _region_offset(region, field)
+                    if offset is not None:
+                        layout.append(
+                            (1, (offset, field.shape, field.dtype.str)))
+                    else:
+                        layout.append(
+                            (0, (size, field.shape, field.dtype.str)))
+                        size = _aligned(size + field.nbytes)
+                else:
+                    layout.append((2, field))
+            layouts.append(layout)
+        self._layouts = layouts
+        self._size = size
+        self._buffer = None
+        self._batch_buffer = batch_buffer
+        self._received = False
+        if size == 0:
+            return
+        buff = mem_mgr.malloc(size)
+        try:
+            buff.resize(buff.capacity())
+            base = buff.get(0, size)
+            for sample, layout in zip(samples, layouts):
+                for field, (kind, info) in zip(sample, layout):
+                    if kind == 0:
+                        offset, shape, dtype = info
+                        _array_view(base, offset, shape, dtype)[...] = field
+        except Exception:
+            buff.free()
+            raise
+        self._buffer = buff
+
+    def __getstate__(self):
+        return (self._layouts, self._size, self._buffer, self._batch_buffer)
+
+    def __setstate__(self, state):
+        self._layouts, self._size, self._buffer, self._batch_buffer = state
+        self._received = True
+
+    def samples(self, copy=False, copy_unpacked=False):
+        """ get the samples, arrays are views on the shared memory unless
+            'copy' is True
+
+            if 'copy_unpacked' is True, only arrays placed in 'batch_buffer'
+            (e.g. padded images and segmentation labels) are returned as
+            views, the others (boxes, labels, ids...) are copied, so they
+            stay valid after the buffers are reused
+        """
+        bases = [None, None]
+        if self._buffer is not None:
+            bases[0] = self._buffer.get(0, self._size)
+        if self._batch_buffer is not None:
+            bases[1] = self._batch_buffer.get(0,
+                                              self._batch_buffer.capacity())
+        samples = list()
+        for layout in self._layouts:
+            fields = list()
+            for kind, info in layout:
+                if kind == 2:
+                    fields.append(info)
+                    continue
+                offset, shape, dtype = info
+                arr = _array_view(bases[kind], offset, shape, dtype)
+                if copy or (copy_unpacked and kind == 0):
+                    arr = arr.copy()
+                fields.append(arr)
+            samples.append(tuple(fields))
+        return samples
+
+    def free(self):
+        """ free the buffers to their owner
+        """
+        for name in ['_buffer', '_batch_buffer']:
+            buff = getattr(self, name)
+            if buff is not None:
+                buff.free()
+                setattr(self, name, None)
+
+    def __del__(self):
+        if not self._received:
+            return
+        try:
+            self.free()
+        except Exception as e:
+            logger.debug('failed to free %s for reason[%s]' %
+                         (type(self).__name__, str(e)))
+
+
+class SharedSample(SharedBatch):
+    """ a single sample stored on shared memory, see 'SharedBatch'
+    """
+
+    def __init__(self, mem_mgr, sample):
+        """ Init, called in the producer process
+
+            Args:
+                mem_mgr (SharedMemoryMgr): manager to allocate buffer from
+                sample (tuple|list): fields of the sample
+        """
+        super(SharedSample, self).__init__(mem_mgr, [sample])
+
+    def fields(self):
+        """ get fields of the sample, arrays are views on the shared memory
+        """
+        return self.samples()[0]
+
+
+class SharedBatchAllocator(object):
+    """ allocator used by producer processes to place a batch on a new
+        SharedBuffer, which is handed over to 'SharedBatch' then
+    """
+
+    def __init__(self, mem_mgr):
+        self._mem_mgr = mem_mgr
+        self.buffer = None
+
+    def __call__(self, specs):
+        """ allocate arrays with (shape, dtype) in 'specs' on one new buffer
+        """
+        assert self.buffer is None, 'SharedBatchAllocator can only '\
+            'be called once'
+        offsets, size = specs_size(specs)
+        buff = self._mem_mgr.malloc(max(size, 1))
+        buff.resize(buff.capacity())
+        self.buffer = buff
+        return split_buffer(buff.get(0, buff.capacity()), specs, offsets)
+
+    def free(self):
+        """ free the buffer if it is not handed over
+        """
+        if self.buffer is not None:
+            self.buffer.free()
+            self.buffer = None
+
+
+class BatchBufferRing(object):
+    """ a ring of SharedBuffers reused in turn to hold batches
+
+        note that:
+            arrays returned by 'alloc' stay valid until 'alloc' is
+            called 'size' more times
+    """
+
+    def __init__(self, mem_mgr, size):
+        """ Init
+
+            Args:
+                mem_mgr (SharedMemoryMgr): manager to allocate buffers from
+                size (int): number of buffers in the ring
+        """
+        assert size > 0, 'invalid size[%d] for BatchBufferRing' % (size)
+        self._mem_mgr = mem_mgr
+        self._buffers = [None] * size
+        self._pos = 0
+
+    def size(self):
+        """ number of buffers in the ring
+        """
+        return len(self._buffers)
+
+    def alloc(self, specs):
+        """ take the next buffer of the ring and split it into arrays
+
+            Args:
+                specs (list): (shape, dtype) of each array
+
+            Returns:
+                list of np.ndarray on the shared memory, uninitialized
+        """
+        offsets, size = specs_size(specs)
+        buff = self._buffers[self._pos]
+        if buff is None or buff.capacity() < size:
+            # grow the buffer when a larger batch comes, e.g. multi-scale training
+            if buff is not None:
+                buff.free()
+                self._buffers[self._pos] = None
+            buff = self._mem_mgr.malloc(max(size, 1))
+            buff.resize(buff.capacity())
+            self._buffers[self._pos] = buff
+        self._pos = (self._pos + 1) % len(self._buffers)
+        return split_buffer(buff.get(0, buff.capacity()), specs, offsets)
+
+    def release(self):
+        """ free all buffers in the ring
+        """
+        for i, buff in enumerate(self._buffers):
+            if buff is not None:
+                buff.free()
+                self._buffers[i] = None
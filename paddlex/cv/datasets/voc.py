@@ -26,6 +26,119 @@ from paddlex.utils import path_normalization
 from .dataset import Dataset
 from .dataset import is_pic
 from .dataset import get_encoding
+from .dataset import parallel_map
+from .dataset import copy_record
+from .record_store import DetRecordStore
+from . import ann_cache
+
+_OBJECT_PATTERN = re.compile('<object>', re.IGNORECASE)
+_SIZE_PATTERN = re.compile('<size>', re.IGNORECASE)
+_WIDTH_PATTERN = re.compile('<width>', re.IGNORECASE)
+_HEIGHT_PATTERN = re.compile('<height>', re.IGNORECASE)
+_NAME_PATTERN = re.compile('<name>', re.IGNORECASE)
+_DIFFICULT_PATTERN = re.compile('<difficult>', re.IGNORECASE)
+_BNDBOX_PATTERN = re.compile('<bndbox>', re.IGNORECASE)
+_XMIN_PATTERN = re.compile('<xmin>', re.IGNORECASE)
+_YMIN_PATTERN = re.compile('<ymin>', re.IGNORECASE)
+_XMAX_PATTERN = re.compile('<xmax>', re.IGNORECASE)
+_YMAX_PATTERN = re.compile('<ymax>', re.IGNORECASE)
+
+
+def _find_tag(pattern, element):
+    return pattern.findall(str(ET.tostringlist(element)))
+
+
+def parse_voc_xml(xml_file, cname2cid):
+    """解析单个PascalVOC格式的xml标注文件。
+
+    Args:
+        xml_file (str): xml标注文件路径。
+        cname2cid (dict): 类别名称到类别id的映射。
+
+    Returns:
+        dict: 包含以下字段的字典：
+            'xml_id' (int|None): xml中<id>字段的值，不存在时为None；
+            'im_w'/'im_h' (float): 图像宽高；
+            'gt_bbox'/'gt_class'/'difficult' (np.ndarray): 标注框、类别及difficult标记；
+            'objects' (list): 每个有效标注框的(x1, y1, x2, y2, category_id, difficult)，
+                用于生成COCO格式的标注。
+            标注文件中不存在<object>时，除'xml_id'外其余字段均为None。
+    """
+    tree = ET.parse(xml_file)
+    root = tree.getroot()
+    if tree.find('id') is None:
+        xml_id = None
+    else:
+        xml_id = int(tree.find('id').text)
+    obj_match = _find_tag(_OBJECT_PATTERN, root)
+    if len(obj_match) == 0:
+        return {
+            'xml_id': xml_id,
+            'im_w': None,
+            'im_h': None,
+            'gt_bbox': None,
+            'gt_class': None,
+            'difficult': None,
+            'objects': None
+        }
+    obj_tag = obj_match[0][1:-1]
+    objs = tree.findall(obj_tag)
+    size_tag = _find_tag(_SIZE_PATTERN, root)[0][1:-1]
+    size_element = tree.find(size_tag)
+    width_tag = _find_tag(_WIDTH_PATTERN, size_element)[0][1:-1]
+    im_w = float(size_element.find(width_tag).text)
+    height_tag = _find_tag(_HEIGHT_PATTERN, size_element)[0][1:-1]
+    im_h = float(size_element.find(height_tag).text)
+    gt_bbox = np.zeros((len(objs), 4), dtype=np.float32)
+    gt_class = np.zeros((len(objs), 1), dtype=np.int32)
+    difficult = np.zeros((len(objs), 1), dtype=np.int32)
+    objects = list()
+    for i, obj in enumerate(objs):
+        name_tag = _find_tag(_NAME_PATTERN, obj)[0][1:-1]
+        cname = obj.find(name_tag).text.strip()
+        gt_class[i][0] = cname2cid[cname]
+        diff_tag = _find_tag(_DIFFICULT_PATTERN, obj)
+        if len(diff_tag) == 0:
+            _difficult = 0
+        else:
+            diff_tag = diff_tag[0][1:-1]
+            try:
+                _difficult = int(obj.find(diff_tag).text)
+            except Exception:
+                _difficult = 0
+        box_tag = _find_tag(_BNDBOX_PATTERN, obj)
+        if len(box_tag) == 0:
+            logging.warning(
+                "There's no field '<bndbox>' in one of object, so this object will be ignored. xml file: {}".
+                format(xml_file))
+            continue
+        box_tag = box_tag[0][1:-1]
+        box_element = obj.find(box_tag)
+        xmin_tag = _find_tag(_XMIN_PATTERN, box_element)[0][1:-1]
+        x1 = float(box_element.find(xmin_tag).text)
+        ymin_tag = _find_tag(_YMIN_PATTERN, box_element)[0][1:-1]
+        y1 = float(box_element.find(ymin_tag).text)
+        xmax_tag = _find_tag(_XMAX_PATTERN, box_element)[0][1:-1]
+        x2 = float(box_element.find(xmax_tag).text)
+        ymax_tag = _find_tag(_YMAX_PATTERN, box_element)[0][1:-1]
+        y2 = float(box_element.find(ymax_tag).text)
+        x1 = max(0, x1)
+        y1 = max(0, y1)
+        if im_w > 0.5 and im_h > 0.5:
+            x2 = min(im_w - 1, x2)
+            y2 = min(im_h - 1, y2)
+        gt_bbox[i] = [x1, y1, x2, y2]
+        difficult[i][0] = _difficult
+        objects.append((x1, y1, x2, y2, cname2cid[cname], _difficult))
+    return {
+        'xml_id': xml_id,
+        'im_w': im_w,
+        'im_h': im_h,
+        'gt_bbox': gt_bbox,
+        'gt_class': gt_class,
+        'difficult': difficult,
+        'objects': objects
+    }
 
 
 class VOCDetection(Dataset):
@@ -43,6 +156,13 @@ class VOCDetection(Dataset):
         parallel_method (str): 数据集中样本在预处理过程中并行处理的方式，支持'thread'
             线程和'process'进程两种方式。默认为'process'（Windows和Mac下会强制使用thread，该参数无效）。
         shuffle (bool): 是否需要对数据集中样本打乱顺序。默认为False。
+        cache_dir (str): 标注索引缓存的保存目录。设置后首次构建数据集时会将解析后的标注编译为列式numpy数组
+            保存至该目录，之后以内存映射的方式加载；file_list、label_list内容或xml文件的修改时间发生变化时
+            缓存自动失效。默认为None，即不使用缓存。
+        num_parse_workers (int): 构建数据集时并行解析标注文件的进程数，解析结果与串行解析完全一致。
+            默认为1，即串行解析（Windows和Mac下会强制串行解析）。
+        compact_records (bool): 是否以列式numpy数组（`DetRecordStore`）保存全部样本的标注，可大幅降低
+            标注数量较多时的内存占用，且fork出的数据处理子进程可直接共享这部分内存。默认为False。
     """
 
     def __init__(self,
@@ -53,7 +173,10 @@ class VOCDetection(Dataset):
                  num_workers='auto',
                  buffer_size=100,
                  parallel_method='process',
-                 shuffle=False):
+                 shuffle=False,
+                 cache_dir=None,
+                 num_parse_workers=1,
+                 compact_records=False):
         from pycocotools.coco import COCO
         super(VOCDetection, self).__init__(
             transforms=transforms,
@@ -84,8 +207,7 @@ class VOCDetection(Dataset):
                 'id': v,
                 'name': k
             })
-        ct = 0
-        ann_ct = 0
+        samples = list()
         with open(file_list, 'r', encoding=get_encoding(file_list)) as fr:
             while True:
                 line = fr.readline()
@@ -111,118 +233,24 @@ class VOCDetection(Dataset):
                     logging.warning('The annotation file {} is not exist!'.
                                     format(xml_file))
                     continue
-                tree = ET.parse(xml_file)
-                if tree.find('id') is None:
-                    im_id = np.array([ct])
-                else:
-                    ct = int(tree.find('id').text)
-                    im_id = np.array([int(tree.find('id').text)])
-                pattern = re.compile('<object>', re.IGNORECASE)
-                obj_match = pattern.findall(
-                    str(ET.tostringlist(tree.getroot())))
-                if len(obj_match) == 0:
-                    continue
-                obj_tag = obj_match[0][1:-1]
-                objs = tree.findall(obj_tag)
-                pattern = re.compile('<size>', re.IGNORECASE)
-                size_tag = pattern.findall(
-                    str(ET.tostringlist(tree.getroot())))[0][1:-1]
-                size_element = tree.find(size_tag)
-                pattern = re.compile('<width>', re.IGNORECASE)
-                width_tag = pattern.findall(
-                    str(ET.tostringlist(size_element)))[0][1:-1]
-                im_w = float(size_element.find(width_tag).text)
-                pattern = re.compile('<height>', re.IGNORECASE)
-                height_tag = pattern.findall(
-                    str(ET.tostringlist(size_element)))[0][1:-1]
-                im_h = float(size_element.find(height_tag).text)
-                gt_bbox = np.zeros((len(objs), 4), dtype=np.float32)
-                gt_class = np.zeros((len(objs), 1), dtype=np.int32)
-                gt_score = np.ones((len(objs), 1), dtype=np.float32)
-                is_crowd = np.zeros((len(objs), 1), dtype=np.int32)
-                difficult = np.zeros((len(objs), 1), dtype=np.int32)
-                for i, obj in enumerate(objs):
-                    pattern = re.compile('<name>', re.IGNORECASE)
-                    name_tag = pattern.findall(str(ET.tostringlist(obj)))[0][
-                        1:-1]
-                    cname = obj.find(name_tag).text.strip()
-                    gt_class[i][0] = cname2cid[cname]
-                    pattern = re.compile('<difficult>', re.IGNORECASE)
-                    diff_tag = pattern.findall(str(ET.tostringlist(obj)))
-                    if len(diff_tag) == 0:
-                        _difficult = 0
-                    else:
-                        diff_tag = diff_tag[0][1:-1]
-                        try:
-                            _difficult = int(obj.find(diff_tag).text)
-                        except Exception:
-                            _difficult = 0
-                    pattern = re.compile('<bndbox>', re.IGNORECASE)
-                    box_tag = pattern.findall(str(ET.tostringlist(obj)))
-                    if len(box_tag) == 0:
-                        logging.warning(
-                            "There's no field '<bndbox>' in one of object, so this object will be ignored. xml file: {}".
-                            format(xml_file))
-                        continue
-                    box_tag = box_tag[0][1:-1]
-                    box_element = obj.find(box_tag)
-                    pattern = re.compile('<xmin>', re.IGNORECASE)
-                    xmin_tag = pattern.findall(
-                        str(ET.tostringlist(box_element)))[0][1:-1]
-                    x1 = float(box_element.find(xmin_tag).text)
-                    pattern = re.compile('<ymin>', re.IGNORECASE)
-                    ymin_tag = pattern.findall(
-                        str(ET.tostringlist(box_element)))[0][1:-1]
-                    y1 = float(box_element.find(ymin_tag).text)
-                    pattern = re.compile('<xmax>', re.IGNORECASE)
-                    xmax_tag = pattern.findall(
-                        str(ET.tostringlist(box_element)))[0][1:-1]
-                    x2 = float(box_element.find(xmax_tag).text)
-                    pattern = re.compile('<ymax>', re.IGNORECASE)
-                    ymax_tag = pattern.findall(
-                        str(ET.tostringlist(box_element)))[0][1:-1]
-                    y2 = float(box_element.find(ymax_tag).text)
-                    x1 = max(0, x1)
-                    y1 = max(0, y1)
-                    if im_w > 0.5 and im_h > 0.5:
-                        x2 = min(im_w - 1, x2)
-                        y2 = min(im_h - 1, y2)
-                    gt_bbox[i] = [x1, y1, x2, y2]
-                    is_crowd[i][0] = 0
-                    difficult[i][0] = _difficult
-                    annotations['annotations'].append({
-                        'iscrowd': 0,
-                        'image_id': int(im_id[0]),
-                        'bbox': [x1, y1, x2 - x1 + 1, y2 - y1 + 1],
-                        'area': float((x2 - x1 + 1) * (y2 - y1 + 1)),
-                        'category_id': cname2cid[cname],
-                        'id': ann_ct,
-                        'difficult': _difficult
-                    })
-                    ann_ct += 1
+                samples.append((img_file, xml_file))
 
-                im_info = {
-                    'im_id': im_id,
-                    'image_shape': np.array([im_h, im_w]).astype('int32'),
-                }
-                label_info = {
-                    'is_crowd': is_crowd,
-                    'gt_class': gt_class,
-                    'gt_bbox': gt_bbox,
-                    'gt_score': gt_score,
-                    'gt_poly': [],
-                    'difficult': difficult
-                }
-                voc_rec = (im_info, label_info)
-                if len(objs) != 0:
-                    self.file_list.append([img_file, voc_rec])
-                    ct += 1
-                    annotations['images'].append({
-                        'height': im_h,
-                        'width': im_w,
-                        'id': int(im_id[0]),
-                        'file_name': osp.split(img_file)[1]
-                    })
+        cached = None
+        if cache_dir is not None:
+            cache_key = ann_cache.get_cache_key(
+                data_dir, file_list, label_list, [s[1] for s in samples])
+            cached = ann_cache.load_det_records(cache_dir, cache_key)
+        if cached is not None:
+            store, annotations = cached
+            self.file_list = store if compact_records else store.to_list()
+        else:
+            self._build_records(samples, cname2cid, annotations,
+                                num_parse_workers)
+            if compact_records:
+                self.file_list = DetRecordStore.from_records(self.file_list)
+            if cache_dir is not None:
+                ann_cache.save_det_records(cache_dir, cache_key,
+                                           self.file_list, annotations)
 
         if not len(self.file_list) > 0:
             raise Exception('not found any voc record in %s' % (file_list))
@@ -233,6 +261,60 @@ class VOCDetection(Dataset):
         self.coco_gt.dataset = annotations
         self.coco_gt.createIndex()
 
+    def _build_records(self,
+                       samples,
+                       cname2cid,
+                       annotations,
+                       num_parse_workers=1):
+        recs = parallel_map(parse_voc_xml,
+                            [(xml_file, cname2cid) for _, xml_file in samples],
+                            num_parse_workers)
+        ct = 0
+        ann_ct = 0
+        for (img_file, xml_file), rec in zip(samples, recs):
+            if rec['xml_id'] is not None:
+                ct = rec['xml_id']
+            im_id = np.array([ct])
+            if rec['objects'] is None:
+                continue
+            im_w = rec['im_w']
+            im_h = rec['im_h']
+            num_objs = len(rec['gt_bbox'])
+            for x1, y1, x2, y2, cid, _difficult in rec['objects']:
+                annotations['annotations'].append({
+                    'iscrowd': 0,
+                    'image_id': int(im_id[0]),
+                    'bbox': [x1, y1, x2 - x1 + 1, y2 - y1 + 1],
+                    'area': float((x2 - x1 + 1) * (y2 - y1 + 1)),
+                    'category_id': cid,
+                    'id': ann_ct,
+                    'difficult': _difficult
+                })
+                ann_ct += 1
+
+            im_info = {
+                'im_id': im_id,
+                'image_shape': np.array([im_h, im_w]).astype('int32'),
+            }
+            label_info = {
+                'is_crowd': np.zeros((num_objs, 1), dtype=np.int32),
+                'gt_class': rec['gt_class'],
+                'gt_bbox': rec['gt_bbox'],
+                'gt_score': np.ones((num_objs, 1), dtype=np.float32),
+                'gt_poly': [],
+                'difficult': rec['difficult']
+            }
+            voc_rec = (im_info, label_info)
+            if num_objs != 0:
+                self.file_list.append([img_file, voc_rec])
+                ct += 1
+                annotations['images'].append({
+                    'height': im_h,
+                    'width': im_w,
+                    'id': int(im_id[0]),
+                    'file_name': osp.split(img_file)[1]
+                })
+
     def add_negative_samples(self, image_dir):
         """将背景图片加入训练
 
@@ -280,25 +362,27 @@ class VOCDetection(Dataset):
     def iterator(self):
         self._epoch += 1
         self._pos = 0
-        files = copy.deepcopy(self.file_list)
-        if self.shuffle:
-            random.shuffle(files)
-        files = files[:self.num_samples]
-        self.num_samples = len(files)
-        for f in files:
+        indices = self.epoch_indices()
+        for idx in indices:
+            f = self.file_list[idx]
             records = f[1]
-            im_info = copy.deepcopy(records[0])
-            label_info = copy.deepcopy(records[1])
+            im_info = copy_record(records[0])
+            label_info = copy_record(records[1])
             im_info['epoch'] = self._epoch
             if self.num_samples > 1:
                 mix_idx = random.randint(1, self.num_samples - 1)
                 mix_pos = (mix_idx + self._pos) % self.num_samples
             else:
                 mix_pos = 0
-            im_info['mixup'] = [
-                files[mix_pos][0], copy.deepcopy(files[mix_pos][1][0]),
-                copy.deepcopy(files[mix_pos][1][1])
-            ]
+            mix_f = self.file_list[indices[mix_pos]]
+            if getattr(self.transforms, 'mixup_buffer', None) is not None:
+                # 缓冲区mixup时该图像只在缓冲区为空时使用，由transforms在使用时复制标注
+                im_info['mixup'] = [mix_f[0], mix_f[1][0], mix_f[1][1]]
+            else:
+                im_info['mixup'] = [
+                    mix_f[0], copy_record(mix_f[1][0]),
+                    copy_record(mix_f[1][1])
+                ]
             self._pos += 1
             sample = [f[0], im_info, label_info]
             yield sample
@@ -22,11 +22,13 @@ import math
 import yaml
 import copy
 import json
+import hashlib
 import functools
 import multiprocessing as mp
 import paddlex.utils.logging as logging
 from paddlex.utils import seconds_to_hms
 from paddlex.utils.utils import EarlyStop
+from paddlex.utils.result_cache import ResultCache, transforms_signature
 from paddlex.cv.transforms import arrange_transforms
 import paddlex
 from collections import OrderedDict
@@ -81,12 +83,66 @@ class BaseAPI:
         # 主要用于batch_predict接口
         thread_num = mp.cpu_count() if mp.cpu_count() < 8 else 8
         self.thread_pool = mp.pool.ThreadPool(thread_num)
+        # predict接口的结果缓存，通过set_result_cache开启
+        self.result_cache = None
 
     def reset_thread_pool(self, thread_num):
         self.thread_pool.close()
         self.thread_pool.join()
         self.thread_pool = mp.pool.ThreadPool(thread_num)
 
+    def set_result_cache(self, max_size=1024, ttl=None, cache_dir=None):
+        """开启predict接口的结果缓存，重复提交的图像（文件内容或像素数据相同）直接返回缓存的结果。
+
+        缓存不感知之后的参数更新，继续训练或重新加载参数后需再次调用本接口。
+
+        Args:
+            max_size (int): 内存中最多缓存的结果数，为0时关闭缓存。默认为1024。
+            ttl (float): 结果的有效时间（秒）。默认为None，即不过期。
+            cache_dir (str): 磁盘缓存目录，内存中未命中时从磁盘读取。默认为None，即只使用内存缓存。
+        """
+        if max_size <= 0 and cache_dir is None:
+            self.result_cache = None
+            return
+        namespace = self.__class__.__name__
+        if cache_dir is not None:
+            # 磁盘缓存可能被其他模型共用，以模型参数的哈希值区分
+            namespace += ':' + self._params_signature()
+        self.result_cache = ResultCache(
+            max_size=max_size,
+            ttl=ttl,
+            cache_dir=cache_dir,
+            namespace=namespace)
+
+    def _params_signature(self):
+        h = hashlib.blake2b(digest_size=16)
+        for var in sorted(
+                self.test_prog.list_vars(), key=lambda v: v.name):
+            if not var.persistable:
+                continue
+            scope_var = self.scope.find_var(var.name)
+            if scope_var is None:
+                continue
+            try:
+                value = np.array(scope_var.get_tensor())
+            except Exception:
+                continue
+            h.update(var.name.encode())
+            h.update(value.tobytes())
+        return h.hexdigest()
+
+    def _lookup_result(self, img_file, transforms, *extra):
+        cache = getattr(self, 'result_cache', None)
+        if cache is None:
+            return None, None
+        key = cache.key(img_file, transforms_signature(transforms), *extra)
+        return key, cache.get(key)
+
+    def _store_result(self, key, result):
+        if key is not None:
+            self.result_cache.put(key, result)
+        return result
+
     def _get_single_card_bs(self, batch_size):
         if batch_size % len(self.places) == 0:
             return int(batch_size // len(self.places))
@@ -550,6 +606,15 @@ class BaseAPI:
                     records, axis=0)))
             logging.info('[TRAIN] Epoch {} finished, {} .'.format(
                 i + 1, dict2str(train_metrics)))
+            profiler = getattr(train_dataset.transforms, 'profiler', None)
+            if profiler is not None:
+                # 输出数据处理流程的性能统计
+                logging.info('[TRAIN] Transforms profile:\n{}'.format(
+                    profiler.report()))
+                if use_vdl:
+                    profiler.add_scalars(
+                        log_writer, i + 1,
+                        '{}-Transforms'.format(task_id))
             time_train_one_epoch = time.time() - epoch_start_time
             epoch_start_time = time.time()
 
@@ -24,6 +24,7 @@ from paddlex.utils import seconds_to_hms
 import paddlex
 from paddlex.cv.transforms import arrange_transforms
 from paddlex.cv.datasets import generate_minibatch
+from paddlex.cv.datasets import pack_images
 from collections import OrderedDict
 from .base import BaseAPI
 
@@ -283,7 +284,8 @@ class BaseClassifier(BaseAPI):
                     transforms,
                     model_type,
                     class_name,
-                    thread_pool=None):
+                    thread_pool=None,
+                    alloc=None):
         arrange_transforms(
             model_type=model_type,
             class_name=class_name,
@@ -295,8 +297,11 @@ class BaseClassifier(BaseAPI):
             batch_data = list()
             for image in images:
                 batch_data.append(transforms(image))
-        padding_batch = generate_minibatch(batch_data)
-        im = np.array([data[0] for data in padding_batch])
+        if alloc is not None:
+            padding_batch, im = pack_images(batch_data, alloc)
+        else:
+            padding_batch = generate_minibatch(batch_data)
+            im = np.array([data[0] for data in padding_batch])
 
         return im
 
@@ -334,6 +339,9 @@ class BaseClassifier(BaseAPI):
 
         if transforms is None:
             transforms = self.test_transforms
+        key, cached = self._lookup_result(img_file, transforms, topk)
+        if cached is not None:
+            return cached
         im = BaseClassifier._preprocess(images, transforms, self.model_type,
                                         self.__class__.__name__)
 
@@ -345,7 +353,7 @@ class BaseClassifier(BaseAPI):
 
         preds = BaseClassifier._postprocess(result, true_topk, self.labels)
 
-        return preds[0]
+        return self._store_result(key, preds[0])
 
     def batch_predict(self, img_file_list, transforms=None, topk=1):
         """预测。
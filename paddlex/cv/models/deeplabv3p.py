@@ -24,6 +24,7 @@ import paddlex.utils.logging as logging
 import paddlex
 from paddlex.cv.transforms import arrange_transforms
 from paddlex.cv.datasets import generate_minibatch
+from paddlex.cv.datasets import pack_images
 from paddlex.cv.transforms.seg_transforms import Compose
 from collections import OrderedDict
 from .base import BaseAPI
@@ -460,7 +461,8 @@ class DeepLabv3p(BaseAPI):
                     model_type,
                     class_name,
                     thread_pool=None,
-                    input_channel=3):
+                    input_channel=3,
+                    alloc=None):
         arrange_transforms(
             model_type=model_type,
             class_name=class_name,
@@ -473,10 +475,13 @@ class DeepLabv3p(BaseAPI):
             batch_data = list()
             for image in images:
                 batch_data.append(transforms(image))
-        padding_batch = generate_minibatch(batch_data)
-        im = np.array(
-            [data[0] for data in padding_batch],
-            dtype=padding_batch[0][0].dtype)
+        if alloc is not None:
+            padding_batch, im = pack_images(batch_data, alloc)
+        else:
+            padding_batch = generate_minibatch(batch_data)
+            im = np.array(
+                [data[0] for data in padding_batch],
+                dtype=padding_batch[0][0].dtype)
         im_info = [data[1] for data in padding_batch]
         return im, im_info
 
@@ -525,6 +530,9 @@ class DeepLabv3p(BaseAPI):
 
         if transforms is None:
             transforms = self.test_transforms
+        key, cached = self._lookup_result(img_file, transforms)
+        if cached is not None:
+            return cached
         input_channel = getattr(self, 'input_channel', 3)
         im, im_info = DeepLabv3p._preprocess(
             images,
@@ -540,7 +548,7 @@ class DeepLabv3p(BaseAPI):
                                   use_program_cache=True)
 
         preds = DeepLabv3p._postprocess(result, im_info)
-        return preds[0]
+        return self._store_result(key, preds[0])
 
     def batch_predict(self, img_file_list, transforms=None):
         """预测。
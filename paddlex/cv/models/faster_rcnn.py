@@ -24,6 +24,7 @@ import os.path as osp
 import copy
 from paddlex.cv.transforms import arrange_transforms
 from paddlex.cv.datasets import generate_minibatch
+from paddlex.cv.datasets import pack_images
 from .base import BaseAPI
 from collections import OrderedDict
 from .utils.detection_eval import eval_results, bbox2out
@@ -488,7 +489,8 @@ class FasterRCNN(BaseAPI):
                     model_type,
                     class_name,
                     thread_pool=None,
-                    input_channel=3):
+                    input_channel=3,
+                    alloc=None):
         arrange_transforms(
             model_type=model_type,
             class_name=class_name,
@@ -501,8 +503,11 @@ class FasterRCNN(BaseAPI):
             batch_data = list()
             for image in images:
                 batch_data.append(transforms(image))
-        padding_batch = generate_minibatch(batch_data)
-        im = np.array([data[0] for data in padding_batch])
+        if alloc is not None:
+            padding_batch, im = pack_images(batch_data, alloc)
+        else:
+            padding_batch = generate_minibatch(batch_data)
+            im = np.array([data[0] for data in padding_batch])
         im_resize_info = np.array([data[1] for data in padding_batch])
         im_shape = np.array([data[2] for data in padding_batch])
 
@@ -542,6 +547,9 @@ class FasterRCNN(BaseAPI):
 
         if transforms is None:
             transforms = self.test_transforms
+        key, cached = self._lookup_result(img_file, transforms)
+        if cached is not None:
+            return cached
         input_channel = getattr(self, 'input_channel', 3)
         im, im_resize_info, im_shape = FasterRCNN._preprocess(
             images,
@@ -571,7 +579,7 @@ class FasterRCNN(BaseAPI):
                                         len(images), self.num_classes,
                                         self.labels)
 
-        return preds[0]
+        return self._store_result(key, preds[0])
 
     def batch_predict(self, img_file_list, transforms=None):
         """预测。
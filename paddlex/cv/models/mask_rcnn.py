@@ -390,6 +390,9 @@ class MaskRCNN(FasterRCNN):
 
         if transforms is None:
             transforms = self.test_transforms
+        key, cached = self._lookup_result(img_file, transforms)
+        if cached is not None:
+            return cached
         input_channel = getattr(self, 'input_channel', 3)
         im, im_resize_info, im_shape = FasterRCNN._preprocess(
             images,
@@ -420,7 +423,7 @@ class MaskRCNN(FasterRCNN):
                                       len(images), self.num_classes,
                                       self.mask_head_resolution, self.labels)
 
-        return preds[0]
+        return self._store_result(key, preds[0])
 
     def batch_predict(self, img_file_list, transforms=None):
         """预测。
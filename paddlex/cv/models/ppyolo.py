@@ -27,6 +27,7 @@ import paddlex
 import copy
 from paddlex.cv.transforms import arrange_transforms
 from paddlex.cv.datasets import generate_minibatch
+from paddlex.cv.datasets import pack_images
 from .base import BaseAPI
 from collections import OrderedDict
 from .utils.detection_eval import eval_results, bbox2out
@@ -461,7 +462,8 @@ class PPYOLO(BaseAPI):
                     model_type,
                     class_name,
                     thread_pool=None,
-                    input_channel=3):
+                    input_channel=3,
+                    alloc=None):
         arrange_transforms(
             model_type=model_type,
             class_name=class_name,
@@ -474,10 +476,13 @@ class PPYOLO(BaseAPI):
             batch_data = list()
             for image in images:
                 batch_data.append(transforms(image))
-        padding_batch = generate_minibatch(batch_data)
-        im = np.array(
-            [data[0] for data in padding_batch],
-            dtype=padding_batch[0][0].dtype)
+        if alloc is not None:
+            padding_batch, im = pack_images(batch_data, alloc)
+        else:
+            padding_batch = generate_minibatch(batch_data)
+            im = np.array(
+                [data[0] for data in padding_batch],
+                dtype=padding_batch[0][0].dtype)
         im_size = np.array([data[1] for data in padding_batch], dtype=np.int32)
 
         return im, im_size
@@ -516,6 +521,9 @@ class PPYOLO(BaseAPI):
 
         if transforms is None:
             transforms = self.test_transforms
+        key, cached = self._lookup_result(img_file, transforms)
+        if cached is not None:
+            return cached
         input_channel = getattr(self, 'input_channel', 3)
         im, im_size = PPYOLO._preprocess(
             images,
@@ -540,7 +548,7 @@ class PPYOLO(BaseAPI):
             [[i] for i in range(len(images))]).astype('int32'), [[]])
         preds = PPYOLO._postprocess(res,
                                     len(images), self.num_classes, self.labels)
-        return preds[0]
+        return self._store_result(key, preds[0])
 
     def batch_predict(self, img_file_list, transforms=None):
         """预测。
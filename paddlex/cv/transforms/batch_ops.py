@@ -0,0 +1,435 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import cv2
+
+interp_dict = {
+    'NEAREST': cv2.INTER_NEAREST,
+    'LINEAR': cv2.INTER_LINEAR,
+    'CUBIC': cv2.INTER_CUBIC,
+    'AREA': cv2.INTER_AREA,
+    'LANCZOS4': cv2.INTER_LANCZOS4
+}
+
+
+def stack_images(batch_data):
+    """将batch数据中的图像（各样本的第一个字段）组成连续的batch数组。
+
+    图像已经是同一个连续batch数组的各个切片时（如经过了其它batch操作），直接返回该数组。
+
+    Args:
+        batch_data (list): 由与图像相关的各种信息组成的batch数据。
+
+    Returns:
+        np.ndarray: 形状为(N, ...)的连续数组；各图像形状不一致时返回None。
+    """
+    first = batch_data[0][0]
+    base = first.base
+    if (base is not None and base.ndim == first.ndim + 1 and
+            base.shape[0] == len(batch_data) and
+            base.shape[1:] == first.shape and base.flags.c_contiguous):
+        start = base.__array_interface__['data'][0]
+        step = base.strides[0]
+        if all(data[0].base is base and data[0].__array_interface__['data'][0]
+               == start + i * step for i, data in enumerate(batch_data)):
+            return base
+    if any(data[0].shape != first.shape for data in batch_data):
+        return None
+    return np.stack([data[0] for data in batch_data])
+
+
+def unstack_images(batch_data, images, field=0):
+    """将batch数组的各个切片写回batch数据中各样本的第`field`个字段。
+    """
+    for i, data in enumerate(batch_data):
+        data_list = list(data)
+        data_list[field] = images[i]
+        batch_data[i] = tuple(data_list)
+    return batch_data
+
+
+def resize_batch(images,
+                 target_size,
+                 interp=cv2.INTER_LINEAR,
+                 data_format='NCHW'):
+    """将一个batch的图像resize到同一大小，结果写入一个新的连续batch数组。
+
+    NCHW格式逐个通道平面调用cv2.resize并直接写入输出数组，避免了逐张图像
+    转置为HWC、再转回CHW及最后组batch时的拷贝。
+
+    Args:
+        images (np.ndarray|list): 形状为(N, C, H, W)或(N, H, W, C)的batch图像，
+            或由N张CHW（HWC）图像组成的list，各图像的大小可以不同。
+        target_size (int|list|tuple): resize后的大小，为int时表示(target_size, target_size)，
+            为list或tuple时表示(w, h)。
+        interp (int): opencv的插值方式。默认为cv2.INTER_LINEAR。
+        data_format (str): batch图像的格式，为'NCHW'或'NHWC'。默认为'NCHW'。
+
+    Returns:
+        np.ndarray: resize后的连续batch数组。
+    """
+    if isinstance(target_size, (list, tuple)):
+        w, h = target_size
+    else:
+        w = h = int(target_size)
+    n = len(images)
+    if data_format == 'NCHW':
+        c = images[0].shape[0]
+        out = np.empty((n, c, h, w), dtype=images[0].dtype)
+        for i in range(n):
+            for j in range(c):
+                cv2.resize(
+                    images[i][j], (w, h), dst=out[i, j], interpolation=interp)
+    elif data_format == 'NHWC':
+        c = images[0].shape[2]
+        out = np.empty((n, h, w, c), dtype=images[0].dtype)
+        for i in range(n):
+            im = cv2.resize(images[i], (w, h), interpolation=interp)
+            out[i] = im.reshape(h, w, -1)
+    else:
+        raise ValueError("data_format should be 'NCHW' or 'NHWC'")
+    return out
+
+
+def normalize_batch(images,
+                    mean,
+                    std,
+                    min_value=[0, 0, 0],
+                    max_value=[255, 255, 255],
+                    data_format='NCHW'):
+    """对一个batch的图像进行标准化，结果与逐张图像调用`ops.normalize`完全一致。
+
+    uint8图像逐通道查表，其它类型的图像逐通道在整个batch上计算。
+
+    Args:
+        images (np.ndarray): 形状为(N, C, H, W)或(N, H, W, C)的batch图像。
+        mean (list): 图像数据集的均值。
+        std (list): 图像数据集的标准差。
+        min_value (list): 图像中可能的最小值。默认为[0, 0, 0]。
+        max_value (list): 图像中可能的最大值。默认为[255, 255, 255]。
+        data_format (str): batch图像的格式，为'NCHW'或'NHWC'。默认为'NCHW'。
+
+    Returns:
+        np.ndarray: 标准化后float32类型的连续batch数组。
+    """
+    axis = 1 if data_format == 'NCHW' else 3
+    out = np.empty(images.shape, dtype='float32')
+    if images.dtype == np.uint8:
+        values = np.arange(256, dtype='float64')
+    for c in range(images.shape[axis]):
+        index = (slice(None), ) * axis + (c, )
+        range_value = max_value[c] - min_value[c]
+        if images.dtype == np.uint8:
+            lut = (((values - min_value[c]) / range_value - mean[c]) /
+                   std[c]).astype('float32')
+            np.take(lut, images[index], out=out[index])
+        else:
+            # 与ops.normalize相同，以float64计算
+            out[index] = ((images[index].astype('float64') - min_value[c]) /
+                          range_value - mean[c]) / std[c]
+    return out
+
+
+def flip_batch(images, mask, data_format='NCHW'):
+    """水平翻转batch中`mask`为True的图像（原地修改）。
+
+    Args:
+        images (np.ndarray): 形状为(N, C, H, W)或(N, H, W, C)的batch图像。
+        mask (np.ndarray): 长度为N的bool数组，表示各图像是否翻转。
+        data_format (str): batch图像的格式，为'NCHW'或'NHWC'。默认为'NCHW'。
+
+    Returns:
+        np.ndarray: 翻转后的batch图像。
+    """
+    if mask.any():
+        if data_format == 'NCHW':
+            images[mask] = images[mask][..., ::-1]
+        else:
+            images[mask] = images[mask][:, :, ::-1]
+    return images
+
+
+def distort_batch(images,
+                  brightness=None,
+                  contrast=None,
+                  saturation=None,
+                  hue=None,
+                  data_format='NCHW'):
+    """以各图像各自的参数，对一个batch的图像依次调整亮度、对比度、饱和度及色调。
+
+    与`ops`中对应的单张图像操作的计算方式一致，参数为None时不进行该项调整。
+
+    Args:
+        images (np.ndarray): 形状为(N, 3, H, W)或(N, H, W, 3)的RGB batch图像。
+        brightness (np.ndarray): 长度为N的亮度偏移量，为0时不调整。默认为None。
+        contrast (np.ndarray): 长度为N的对比度系数，为1时不调整。默认为None。
+        saturation (np.ndarray): 长度为N的饱和度系数，为1时不调整。默认为None。
+        hue (np.ndarray): 长度为N的色调调整量（ops.hue中的delta），默认为None。
+
+    Returns:
+        np.ndarray: 调整后float32类型的连续batch数组。
+    """
+    nchw = data_format == 'NCHW'
+    n = images.shape[0]
+    if nchw:
+        im = images.reshape(n, 3, -1).astype('float32')
+    else:
+        im = images.reshape(n, -1, 3).astype('float32')
+    if brightness is not None:
+        im += np.asarray(brightness, dtype='float32').reshape(n, 1, 1)
+    if contrast is not None:
+        im *= np.asarray(contrast, dtype='float32').reshape(n, 1, 1)
+    if saturation is not None:
+        weights = np.array([0.299, 0.587, 0.114], dtype='float32')
+        if nchw:
+            gray = np.einsum('c,ncl->nl', weights, im)[:, np.newaxis, :]
+        else:
+            gray = np.einsum('c,nlc->nl', weights, im)[:, :, np.newaxis]
+        alpha = np.asarray(saturation, dtype='float32').reshape(n, 1, 1)
+        im *= alpha
+        im += gray * (1 - alpha)
+    if hue is not None:
+        hue = np.asarray(hue, dtype='float64')
+        u = np.cos(hue * np.pi)
+        w = np.sin(hue * np.pi)
+        bt = np.zeros((n, 3, 3))
+        bt[:, 0, 0] = 1
+        bt[:, 1, 1] = bt[:, 2, 2] = u
+        bt[:, 1, 2] = -w
+        bt[:, 2, 1] = w
+        tyiq = np.array([[0.299, 0.587, 0.114], [0.596, -0.274, -0.321],
+                         [0.211, -0.523, 0.311]])
+        ityiq = np.array([[1.0, 0.956, 0.621], [1.0, -0.272, -0.647],
+                          [1.0, -1.107, 1.705]])
+        t = np.matmul(np.matmul(ityiq, bt), tyiq)
+        # 不调整色调的图像使用单位矩阵，保持数值不变
+        t[hue == 0] = np.eye(3)
+        t = t.astype('float32')
+        if nchw:
+            im = np.matmul(t, im)
+        else:
+            im = np.matmul(im, t.transpose(0, 2, 1))
+    return np.ascontiguousarray(im).reshape(images.shape)
+
+
+class BatchResize(object):
+    """将batch数据中的所有图像resize到同一大小。
+
+    在整个batch上进行resize，结果保存在一个连续的batch数组中，需在Arrange之后
+    （图像为CHW格式）通过`batch_transforms`使用。标注为(1, H, W)数组的分割任务中，
+    标注图同时以最近邻插值resize。
+
+    Args:
+        target_size (int|list|tuple): resize后的大小，为int时表示(target_size, target_size)，
+            为list或tuple时表示(w, h)。
+        interp (str): resize的插值方式，与opencv的插值方式对应，取值范围为
+            ['NEAREST', 'LINEAR', 'CUBIC', 'AREA', 'LANCZOS4']。默认为"LINEAR"。
+
+    Raises:
+        ValueError: 插值方式不在['NEAREST', 'LINEAR', 'CUBIC', 'AREA', 'LANCZOS4']中。
+    """
+
+    def __init__(self, target_size, interp='LINEAR'):
+        if interp not in interp_dict:
+            raise ValueError("interp should be one of {}".format(
+                interp_dict.keys()))
+        self.target_size = target_size
+        self.interp = interp
+
+    def __call__(self, batch_data):
+        """
+        Args:
+            batch_data (list): 由与图像相关的各种信息组成的batch数据。
+        Returns:
+            list: 由与图像相关的各种信息组成的batch数据。
+        """
+        images = resize_batch([data[0] for data in batch_data],
+                              self.target_size, interp_dict[self.interp])
+        unstack_images(batch_data, images)
+        if len(batch_data[0]) > 1 and _is_label_map(batch_data[0][1]):
+            dtype = batch_data[0][1].dtype
+            labels = resize_batch(
+                [data[1].astype('int32') for data in batch_data],
+                self.target_size, cv2.INTER_NEAREST).astype(dtype)
+            unstack_images(batch_data, labels, field=1)
+        return batch_data
+
+
+class BatchNormalize(object):
+    """对batch数据中的所有图像进行标准化，结果与逐张图像使用Normalize完全一致。
+
+    需在Arrange之后（图像为CHW格式）通过`batch_transforms`使用，此时逐样本的
+    transforms中不再包含Normalize。uint8图像在整个batch上逐通道查表标准化。
+
+    Args:
+        mean (list): 图像数据集的均值。默认为[0.485, 0.456, 0.406]。
+        std (list): 图像数据集的标准差。默认为[0.229, 0.224, 0.225]。
+        min_value (list): 图像中可能的最小值。默认为[0, 0, 0]。
+        max_value (list): 图像中可能的最大值。默认为[255, 255, 255]。
+
+    Raises:
+        ValueError: mean或std不是list对象，或std包含0。
+    """
+
+    def __init__(self,
+                 mean=[0.485, 0.456, 0.406],
+                 std=[0.229, 0.224, 0.225],
+                 min_value=[0, 0, 0],
+                 max_value=[255, 255, 255]):
+        self.mean = mean
+        self.std = std
+        self.min_value = min_value
+        self.max_value = max_value
+        if not (isinstance(self.mean, list) and isinstance(self.std, list)):
+            raise ValueError("{}: input type is invalid.".format(self))
+        from functools import reduce
+        if reduce(lambda x, y: x * y, self.std) == 0:
+            raise ValueError('{}: std is invalid!'.format(self))
+
+    def __call__(self, batch_data):
+        """
+        Args:
+            batch_data (list): 由与图像相关的各种信息组成的batch数据。
+        Returns:
+            list: 由与图像相关的各种信息组成的batch数据。
+        """
+        images = stack_images(batch_data)
+        if images is None:
+            for i, data in enumerate(batch_data):
+                im = normalize_batch(data[0][np.newaxis], self.mean, self.std,
+                                     self.min_value, self.max_value)
+                batch_data[i] = (im[0], ) + tuple(data[1:])
+            return batch_data
+        images = normalize_batch(images, self.mean, self.std, self.min_value,
+                                 self.max_value)
+        return unstack_images(batch_data, images)
+
+
+class BatchRandomHorizontalFlip(object):
+    """以一定的概率对batch数据中的图像进行水平翻转，各图像独立采样。
+
+    需在Arrange之后（图像为CHW格式）通过`batch_transforms`使用，标注为(1, H, W)数组的
+    分割任务中，标注图同时翻转。检测任务的标注框不随之翻转，请使用逐样本的RandomHorizontalFlip。
+
+    Args:
+        prob (float): 随机水平翻转的概率。默认为0.5。
+    """
+
+    def __init__(self, prob=0.5):
+        self.prob = prob
+
+    def __call__(self, batch_data):
+        """
+        Args:
+            batch_data (list): 由与图像相关的各种信息组成的batch数据。
+        Returns:
+            list: 由与图像相关的各种信息组成的batch数据。
+        """
+        mask = np.random.uniform(size=len(batch_data)) < self.prob
+        if not mask.any():
+            return batch_data
+        images = stack_images(batch_data)
+        if images is None:
+            for i, data in enumerate(batch_data):
+                if mask[i]:
+                    batch_data[i] = (data[0][..., ::-1].copy(),
+                                     ) + tuple(data[1:])
+        else:
+            if not images.flags.writeable:
+                images = images.copy()
+            unstack_images(batch_data, flip_batch(images, mask))
+        for i, data in enumerate(batch_data):
+            if mask[i] and len(data) > 1 and _is_label_map(data[1]):
+                batch_data[i] = (data[0], data[1][..., ::-1].copy()
+                                 ) + tuple(data[2:])
+        return batch_data
+
+
+class BatchRandomDistort(object):
+    """对batch数据中的图像以一定的概率调整亮度、对比度、饱和度和色调，各图像独立采样参数。
+
+    与逐样本的RandomDistort相比，四种调整以固定的顺序（亮度、对比度、饱和度、色调）
+    在整个batch上完成。需在Arrange之后（图像为CHW格式的RGB图像）、Normalize之前使用，
+    即逐样本的transforms中不包含Normalize，由BatchNormalize在其后完成标准化。
+
+    Args:
+        brightness_range (float): 明亮度因子的范围。默认为0.5。
+        brightness_prob (float): 随机调整明亮度的概率。默认为0.5。
+        contrast_range (float): 对比度因子的范围。默认为0.5。
+        contrast_prob (float): 随机调整对比度的概率。默认为0.5。
+        saturation_range (float): 饱和度因子的范围。默认为0.5。
+        saturation_prob (float): 随机调整饱和度的概率。默认为0.5。
+        hue_range (int): 色调因子的范围。默认为18。
+        hue_prob (float): 随机调整色调的概率。默认为0.5。
+    """
+
+    def __init__(self,
+                 brightness_range=0.5,
+                 brightness_prob=0.5,
+                 contrast_range=0.5,
+                 contrast_prob=0.5,
+                 saturation_range=0.5,
+                 saturation_prob=0.5,
+                 hue_range=18,
+                 hue_prob=0.5):
+        self.brightness_range = brightness_range
+        self.brightness_prob = brightness_prob
+        self.contrast_range = contrast_range
+        self.contrast_prob = contrast_prob
+        self.saturation_range = saturation_range
+        self.saturation_prob = saturation_prob
+        self.hue_range = hue_range
+        self.hue_prob = hue_prob
+
+    def _sample(self, n, low, high, prob, default):
+        values = np.random.uniform(low, high, size=n)
+        values[np.random.uniform(size=n) >= prob] = default
+        return values
+
+    def __call__(self, batch_data):
+        """
+        Args:
+            batch_data (list): 由与图像相关的各种信息组成的batch数据。
+        Returns:
+            list: 由与图像相关的各种信息组成的batch数据。
+        """
+        n = len(batch_data)
+        # 参数的取值范围与RandomDistort一致
+        brightness = self._sample(n, 1 - self.brightness_range,
+                                  1 + self.brightness_range,
+                                  self.brightness_prob, 0)
+        contrast = self._sample(n, 1 - self.contrast_range,
+                                1 + self.contrast_range, self.contrast_prob, 1)
+        saturation = self._sample(n, 1 - self.saturation_range,
+                                  1 + self.saturation_range,
+                                  self.saturation_prob, 1)
+        hue = self._sample(n, -self.hue_range, self.hue_range, self.hue_prob,
+                           0)
+        images = stack_images(batch_data)
+        if images is None:
+            for i, data in enumerate(batch_data):
+                im = distort_batch(data[0][np.newaxis], brightness[i:i + 1],
+                                   contrast[i:i + 1], saturation[i:i + 1],
+                                   hue[i:i + 1])
+                batch_data[i] = (im[0], ) + tuple(data[1:])
+            return batch_data
+        images = distort_batch(images, brightness, contrast, saturation, hue)
+        return unstack_images(batch_data, images)
+
+
+def _is_label_map(field):
+    # 分割任务训练时Arrange输出的标注图为(1, H, W)的数组
+    return isinstance(field, np.ndarray) and field.ndim == 3 and field.shape[
+        0] == 1
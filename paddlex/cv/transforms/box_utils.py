@@ -85,49 +85,110 @@ def crop_image(img, crop):
     return img[y1:y2, x1:x2, :]
 
 
+def crop_candidates_valid(box, crops, thresholds, cover_all_box=False):
+    """一次性判断多个候选裁剪区域是否有效。
+
+    Args:
+        box (np.ndarray): 真实标注框，形状为(n, 4)。
+        crops (np.ndarray): 候选裁剪区域，形状为(k, 4)。
+        thresholds (float|np.ndarray): 各候选区域所需的IoU阈值，为标量或形状为(k,)。
+        cover_all_box (bool): 是否要求所有真实标注框与候选区域的IoU均不小于阈值。
+
+    Returns:
+        np.ndarray: 形状为(k,)的bool数组，候选区域与真实标注框的最大IoU不小于阈值
+            （cover_all_box为True时为最小IoU），且至少有一个中心位于其中的真实标注框时为True。
+    """
+    bx1, by1, bx2, by2 = box.T
+    cx1, cy1, cx2, cy2 = np.split(crops, 4, axis=1)
+    # 形状均为(k, n)，与iou_matrix(box, crops).T的计算过程一致
+    iw = np.minimum(bx2, cx2) - np.maximum(bx1, cx1)
+    ih = np.minimum(by2, cy2) - np.maximum(by1, cy1)
+    overlap = np.logical_and(iw > 0, ih > 0)
+    area_i = iw * ih * overlap
+    area_b = (bx2 - bx1) * (by2 - by1)
+    area_c = (cx2 - cx1) * (cy2 - cy1)
+    iou = area_i / (area_b + area_c - area_i + 1e-10)
+    valid = iou.max(axis=1) >= thresholds
+    if cover_all_box:
+        valid &= iou.min(axis=1) >= thresholds
+    # 至少有一个中心位于候选区域内且裁剪后非空的真实标注框
+    x = (bx1 + bx2) / 2
+    y = (by1 + by2) / 2
+    overlap &= (cx1 <= x) & (x < cx2) & (cy1 <= y) & (y < cy2)
+    return valid & overlap.any(axis=1)
+
+
+def clip_polys(points, poly_ids, crop):
+    """使用Sutherland-Hodgman算法将多个多边形同时裁剪到矩形区域内。
+
+    Args:
+        points (np.ndarray): 所有多边形的顶点依次拼接而成的数组，形状为(m, 2)。
+        poly_ids (np.ndarray): 各顶点所属多边形的序号，形状为(m,)，同一多边形的顶点需连续存放。
+        crop (list|np.ndarray): 裁剪区域[xmin, ymin, xmax, ymax]。
+
+    Returns:
+        tuple: (points, poly_ids)，裁剪后的顶点及其所属多边形的序号，完全位于裁剪区域外的多边形不再包含顶点。
+    """
+    # 依次以x >= xmin、x <= xmax、y >= ymin、y <= ymax裁剪
+    for axis, bound, sign in [(0, crop[0], 1), (0, crop[2], -1),
+                              (1, crop[1], 1), (1, crop[3], -1)]:
+        if len(points) == 0:
+            break
+        index = np.arange(len(points))
+        starts = np.flatnonzero(np.r_[True, poly_ids[1:] != poly_ids[:-1]])
+        ends = np.r_[starts[1:], len(points)] - 1
+        next_index = index + 1
+        next_index[ends] = starts
+        cur = points
+        nxt = points[next_index]
+        cur_in = (cur[:, axis] - bound) * sign >= 0
+        nxt_in = (nxt[:, axis] - bound) * sign >= 0
+        # 每条边(cur, nxt)依次输出与边界的交点（跨越边界时）和nxt（nxt在区域内时）
+        delta = nxt[:, axis] - cur[:, axis]
+        t = (bound - cur[:, axis]) / np.where(delta == 0, 1, delta)
+        cross = cur + t[:, np.newaxis] * (nxt - cur)
+        cross[:, axis] = bound
+        candidates = np.stack([cross, nxt], axis=1).reshape(-1, 2)
+        keep = np.stack([cur_in != nxt_in, nxt_in], axis=1).reshape(-1)
+        points = candidates[keep]
+        poly_ids = np.repeat(poly_ids, 2)[keep]
+    return points, poly_ids
+
+
 def crop_segms(segms, valid_ids, crop, height, width):
-    def _crop_poly(segm, crop):
-        xmin, ymin, xmax, ymax = crop
-        crop_coord = [xmin, ymin, xmin, ymax, xmax, ymax, xmax, ymin]
-        crop_p = np.array(crop_coord).reshape(4, 2)
-        crop_p = Polygon(crop_p)
-
-        crop_segm = list()
-        for poly in segm:
-            poly = np.array(poly).reshape(len(poly) // 2, 2)
-            polygon = Polygon(poly)
-            if not polygon.is_valid:
-                exterior = polygon.exterior
-                multi_lines = exterior.intersection(exterior)
-                polygons = shapely.ops.polygonize(multi_lines)
-                polygon = MultiPolygon(polygons)
-            multi_polygon = list()
-            if isinstance(polygon, MultiPolygon):
-                multi_polygon = copy.deepcopy(polygon)
-            else:
-                multi_polygon.append(copy.deepcopy(polygon))
-            for per_polygon in multi_polygon:
-                inter = per_polygon.intersection(crop_p)
-                if not inter:
-                    continue
-                if isinstance(inter, (MultiPolygon, GeometryCollection)):
-                    for part in inter:
-                        if not isinstance(part, Polygon):
-                            continue
-                        part = np.squeeze(
-                            np.array(part.exterior.coords[:-1]).reshape(1, -1))
-                        part[0::2] -= xmin
-                        part[1::2] -= ymin
-                        crop_segm.append(part.tolist())
-                elif isinstance(inter, Polygon):
-                    crop_poly = np.squeeze(
-                        np.array(inter.exterior.coords[:-1]).reshape(1, -1))
-                    crop_poly[0::2] -= xmin
-                    crop_poly[1::2] -= ymin
-                    crop_segm.append(crop_poly.tolist())
-                else:
-                    continue
-        return crop_segm
+    def _crop_polys(segms, crop):
+        # 所有目标的所有多边形拼接后一次裁剪
+        polys = [
+            np.asarray(
+                poly, dtype=np.float64).reshape(-1, 2) for segm in segms
+            for poly in segm
+        ]
+        owners = np.repeat(
+            np.arange(len(segms)), [len(segm) for segm in segms])
+        crop_segms = [list() for _ in segms]
+        if len(polys) == 0:
+            return crop_segms
+        poly_ids = np.repeat(
+            np.arange(len(polys)), [len(poly) for poly in polys])
+        points, poly_ids = clip_polys(
+            np.concatenate(polys), poly_ids, crop)
+        if len(points) == 0:
+            return crop_segms
+        starts = np.flatnonzero(np.r_[True, poly_ids[1:] != poly_ids[:-1]])
+        ends = np.r_[starts[1:], len(points)]
+        # 鞋带公式计算面积，去除顶点数小于3或面积为0的多边形
+        next_index = np.arange(1, len(points) + 1)
+        next_index[ends - 1] = starts
+        cross = points[:, 0] * points[next_index, 1] - \
+            points[next_index, 0] * points[:, 1]
+        areas = np.add.reduceat(cross, starts)
+        points = points - np.asarray(crop[:2], dtype=np.float64)
+        for start, end, area in zip(starts, ends, areas):
+            if end - start < 3 or abs(area) < 1e-8:
+                continue
+            crop_segms[owners[poly_ids[start]]].append(points[start:end]
+                                                       .reshape(-1).tolist())
+        return crop_segms
 
     def _crop_rle(rle, crop, height, width):
         if 'counts' in rle and type(rle['counts']) == list:
@@ -137,21 +198,22 @@ def crop_segms(segms, valid_ids, crop, height, width):
         rle = mask_util.encode(np.array(mask, order='F', dtype=np.uint8))
         return rle
 
-    crop_segms = []
-    for id in valid_ids:
+    crop_segms = [None] * len(valid_ids)
+    poly_index = list()
+    for i, id in enumerate(valid_ids):
         segm = segms[id]
         if is_poly(segm):
-            import copy
-            import shapely.ops
-            import logging
-            from shapely.geometry import Polygon, MultiPolygon, GeometryCollection
-            logging.getLogger("shapely").setLevel(logging.WARNING)
             # Polygon format
-            crop_segms.append(_crop_poly(segm, crop))
+            poly_index.append(i)
         else:
             # RLE format
             import pycocotools.mask as mask_util
-            crop_segms.append(_crop_rle(segm, crop, height, width))
+            crop_segms[i] = _crop_rle(segm, crop, height, width)
+    if len(poly_index) > 0:
+        crop_polys = _crop_polys(
+            [segms[valid_ids[i]] for i in poly_index], crop)
+        for i, crop_poly in zip(poly_index, crop_polys):
+            crop_segms[i] = crop_poly
     return crop_segms
 
 
@@ -14,7 +14,12 @@
 
 from .ops import *
 from .imgaug_support import execute_imgaug
+from .image_cache import ImageCache, imread, imread_reduced
+from .profiler import TransformProfiler
+from .batch_ops import BatchResize, BatchNormalize, BatchRandomHorizontalFlip
+from .batch_ops import BatchRandomDistort
 import random
+import time
 import os.path as osp
 import numpy as np
 from PIL import Image, ImageEnhance
@@ -47,6 +52,10 @@ class Compose(ClsTransform):
                             'must be equal or larger than 1!')
         self.transforms = transforms
         self.batch_transforms = None
+        self.image_cache = None
+        self.fused = False
+        self.profiler = None
+        self.reduced_decode = False
         # 检查transforms里面的操作，目前支持PaddleX定义的或者是imgaug操作
         for op in self.transforms:
             if not isinstance(op, ClsTransform):
@@ -65,6 +74,9 @@ class Compose(ClsTransform):
             tuple: 根据网络所需字段所组成的tuple；
                 字段由transforms中的最后一个数据预处理操作决定。
         """
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
         if isinstance(im, np.ndarray):
             if len(im.shape) != 3:
                 raise Exception(
@@ -73,13 +85,29 @@ class Compose(ClsTransform):
         else:
             try:
                 im_path = im
-                im = cv2.imread(im).astype('float32')
+                target_shape = self._reduced_target_shape()
+                if target_shape is None:
+                    im = imread(im, cache=self.image_cache)
+                else:
+                    im = imread_reduced(im, target_shape,
+                                        self.image_cache)[0]
+                if not self.fused or im.dtype != np.uint8:
+                    im = im.astype('float32')
             except:
                 raise TypeError('Can\'t read The image file {}!'.format(
                     im_path))
-        im = im.astype('float32')
+        if not self.fused or im.dtype != np.uint8:
+            im = im.astype('float32')
         im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
-        for op in self.transforms:
+        if profiler is not None:
+            profiler.record(0, 'Decode', time.perf_counter() - start, None, im)
+        for i, op in enumerate(self.transforms):
+            if profiler is not None:
+                start = time.perf_counter()
+                inputs = im
+            if im.dtype == np.uint8 and type(op) not in _UINT8_TRANSFORMS:
+                # 融合流程中遇到需要float32输入的操作时再进行转换
+                im = im.astype('float32')
             if isinstance(op, ClsTransform):
                 outputs = op(im, label)
                 im = outputs[0]
@@ -92,8 +120,72 @@ class Compose(ClsTransform):
                 outputs = (im, )
                 if label is not None:
                     outputs = (im, label)
+            if profiler is not None:
+                profiler.record(i + 1,
+                                type(op).__name__,
+                                time.perf_counter() - start, inputs, im)
         return outputs
 
+    def set_image_cache(self, max_bytes):
+        """开启解码图像缓存，各epoch及各数据读取进程共享已解码的图像，只对图像文件解码一次。
+
+        缓存位于所有数据预处理/增强操作之前，超过上限时淘汰最久未使用的图像；
+        需在训练开始前设置。
+
+        Args:
+            max_bytes (int): 缓存占用内存的上限（字节），为0或None时关闭缓存。
+        """
+        self.image_cache = ImageCache(max_bytes) if max_bytes else None
+
+    def set_fused(self, fused=True):
+        """开启融合的预处理流程，减少中间结果的float32图像的分配和读写。
+
+        开启后图像解码后保持uint8，数据增强及缩放、裁剪、翻转等操作直接在uint8图像上进行
+        （亮度、对比度等颜色变换通过查找表及OpenCV的uint8运算实现），Normalize通过查表
+        一次得到float32结果；遇到其它操作时先转换为float32，之后的处理与未开启时相同。
+        uint8下每步的结果会取整并截断到[0, 255]，与float32下的结果存在少量差异；
+        裁剪、翻转及标准化的结果与未开启时完全一致。
+
+        Args:
+            fused (bool): 是否开启融合的预处理流程。默认为True。
+        """
+        self.fused = fused
+
+    def set_profile(self, profile=True):
+        """开启数据处理流程的性能统计，记录图像解码及每个操作的耗时、新分配的内存及输出的形状和数据类型，
+        同时统计多线程/多进程读取时训练进程等待数据及数据处理方等待队列的时间。
+
+        各数据读取进程的统计结果汇总在共享内存中，可通过`self.profiler.report()`获取报表；
+        训练时每个epoch结束后输出报表，开启VisualDL时同时写入各项耗时。需在开始训练前调用。
+
+        Args:
+            profile (bool): 是否开启性能统计。默认为True。
+        """
+        self.profiler = TransformProfiler() if profile else None
+
+    def set_reduced_decode(self, reduced=True):
+        """开启降低分辨率解码，第一个操作（不计Normalize）为ResizeByShort时，
+        JPEG图像在解码时即按1/2、1/4或1/8缩小。
+
+        选取最大的缩小倍数，使解码后的图像仍不小于ResizeByShort的目标大小，
+        可大幅减少大图的解码时间和内存；ResizeByShort的输出与完整解码时可能相差1个像素，
+        像素值存在少量差异。
+
+        Args:
+            reduced (bool): 是否开启降低分辨率解码。默认为True。
+        """
+        self.reduced_decode = reduced
+
+    def _reduced_target_shape(self):
+        # 返回由原图大小计算第一个缩放操作目标大小的函数，不能降低分辨率解码时返回None
+        if not self.reduced_decode:
+            return None
+        # 逐像素的Normalize与缩放的先后顺序不影响结果大小，跳过位于缩放之前的Normalize
+        ops = [op for op in self.transforms if not isinstance(op, Normalize)]
+        if len(ops) == 0 or not isinstance(ops[0], ResizeByShort):
+            return None
+        return ops[0].get_resized_shape
+
     def add_augmenters(self, augmenters):
         if not isinstance(augmenters, list):
             raise Exception(
@@ -260,6 +352,16 @@ class ResizeByShort(ClsTransform):
         self.short_size = short_size
         self.max_size = max_size
 
+    def get_resized_shape(self, h, w):
+        """计算大小为(h, w)的图像resize后的大小(h, w)。
+        """
+        im_short_size = min(h, w)
+        im_long_size = max(h, w)
+        scale = float(self.short_size) / im_short_size
+        if self.max_size > 0 and np.round(scale * im_long_size) > self.max_size:
+            scale = float(self.max_size) / float(im_long_size)
+        return int(round(h * scale)), int(round(w * scale))
+
     def __call__(self, im, label=None):
         """
         Args:
@@ -270,13 +372,8 @@ class ResizeByShort(ClsTransform):
             tuple: 当label为空时，返回的tuple为(im, )，对应图像np.ndarray数据；
                    当label不为空时，返回的tuple为(im, label)，分别对应图像np.ndarray数据、图像类别id。
         """
-        im_short_size = min(im.shape[0], im.shape[1])
-        im_long_size = max(im.shape[0], im.shape[1])
-        scale = float(self.short_size) / im_short_size
-        if self.max_size > 0 and np.round(scale * im_long_size) > self.max_size:
-            scale = float(self.max_size) / float(im_long_size)
-        resized_width = int(round(im.shape[1] * scale))
-        resized_height = int(round(im.shape[0] * scale))
+        resized_height, resized_width = self.get_resized_shape(im.shape[0],
+                                                               im.shape[1])
         im = cv2.resize(
             im, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
 
@@ -339,11 +436,15 @@ class RandomRotate(ClsTransform):
         """
         rotate_lower = -self.rotate_range
         rotate_upper = self.rotate_range
+        im_dtype = im.dtype
         im = im.astype('uint8')
         im = Image.fromarray(im)
         if np.random.uniform(0, 1) < self.prob:
             im = rotate(im, rotate_lower, rotate_upper)
-        im = np.asarray(im).astype('float32')
+        if im_dtype == np.uint8:
+            im = np.array(im)
+        else:
+            im = np.asarray(im).astype('float32')
         if label is None:
             return (im, )
         else:
@@ -435,7 +536,8 @@ class RandomDistort(ClsTransform):
             params['im'] = im
             if np.random.uniform(0, 1) < prob:
                 im = ops[id](**params)
-        im = im.astype('float32')
+        if im.dtype != np.uint8:
+            im = im.astype('float32')
         if label is None:
             return (im, )
         else:
@@ -530,3 +632,9 @@ class ComposedClsTransforms(Compose):
             ]
 
         super(ComposedClsTransforms, self).__init__(transforms)
+
+
+# 融合的预处理流程中可直接处理uint8图像的操作
+_UINT8_TRANSFORMS = (RandomCrop, RandomHorizontalFlip, RandomVerticalFlip,
+                     ResizeByShort, CenterCrop, RandomRotate, RandomDistort,
+                     Normalize)
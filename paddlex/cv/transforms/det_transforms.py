@@ -18,6 +18,8 @@ except Exception:
     from collections import Sequence
 
 import random
+import collections
+import time
 import os.path as osp
 import numpy as np
 
@@ -27,6 +29,10 @@ from PIL import Image, ImageEnhance
 from .imgaug_support import execute_imgaug
 from .ops import *
 from .box_utils import *
+from .image_cache import ImageCache, imread, imread_reduced
+from .profiler import TransformProfiler
+from .batch_ops import BatchResize, BatchNormalize, BatchRandomDistort
+from .batch_ops import unstack_images, resize_batch
 import paddlex.utils.logging as logging
 
 
@@ -56,6 +62,11 @@ class Compose(DetTransform):
                             'must be equal or larger than 1!')
         self.transforms = transforms
         self.batch_transforms = None
+        self.image_cache = None
+        self.fused = False
+        self.profiler = None
+        self.reduced_decode = False
+        self.mixup_buffer = None
         self.use_mixup = False
         for t in self.transforms:
             if type(t).__name__ == 'MixupImage':
@@ -98,9 +109,15 @@ class Compose(DetTransform):
                 字段由transforms中的最后一个数据预处理操作决定。
         """
 
-        def decode_image(im_file, im_info, label_info, input_channel=3):
+        def decode_image(im_file,
+                         im_info,
+                         label_info,
+                         input_channel=3,
+                         keep_uint8=False):
             if im_info is None:
                 im_info = dict()
+            shape = None
+            raw = None
             if isinstance(im_file, np.ndarray):
                 if len(im_file.shape) != 3:
                     raise Exception(
@@ -109,47 +126,98 @@ class Compose(DetTransform):
                 im = im_file
             else:
                 try:
-                    if input_channel == 3:
-                        im = cv2.imread(im_file).astype('float32')
+                    target_shape = self._reduced_target_shape()
+                    if input_channel == 3 and target_shape is not None:
+                        im, shape = imread_reduced(im_file, target_shape,
+                                                   self.image_cache)
+                        if not keep_uint8 or im.dtype != np.uint8:
+                            im = im.astype('float32')
+                    elif input_channel == 3:
+                        im = imread(im_file, cache=self.image_cache)
+                        raw = im
+                        if not keep_uint8 or im.dtype != np.uint8:
+                            im = im.astype('float32')
                     else:
-                        im = cv2.imread(im_file,
-                                        cv2.IMREAD_UNCHANGED).astype('float32')
+                        im = imread(
+                            im_file,
+                            cv2.IMREAD_UNCHANGED,
+                            cache=self.image_cache).astype('float32')
                         if im.ndim < 3:
                             im = np.expand_dims(im, axis=-1)
                 except:
                     raise TypeError('Can\'t read The image file {}!'.format(
                         im_file))
-            im = im.astype('float32')
+            if not keep_uint8 or im.dtype != np.uint8 or input_channel != 3:
+                im = im.astype('float32')
             if input_channel == 3:
                 im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
+            if shape is None:
+                shape = im.shape[:2]
+            elif tuple(shape) != im.shape[:2]:
+                # 降低分辨率解码时，im_info中仍记录原图的大小，
+                # 第一个缩放操作据此计算缩放比例，结果与完整解码时一致
+                im_info['reduced_decode'] = True
             # make default im_info with [h, w, 1]
             im_info['im_resize_info'] = np.array(
-                [im.shape[0], im.shape[1], 1.], dtype=np.float32)
-            im_info['image_shape'] = np.array([im.shape[0],
-                                               im.shape[1]]).astype('int32')
+                [shape[0], shape[1], 1.], dtype=np.float32)
+            im_info['image_shape'] = np.array([shape[0],
+                                               shape[1]]).astype('int32')
             if not self.use_mixup:
                 if 'mixup' in im_info:
                     del im_info['mixup']
             # decode mixup image
             if 'mixup' in im_info:
-                im_info['mixup'] = \
-                  decode_image(im_info['mixup'][0],
-                               im_info['mixup'][1],
-                               im_info['mixup'][2])
+                # paddlex.cv.datasets依赖transforms，在使用时导入
+                from paddlex.cv.datasets.dataset import copy_record
+                if im_info.get('epoch', 0) > self._mixup_epoch():
+                    # MixupImage在mixup_epoch之后不再使用mixup图像，无需解码；
+                    # 保留该字段，MixupImage中随机数的使用与之前一致
+                    im_info['mixup'] = None
+                elif self.mixup_buffer:
+                    im_info['mixup'] = self._buffered_mixup()
+                else:
+                    mixup = im_info['mixup']
+                    if self.mixup_buffer is not None:
+                        # 缓冲模式下数据集未复制mixup图像的标注，解码时会修改其中的字段
+                        mixup = [
+                            mixup[0], copy_record(mixup[1]),
+                            copy_record(mixup[2])
+                        ]
+                    im_info['mixup'] = decode_image(mixup[0], mixup[1],
+                                                    mixup[2])
+                if raw is not None and self.mixup_buffer is not None and \
+                        im_info['mixup'] is not None:
+                    # 保存解码的原始图像（后续操作不会原地修改）及标注的拷贝，供之后的样本作为mixup图像
+                    info = dict((k, v) for k, v in im_info.items()
+                                if k not in ['mixup', 'epoch'])
+                    self.mixup_buffer.append(
+                        (raw, copy_record(info), copy_record(label_info)))
             if label_info is None:
                 return (im, im_info)
             else:
                 return (im, im_info, label_info)
 
         input_channel = getattr(self, 'input_channel', 3)
-        outputs = decode_image(im, im_info, label_info, input_channel)
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        outputs = decode_image(im, im_info, label_info, input_channel,
+                               self.fused)
         im = outputs[0]
         im_info = outputs[1]
         if len(outputs) == 3:
             label_info = outputs[2]
-        for op in self.transforms:
+        if profiler is not None:
+            profiler.record(0, 'Decode', time.perf_counter() - start, None, im)
+        for i, op in enumerate(self.transforms):
             if im is None:
                 return None
+            if profiler is not None:
+                start = time.perf_counter()
+                inputs = im
+            if im.dtype == np.uint8 and type(op) not in _UINT8_TRANSFORMS:
+                # 融合流程中遇到需要float32输入的操作时再进行转换
+                im = im.astype('float32')
             if isinstance(op, DetTransform):
                 outputs = op(im, im_info, label_info)
                 im = outputs[0]
@@ -163,8 +231,111 @@ class Compose(DetTransform):
                     outputs = (im, im_info, label_info)
                 else:
                     outputs = (im, im_info)
+            if profiler is not None:
+                profiler.record(i + 1,
+                                type(op).__name__,
+                                time.perf_counter() - start, inputs, im)
+        im_info.pop('reduced_decode', None)
         return outputs
 
+    def set_image_cache(self, max_bytes):
+        """开启解码图像缓存，各epoch及各数据读取进程共享已解码的图像，只对图像文件解码一次。
+
+        缓存位于所有数据预处理/增强操作之前，超过上限时淘汰最久未使用的图像；
+        需在训练开始前设置。
+
+        Args:
+            max_bytes (int): 缓存占用内存的上限（字节），为0或None时关闭缓存。
+        """
+        self.image_cache = ImageCache(max_bytes) if max_bytes else None
+
+    def set_fused(self, fused=True):
+        """开启融合的预处理流程，减少中间结果的float32图像的分配和读写。
+
+        开启后图像解码后保持uint8，数据增强及缩放、裁剪、翻转等操作直接在uint8图像上进行
+        （亮度、对比度等颜色变换通过查找表及OpenCV的uint8运算实现），Normalize通过查表
+        一次得到float32结果；遇到其它操作时先转换为float32，之后的处理与未开启时相同。
+        uint8下每步的结果会取整并截断到[0, 255]，与float32下的结果存在少量差异；
+        裁剪、翻转及标准化的结果与未开启时完全一致。
+
+        Args:
+            fused (bool): 是否开启融合的预处理流程。默认为True。
+        """
+        self.fused = fused
+
+    def set_profile(self, profile=True):
+        """开启数据处理流程的性能统计，记录图像解码及每个操作的耗时、新分配的内存及输出的形状和数据类型，
+        同时统计多线程/多进程读取时训练进程等待数据及数据处理方等待队列的时间。
+
+        各数据读取进程的统计结果汇总在共享内存中，可通过`self.profiler.report()`获取报表；
+        训练时每个epoch结束后输出报表，开启VisualDL时同时写入各项耗时。需在开始训练前调用。
+
+        Args:
+            profile (bool): 是否开启性能统计。默认为True。
+        """
+        self.profiler = TransformProfiler() if profile else None
+
+    def set_mixup_buffer(self, buffer_size=16):
+        """开启缓冲区mixup，MixupImage所需的mixup图像从同一数据处理进程（线程）最近解码的
+        `buffer_size`个样本中随机选取，不再从磁盘读取并解码数据集分配的mixup图像。
+
+        训练时样本顺序已被打乱，最近解码的样本同样是随机的其它样本，MixupImage的统计行为不变，
+        mixup阶段每个样本只需解码一次；缓冲区为空时（如每个进程的第一个样本）仍读取数据集分配的图像。
+        缓冲区保存解码后的原始图像，会占用相应的内存。
+
+        Args:
+            buffer_size (int): 缓冲区保存的样本数，为0或None时关闭缓冲区mixup。默认为16。
+        """
+        self.mixup_buffer = collections.deque(
+            maxlen=buffer_size) if buffer_size else None
+
+    def _mixup_epoch(self):
+        mixup_epochs = [
+            op.mixup_epoch for op in self.transforms
+            if isinstance(op, MixupImage)
+        ]
+        return max(mixup_epochs) if len(mixup_epochs) > 0 else -1
+
+    def _buffered_mixup(self):
+        # 与解码数据集分配的mixup图像一致，得到float32的RGB图像
+        from paddlex.cv.datasets.dataset import copy_record
+        raw, im_info, label_info = random.choice(self.mixup_buffer)
+        im = cv2.cvtColor(raw.astype('float32'), cv2.COLOR_BGR2RGB)
+        return (im, copy_record(im_info), copy_record(label_info))
+
+    def set_reduced_decode(self, reduced=True):
+        """开启降低分辨率解码，第一个操作（不计Normalize）为Resize或ResizeByShort时，
+        JPEG图像在解码时即按1/2、1/4或1/8缩小。
+
+        选取最大的缩小倍数，使解码后的图像仍不小于第一个缩放操作的目标大小（多尺度时为其中最大的尺度），
+        可大幅减少大图的解码时间和内存。im_info中的原图大小及缩放比例按原图计算，
+        标注框无需调整，与完整解码时完全一致；缩放后图像的像素值存在少量差异。
+
+        Args:
+            reduced (bool): 是否开启降低分辨率解码。默认为True。
+        """
+        self.reduced_decode = reduced
+
+    def _reduced_target_shape(self):
+        # 返回由原图大小计算第一个缩放操作目标大小的函数，不能降低分辨率解码时返回None
+        if not self.reduced_decode or getattr(self, 'input_channel', 3) != 3:
+            return None
+        # 逐像素的Normalize与缩放的先后顺序不影响结果大小，跳过位于缩放之前的Normalize
+        ops = [op for op in self.transforms if not isinstance(op, Normalize)]
+        op = ops[0] if len(ops) > 0 else None
+        if isinstance(op, ResizeByShort):
+            short_size = op.short_size
+            if isinstance(short_size, list):
+                # 多尺度训练时按最大的尺度选取缩小倍数，随机选到的任一尺度都不会放大低分辨率解码的图像
+                short_size = max(short_size)
+            return lambda h, w: op.get_resized_shape(h, w, short_size)[:2]
+        if isinstance(op, Resize):
+            target_size = op.target_size
+            if isinstance(target_size, (list, tuple)):
+                return lambda h, w: (target_size[1], target_size[0])
+            return lambda h, w: (target_size, target_size)
+        return None
+
     def add_augmenters(self, augmenters):
         if not isinstance(augmenters, list):
             raise Exception(
@@ -208,6 +379,22 @@ class ResizeByShort(DetTransform):
         if not (isinstance(self.max_size, int)):
             raise TypeError("max_size: input type is invalid.")
 
+    def get_resized_shape(self, h, w, short_size):
+        """计算大小为(h, w)的图像以short_size为短边目标长度resize后的大小及缩放比例。
+
+        Returns:
+            tuple: resize后的图像高、宽及缩放比例。
+        """
+        im_short_size = min(h, w)
+        im_long_size = max(h, w)
+        scale = float(short_size) / im_short_size
+        if self.max_size > 0 and np.round(scale *
+                                          im_long_size) > self.max_size:
+            scale = float(self.max_size) / float(im_long_size)
+        resized_width = int(round(w * scale))
+        resized_height = int(round(h * scale))
+        return resized_height, resized_width, scale
+
     def __call__(self, im, im_info=None, label_info=None):
         """
         Args:
@@ -233,19 +420,18 @@ class ResizeByShort(DetTransform):
             raise TypeError("ResizeByShort: image type is not numpy.")
         if len(im.shape) != 3:
             raise ValueError('ResizeByShort: image is not 3-dimensional.')
-        im_short_size = min(im.shape[0], im.shape[1])
-        im_long_size = max(im.shape[0], im.shape[1])
         if isinstance(self.short_size, list):
             # Case for multi-scale training
             selected_size = random.choice(self.short_size)
         else:
             selected_size = self.short_size
-        scale = float(selected_size) / im_short_size
-        if self.max_size > 0 and np.round(scale *
-                                          im_long_size) > self.max_size:
-            scale = float(self.max_size) / float(im_long_size)
-        resized_width = int(round(im.shape[1] * scale))
-        resized_height = int(round(im.shape[0] * scale))
+        if im_info.pop('reduced_decode', False):
+            # 图像以降低的分辨率解码，按原图大小计算缩放比例
+            h, w = im_info['image_shape']
+        else:
+            h, w = im.shape[0], im.shape[1]
+        resized_height, resized_width, scale = self.get_resized_shape(
+            h, w, selected_size)
         im_resize_info = [resized_height, resized_width, scale]
         im = cv2.resize(
             im, (resized_width, resized_height),
@@ -347,7 +533,8 @@ class Padding(DetTransform):
                 'the size of image should be less than target_size, but the size of image ({}, {}), is larger than target_size ({}, {})'
                 .format(im_w, im_h, padding_im_w, padding_im_h))
         padding_im = np.zeros(
-            (padding_im_h, padding_im_w, im_c), dtype=np.float32)
+            (padding_im_h, padding_im_w, im_c),
+            dtype=np.uint8 if im.dtype == np.uint8 else np.float32)
         padding_im[:im_h, :im_w, :] = im
         if label_info is None:
             return (padding_im, im_info)
@@ -651,7 +838,8 @@ class RandomDistort(DetTransform):
 
             if np.random.uniform(0, 1) < prob:
                 im = ops[id](**params)
-        im = im.astype('float32')
+        if im.dtype != np.uint8:
+            im = im.astype('float32')
         if label_info is None:
             return (im, im_info)
         else:
@@ -874,8 +1062,12 @@ class RandomExpand(DetTransform):
             return (im, im_info, label_info)
         y = np.random.randint(0, h - height)
         x = np.random.randint(0, w - width)
-        canvas = np.ones((h, w, 3), dtype=np.float32)
-        canvas *= np.array(self.fill_value, dtype=np.float32)
+        if im.dtype == np.uint8:
+            canvas = np.empty((h, w, 3), dtype=np.uint8)
+            canvas[...] = np.round(self.fill_value)
+        else:
+            canvas = np.ones((h, w, 3), dtype=np.float32)
+            canvas *= np.array(self.fill_value, dtype=np.float32)
         canvas[y:y + height, x:x + width, :] = im
 
         im_info['image_shape'] = np.array([h, w]).astype('int32')
@@ -897,6 +1089,7 @@ class RandomCrop(DetTransform):
         (3) 计算真实标注框与候选裁剪区域IoU，若全部真实标注框的IoU都小于thresh，则继续第3步。
         (4) 如果cover_all_box为True且存在真实标注框的IoU小于thresh，则继续第3步。
         (5) 筛选出位于候选裁剪区域内的真实标注框，若有效框的个数为0，则继续第3步，否则进行第4步。
+        各阈值的全部num_attempts个候选裁剪区域一次性采样，并与全部真实标注框同时计算。
     4. 换算有效真值标注框相对候选裁剪区域的位置坐标。
     5. 换算有效分割区域相对候选裁剪区域的位置坐标。
 
@@ -969,77 +1162,74 @@ class RandomCrop(DetTransform):
         if self.allow_no_crop:
             thresholds.append('no_crop')
         np.random.shuffle(thresholds)
+        if 'no_crop' in thresholds:
+            thresholds = thresholds[:thresholds.index('no_crop')]
+        if len(thresholds) == 0:
+            return (im, im_info, label_info)
 
-        for thresh in thresholds:
-            if thresh == 'no_crop':
-                return (im, im_info, label_info)
-
-            found = False
-            for i in range(self.num_attempts):
-                scale = np.random.uniform(*self.scaling)
-                min_ar, max_ar = self.aspect_ratio
-                aspect_ratio = np.random.uniform(
-                    max(min_ar, scale**2), min(max_ar, scale**-2))
-                crop_h = int(h * scale / np.sqrt(aspect_ratio))
-                crop_w = int(w * scale * np.sqrt(aspect_ratio))
-                crop_y = np.random.randint(0, h - crop_h)
-                crop_x = np.random.randint(0, w - crop_w)
-                crop_box = [crop_x, crop_y, crop_x + crop_w, crop_y + crop_h]
-                iou = iou_matrix(
-                    gt_bbox, np.array(
-                        [crop_box], dtype=np.float32))
-                if iou.max() < thresh:
-                    continue
-
-                if self.cover_all_box and iou.min() < thresh:
-                    continue
-
-                cropped_box, valid_ids = crop_box_with_center_constraint(
-                    gt_bbox, np.array(
-                        crop_box, dtype=np.float32))
-                if valid_ids.size > 0:
-                    found = True
-                    break
-
-            if found:
-                if 'gt_poly' in label_info and len(label_info['gt_poly']) > 0:
-                    crop_polys = crop_segms(
-                        label_info['gt_poly'],
-                        valid_ids,
-                        np.array(
-                            crop_box, dtype=np.int64),
-                        h,
-                        w)
-                    if [] in crop_polys:
-                        delete_id = list()
-                        valid_polys = list()
-                        for id, crop_poly in enumerate(crop_polys):
-                            if crop_poly == []:
-                                delete_id.append(id)
-                            else:
-                                valid_polys.append(crop_poly)
-                        valid_ids = np.delete(valid_ids, delete_id)
-                        if len(valid_polys) == 0:
-                            return (im, im_info, label_info)
-                        label_info['gt_poly'] = valid_polys
+        # 为排在'no_crop'之前的各阈值一次性采样num_attempts个候选裁剪区域并同时判断是否有效，
+        # 取第一个存在有效候选区域的阈值中的第一个有效候选区域
+        num = len(thresholds) * self.num_attempts
+        scale = np.random.uniform(*self.scaling, size=num)
+        min_ar, max_ar = self.aspect_ratio
+        aspect_ratio = np.random.uniform(
+            np.maximum(min_ar, scale**2), np.minimum(max_ar, scale**-2))
+        crop_h = (h * scale / np.sqrt(aspect_ratio)).astype('int64')
+        crop_w = (w * scale * np.sqrt(aspect_ratio)).astype('int64')
+        crop_y = (np.random.uniform(size=num) * (h - crop_h)).astype('int64')
+        crop_x = (np.random.uniform(size=num) * (w - crop_w)).astype('int64')
+        crops = np.stack(
+            [crop_x, crop_y, crop_x + crop_w, crop_y + crop_h], axis=1)
+        valid = crop_candidates_valid(
+            gt_bbox,
+            crops.astype(np.float32),
+            np.repeat(thresholds, self.num_attempts),
+            self.cover_all_box).reshape(len(thresholds), self.num_attempts)
+        found = valid.any(axis=1)
+        if not found.any():
+            return (im, im_info, label_info)
+        row = np.argmax(found)
+        crop_box = crops[row * self.num_attempts + np.argmax(valid[
+            row])].tolist()
+        cropped_box, valid_ids = crop_box_with_center_constraint(
+            gt_bbox, np.array(
+                crop_box, dtype=np.float32))
+        if 'gt_poly' in label_info and len(label_info['gt_poly']) > 0:
+            crop_polys = crop_segms(
+                label_info['gt_poly'],
+                valid_ids,
+                np.array(
+                    crop_box, dtype=np.int64),
+                h,
+                w)
+            if [] in crop_polys:
+                delete_id = list()
+                valid_polys = list()
+                for id, crop_poly in enumerate(crop_polys):
+                    if crop_poly == []:
+                        delete_id.append(id)
                     else:
-                        label_info['gt_poly'] = crop_polys
-                im = crop_image(im, crop_box)
-                label_info['gt_bbox'] = np.take(cropped_box, valid_ids, axis=0)
-                label_info['gt_class'] = np.take(
-                    label_info['gt_class'], valid_ids, axis=0)
-                im_info['image_shape'] = np.array(
-                    [crop_box[3] - crop_box[1],
-                     crop_box[2] - crop_box[0]]).astype('int32')
-                if 'gt_score' in label_info:
-                    label_info['gt_score'] = np.take(
-                        label_info['gt_score'], valid_ids, axis=0)
-
-                if 'is_crowd' in label_info:
-                    label_info['is_crowd'] = np.take(
-                        label_info['is_crowd'], valid_ids, axis=0)
-                return (im, im_info, label_info)
-
+                        valid_polys.append(crop_poly)
+                valid_ids = np.delete(valid_ids, delete_id)
+                if len(valid_polys) == 0:
+                    return (im, im_info, label_info)
+                label_info['gt_poly'] = valid_polys
+            else:
+                label_info['gt_poly'] = crop_polys
+        im = crop_image(im, crop_box)
+        label_info['gt_bbox'] = np.take(cropped_box, valid_ids, axis=0)
+        label_info['gt_class'] = np.take(
+            label_info['gt_class'], valid_ids, axis=0)
+        im_info['image_shape'] = np.array(
+            [crop_box[3] - crop_box[1],
+             crop_box[2] - crop_box[0]]).astype('int32')
+        if 'gt_score' in label_info:
+            label_info['gt_score'] = np.take(
+                label_info['gt_score'], valid_ids, axis=0)
+
+        if 'is_crowd' in label_info:
+            label_info['is_crowd'] = np.take(
+                label_info['is_crowd'], valid_ids, axis=0)
         return (im, im_info, label_info)
 
 
@@ -1503,17 +1693,10 @@ class BatchRandomShape(DetTransform):
             interp = random.choice(list(self.interp_dict.keys()))
         else:
             interp = self.interp
-        for data_id, data in enumerate(batch_data):
-            data_list = list(data)
-            im = data_list[0]
-            im = np.swapaxes(im, 1, 0)
-            im = np.swapaxes(im, 1, 2)
-            im = resize(im, shape, self.interp_dict[interp])
-            im = np.swapaxes(im, 1, 2)
-            im = np.swapaxes(im, 1, 0)
-            data_list[0] = im
-            batch_data[data_id] = tuple(data_list)
-        return batch_data
+        # 在整个batch上逐通道resize，结果保存在一个连续的batch数组中
+        images = resize_batch([data[0] for data in batch_data], shape,
+                              self.interp_dict[interp])
+        return unstack_images(batch_data, images)
 
 
 class GenerateYoloTarget(object):
@@ -1559,81 +1742,81 @@ class GenerateYoloTarget(object):
         im = batch_data[0][0]
         h = im.shape[1]
         w = im.shape[2]
-        an_hw = np.array(self.anchors) / np.array([[w, h]])
+        anchors = np.array(self.anchors, dtype='float64')
+        an_hw = anchors / np.array([[w, h]])
+        # 汇总batch内所有有效的真实标注框，按(图像, 标注框)的顺序排列，
+        # 与逐个标注框写入target时的覆盖顺序一致
+        im_ids, boxes, classes, scores = [], [], [], []
         for data_id, data in enumerate(batch_data):
-            gt_bbox = data[1]
-            gt_class = data[2]
-            gt_score = data[3]
             im_shape = data[4]
-            origin_h = float(im_shape[0])
-            origin_w = float(im_shape[1])
-            data_list = list(data)
-            for i, (
-                    mask, downsample_ratio
-            ) in enumerate(zip(self.anchor_masks, self.downsample_ratios)):
-                grid_h = int(h / downsample_ratio)
-                grid_w = int(w / downsample_ratio)
-                target = np.zeros(
-                    (len(mask), 6 + self.num_classes, grid_h, grid_w),
-                    dtype=np.float32)
-                for b in range(gt_bbox.shape[0]):
-                    gx = gt_bbox[b, 0] / float(origin_w)
-                    gy = gt_bbox[b, 1] / float(origin_h)
-                    gw = gt_bbox[b, 2] / float(origin_w)
-                    gh = gt_bbox[b, 3] / float(origin_h)
-                    cls = gt_class[b]
-                    score = gt_score[b]
-                    if gw <= 0. or gh <= 0. or score <= 0.:
-                        continue
-                    # find best match anchor index
-                    best_iou = 0.
-                    best_idx = -1
-                    for an_idx in range(an_hw.shape[0]):
-                        iou = jaccard_overlap(
-                            [0., 0., gw, gh],
-                            [0., 0., an_hw[an_idx, 0], an_hw[an_idx, 1]])
-                        if iou > best_iou:
-                            best_iou = iou
-                            best_idx = an_idx
-                    gi = int(gx * grid_w)
-                    gj = int(gy * grid_h)
-                    # gtbox should be regresed in this layes if best match
-                    # anchor index in anchor mask of this layer
-                    if best_idx in mask:
-                        best_n = mask.index(best_idx)
-                        # x, y, w, h, scale
-                        target[best_n, 0, gj, gi] = gx * grid_w - gi
-                        target[best_n, 1, gj, gi] = gy * grid_h - gj
-                        target[best_n, 2, gj, gi] = np.log(
-                            gw * w / self.anchors[best_idx][0])
-                        target[best_n, 3, gj, gi] = np.log(
-                            gh * h / self.anchors[best_idx][1])
-                        target[best_n, 4, gj, gi] = 2.0 - gw * gh
-                        # objectness record gt_score
-                        target[best_n, 5, gj, gi] = score
-                        # classification
-                        target[best_n, 6 + cls, gj, gi] = 1.
-                    # For non-matched anchors, calculate the target if the iou
-                    # between anchor and gt is larger than iou_thresh
-                    if self.iou_thresh < 1:
-                        for idx, mask_i in enumerate(mask):
-                            if mask_i == best_idx: continue
-                            iou = jaccard_overlap(
-                                [0., 0., gw, gh],
-                                [0., 0., an_hw[mask_i, 0], an_hw[mask_i, 1]])
-                            if iou > self.iou_thresh:
-                                # x, y, w, h, scale
-                                target[idx, 0, gj, gi] = gx * grid_w - gi
-                                target[idx, 1, gj, gi] = gy * grid_h - gj
-                                target[idx, 2, gj, gi] = np.log(
-                                    gw * w / self.anchors[mask_i][0])
-                                target[idx, 3, gj, gi] = np.log(
-                                    gh * h / self.anchors[mask_i][1])
-                                target[idx, 4, gj, gi] = 2.0 - gw * gh
-                                # objectness record gt_score
-                                target[idx, 5, gj, gi] = score
-                                # classification
-                                target[idx, 6 + cls, gj, gi] = 1.
-                data_list.append(target)
-            batch_data[data_id] = tuple(data_list)
+            # 与标量运算的类型提升一致，坐标在float64下归一化
+            gt_bbox = data[1].astype('float64') / np.array(
+                [[float(im_shape[1]), float(im_shape[0])] * 2])
+            gt_class = np.asarray(data[2]).reshape(-1)
+            gt_score = np.asarray(data[3]).reshape(-1)
+            valid = np.flatnonzero(~((gt_bbox[:, 2] <= 0.) | (
+                gt_bbox[:, 3] <= 0.) | (gt_score <= 0.)))
+            im_ids.append(np.full(len(valid), data_id, dtype='int64'))
+            boxes.append(gt_bbox[valid])
+            classes.append(gt_class[valid])
+            scores.append(gt_score[valid])
+        im_ids = np.concatenate(im_ids)
+        boxes = np.concatenate(boxes)
+        classes = np.concatenate(classes).astype('int64')
+        scores = np.concatenate(scores)
+        gx, gy, gw, gh = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+        # 所有标注框与所有anchor的iou（两者的左上角均对齐在原点）
+        inter = np.minimum(gw[:, np.newaxis], an_hw[:, 0]) * np.minimum(
+            gh[:, np.newaxis], an_hw[:, 1])
+        ious = inter / (
+            (gw * gh)[:, np.newaxis] + an_hw[:, 0] * an_hw[:, 1] - inter)
+        best_idx = np.argmax(ious, axis=1)
+
+        targets = list()
+        for mask, downsample_ratio in zip(self.anchor_masks,
+                                          self.downsample_ratios):
+            grid_h = int(h / downsample_ratio)
+            grid_w = int(w / downsample_ratio)
+            # 整个batch的target一次性分配，每个样本使用其中的一份
+            target = np.zeros(
+                (len(batch_data), len(mask), 6 + self.num_classes, grid_h,
+                 grid_w),
+                dtype=np.float32)
+            targets.append(target)
+            mask = np.array(mask, dtype='int64')
+            # 最佳匹配anchor在当前特征层的标注框，以及iou大于阈值的其余anchor
+            hit = best_idx[:, np.newaxis] == mask
+            if self.iou_thresh < 1:
+                hit |= ious[:, mask] > self.iou_thresh
+            box_ids, n = np.nonzero(hit)
+            if len(box_ids) == 0:
+                continue
+            an_idx = mask[n]
+            x = gx[box_ids] * grid_w
+            y = gy[box_ids] * grid_h
+            gi = x.astype('int64')
+            gj = y.astype('int64')
+            bw = gw[box_ids]
+            bh = gh[box_ids]
+            # x, y, w, h, scale, objectness，同一位置有多个标注框时后者覆盖前者
+            values = np.stack(
+                [
+                    x - gi, y - gj, np.log(bw * w / anchors[an_idx, 0]),
+                    np.log(bh * h / anchors[an_idx, 1]), 2.0 - bw * bh,
+                    scores[box_ids]
+                ],
+                axis=1)
+            ids = im_ids[box_ids]
+            target[ids, n, :6, gj, gi] = values
+            # classification
+            target[ids, n, 6 + classes[box_ids], gj, gi] = 1.
+        for data_id, data in enumerate(batch_data):
+            batch_data[data_id] = tuple(data) + tuple(
+                target[data_id] for target in targets)
         return batch_data
+
+
+# 融合的预处理流程中可直接处理uint8图像的操作
+_UINT8_TRANSFORMS = (ResizeByShort, Padding, Resize, RandomHorizontalFlip,
+                     RandomDistort, MixupImage, RandomExpand, RandomCrop,
+                     Normalize)
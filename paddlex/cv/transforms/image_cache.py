@@ -0,0 +1,314 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import mmap
+import math
+import hashlib
+import multiprocessing
+import numpy as np
+import cv2
+
+# 索引表中每条记录的字段
+_KEY, _TICK, _POS, _PAGES, _DTYPE, _NDIM, _H, _W, _C = range(9)
+_NUM_FIELDS = 9
+# 计数器：访问时钟、命中次数、未命中次数、已缓存的字节数、已缓存的图像数
+_CLOCK, _HITS, _MISSES, _BYTES, _COUNT = range(5)
+_NUM_COUNTERS = 5
+# 降低分辨率解码时可用的缩小倍数，从大到小尝试
+_REDUCED_FLAGS = [(8, cv2.IMREAD_REDUCED_COLOR_8),
+                  (4, cv2.IMREAD_REDUCED_COLOR_4),
+                  (2, cv2.IMREAD_REDUCED_COLOR_2)]
+_DTYPES = [
+    np.dtype(t) for t in
+    ['uint8', 'int8', 'uint16', 'int16', 'uint32', 'int32', 'float32',
+     'float64']
+]
+
+
+class ImageCache(object):
+    """进程间共享、按字节数上限进行LRU淘汰的解码图像缓存。
+
+    缓存保存图像文件解码后的原始数据（如cv2.imread的输出），位于随机数据增强之前，
+    因此不影响数据增强的随机性，只省去重复读取和解码图像的开销。
+    图像数据及索引均保存在匿名共享内存映射（mmap）中，内存按需占用；
+    缓存需在数据读取进程创建之前（即开始训练之前）创建，fork出的进程继承后共享同一份缓存。
+
+    Args:
+        max_bytes (int): 缓存图像数据占用内存的上限（字节）。
+        max_entries (int): 最多缓存的图像数量。默认为65536。
+        page_size (int): 内存分配的最小单位（字节）。默认为64KB。
+    """
+
+    def __init__(self, max_bytes, max_entries=65536, page_size=64 * 1024):
+        from paddlex.cv.datasets.shared_queue.sharedmemory import PageAllocator
+        if max_bytes <= 0:
+            raise ValueError("max_bytes should be larger than 0")
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.page_size = page_size
+        data_pages = int(math.ceil(max_bytes / page_size))
+        header_pages = int(
+            math.ceil(
+                (data_pages + PageAllocator.s_allocator_header) / page_size))
+        total_pages = data_pages + header_pages + 1
+        self._data = mmap.mmap(-1, total_pages * page_size)
+        self._base = np.frombuffer(self._data, dtype='uint8')
+        self._allocator = PageAllocator(self._base, total_pages, page_size)
+        # 索引为线性探测的哈希表，保持一半以上的空位以缩短探测长度
+        num_slots = max_entries * 2
+        self._meta = mmap.mmap(-1,
+                               (num_slots * _NUM_FIELDS + _NUM_COUNTERS) * 8)
+        meta = np.frombuffer(self._meta, dtype='int64')
+        self._table = meta[:num_slots * _NUM_FIELDS].reshape(
+            (num_slots, _NUM_FIELDS))
+        self._counters = meta[num_slots * _NUM_FIELDS:]
+        self._lock = multiprocessing.Lock()
+
+    def __deepcopy__(self, memo):
+        # 复制transforms时共用同一份缓存
+        return self
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.md5(str(key).encode('utf-8')).digest()
+        value = int(np.frombuffer(digest[:8], dtype='int64')[0])
+        return value if value != 0 else 1
+
+    def _probe(self, h):
+        """返回`h`所在的位置，不存在时返回可插入的空位及False。
+        """
+        num_slots = len(self._table)
+        idx = h % num_slots
+        while True:
+            key = self._table[idx, _KEY]
+            if key == h:
+                return idx, True
+            if key == 0:
+                return idx, False
+            idx = (idx + 1) % num_slots
+
+    def _remove(self, idx):
+        # 删除后将同一探测链上的后续记录前移，避免留下空洞导致查找中断
+        num_slots = len(self._table)
+        self._table[idx] = 0
+        j = idx
+        while True:
+            j = (j + 1) % num_slots
+            key = int(self._table[j, _KEY])
+            if key == 0:
+                break
+            home = key % num_slots
+            if idx < j:
+                stay = idx < home <= j
+            else:
+                stay = home > idx or home <= j
+            if not stay:
+                self._table[idx] = self._table[j]
+                self._table[j] = 0
+                idx = j
+
+    def _evict(self):
+        used = np.flatnonzero(self._table[:, _KEY] != 0)
+        if len(used) == 0:
+            return False
+        idx = used[np.argmin(self._table[used, _TICK])]
+        row = self._table[idx]
+        self._allocator.free_page(int(row[_POS]), int(row[_PAGES]))
+        self._counters[_BYTES] -= self._nbytes(row)
+        self._counters[_COUNT] -= 1
+        self._remove(idx)
+        return True
+
+    @staticmethod
+    def _shape(row):
+        return tuple(int(s) for s in row[_H:_H + row[_NDIM]])
+
+    def _nbytes(self, row):
+        return int(np.prod(self._shape(row))) * _DTYPES[row[_DTYPE]].itemsize
+
+    def get(self, key):
+        """获取`key`对应的图像，返回缓存数据的拷贝；不存在时返回None。
+        """
+        h = self._hash(key)
+        with self._lock:
+            idx, found = self._probe(h)
+            if not found:
+                self._counters[_MISSES] += 1
+                return None
+            self._counters[_CLOCK] += 1
+            self._counters[_HITS] += 1
+            row = self._table[idx]
+            row[_TICK] = self._counters[_CLOCK]
+            start = int(row[_POS]) * self.page_size
+            dtype = _DTYPES[row[_DTYPE]]
+            shape = self._shape(row)
+            nbytes = self._nbytes(row)
+            im = self._base[start:start + nbytes].view(dtype).reshape(
+                shape).copy()
+        return im
+
+    def put(self, key, im):
+        """缓存`key`对应的图像；图像超过缓存上限或数据类型不支持时不缓存。
+        """
+        if not isinstance(im, np.ndarray) or im.ndim not in [2, 3]:
+            return
+        if im.dtype not in _DTYPES or im.nbytes > self.max_bytes:
+            return
+        from paddlex.cv.datasets.shared_queue.sharedmemory import MemoryFullError
+        h = self._hash(key)
+        page_num = max(int(math.ceil(im.nbytes / self.page_size)), 1)
+        with self._lock:
+            if self._probe(h)[1]:
+                return
+            # 超出数量或字节数上限，以及剩余空间不连续时，依次淘汰最久未使用的图像
+            while (self._counters[_COUNT] >= self.max_entries or
+                   self._counters[_BYTES] + im.nbytes > self.max_bytes):
+                if not self._evict():
+                    return
+            while True:
+                try:
+                    pos = self._allocator.malloc_page(page_num)
+                    break
+                except MemoryFullError:
+                    if not self._evict():
+                        return
+            start = pos * self.page_size
+            self._base[start:start + im.nbytes] = np.ascontiguousarray(
+                im).reshape(-1).view('uint8')
+            self._counters[_CLOCK] += 1
+            # 淘汰会移动哈希表中的记录，需在淘汰完成后再确定插入位置
+            row = self._table[self._probe(h)[0]]
+            row[_TICK] = self._counters[_CLOCK]
+            row[_POS] = pos
+            row[_PAGES] = page_num
+            row[_DTYPE] = _DTYPES.index(im.dtype)
+            row[_NDIM] = im.ndim
+            row[_H:_H + im.ndim] = im.shape
+            row[_KEY] = h
+            self._counters[_BYTES] += im.nbytes
+            self._counters[_COUNT] += 1
+
+    def read(self, key, read_fn):
+        """获取`key`对应的图像，不存在时调用`read_fn()`读取并缓存。
+        """
+        im = self.get(key)
+        if im is None:
+            im = read_fn()
+            self.put(key, im)
+        return im
+
+    def stats(self):
+        """返回缓存的统计信息，包括命中次数、未命中次数、缓存的图像数量及字节数。
+        """
+        with self._lock:
+            return {
+                'hits': int(self._counters[_HITS]),
+                'misses': int(self._counters[_MISSES]),
+                'num_images': int(self._counters[_COUNT]),
+                'bytes': int(self._counters[_BYTES])
+            }
+
+
+def imdecode(data, flags=cv2.IMREAD_COLOR):
+    """解码内存中的图像文件数据，如打包数据集中的`RecordImage`。
+    """
+    if isinstance(data, (bytes, bytearray)):
+        buf = np.frombuffer(data, dtype='uint8')
+    else:
+        buf = np.asarray(data, dtype='uint8')
+    return cv2.imdecode(buf, flags)
+
+
+def _imread(im_file, flags):
+    if isinstance(im_file, str):
+        return cv2.imread(im_file, flags)
+    return imdecode(im_file, flags)
+
+
+def imread(im_file, flags=cv2.IMREAD_COLOR, cache=None):
+    """读取图像文件，指定`cache`时优先从解码图像缓存中获取。
+
+    Args:
+        im_file (str|RecordImage): 图像文件路径，或打包数据集中的图像数据。
+        flags (int): cv2.imread的读取方式。默认为cv2.IMREAD_COLOR。
+        cache (ImageCache): 解码图像缓存。默认为None，即不使用缓存。
+
+    Returns:
+        np.ndarray: 解码后的图像，读取失败时返回None。
+    """
+    if cache is None:
+        return _imread(im_file, flags)
+    return cache.read((im_file, flags), lambda: _imread(im_file, flags))
+
+
+def jpeg_shape(im_file):
+    """只解析文件头，获取JPEG图像解码后的大小。
+
+    Args:
+        im_file (str|RecordImage): 图像文件路径，或打包数据集中的图像数据。
+
+    Returns:
+        tuple: 图像的(h, w)，已考虑EXIF中的旋转方向；不是JPEG图像或读取失败时返回None。
+    """
+    from PIL import Image
+    try:
+        if isinstance(im_file, str):
+            f = open(im_file, 'rb')
+        else:
+            f = io.BytesIO(bytes(im_file))
+        with f:
+            img = Image.open(f)
+            if img.format != 'JPEG':
+                return None
+            w, h = img.size
+            orientation = img.getexif().get(0x0112, 1) if hasattr(
+                img, 'getexif') else 1
+    except Exception:
+        return None
+    # cv2解码时按EXIF方向旋转图像，方向为5~8时宽高互换
+    if orientation in [5, 6, 7, 8]:
+        h, w = w, h
+    return h, w
+
+
+def imread_reduced(im_file, target_shape, cache=None):
+    """读取3通道图像，JPEG图像在不影响后续缩放结果大小的前提下以降低的分辨率解码。
+
+    libjpeg在解码时即可按1/2、1/4、1/8缩小图像（DCT缩放），省去完整解码大图的时间和内存。
+    选取最大的缩小倍数，使解码后的图像仍不小于后续缩放操作的目标大小。
+
+    Args:
+        im_file (str|RecordImage): 图像文件路径，或打包数据集中的图像数据。
+        target_shape (callable): 输入原图的(h, w)，返回后续缩放操作的目标大小(h, w)。
+        cache (ImageCache): 解码图像缓存。默认为None，即不使用缓存。
+
+    Returns:
+        tuple: (im, shape)，分别为解码后的图像及原图的大小(h, w)。
+    """
+    shape = jpeg_shape(im_file)
+    if shape is not None:
+        h, w = shape
+        target_h, target_w = target_shape(h, w)
+        for factor, flags in _REDUCED_FLAGS:
+            if (h + factor - 1) // factor >= target_h and (
+                    w + factor - 1) // factor >= target_w:
+                im = imread(im_file, flags, cache=cache)
+                if im is not None:
+                    return im, shape
+                break
+    im = imread(im_file, cache=cache)
+    if im is None:
+        return None, None
+    return im, im.shape[:2]
@@ -0,0 +1,252 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import os.path as osp
+import io
+import mmap
+import atexit
+import hashlib
+import tempfile
+import numpy as np
+import paddlex.utils.logging as logging
+
+# 缓存格式发生变化时需递增该版本号，旧缓存会因key不同而自动失效
+LABEL_CACHE_VERSION = 1
+# 索引中每条记录的字段：数据偏移、高、宽、游程数（-1表示未压缩）
+_OFFSET, _H, _W, _RUNS = range(4)
+
+# 每个进程中已打开的标注缓存文件，fork出的子进程直接继承
+_label_mmaps = dict()
+
+
+def _open_labels(path):
+    mm = _label_mmaps.get(path, None)
+    if mm is None:
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _label_mmaps[path] = mm
+    return mm
+
+
+class CachedLabel(object):
+    """标注缓存文件中的一张分割标注图。
+
+    对象本身只记录缓存文件路径和偏移量，可以低开销地在进程间传递；在使用它的进程中通过mmap
+    读取。未压缩的标注`decode()`得到指向文件映射的只读uint8数组，不额外拷贝数据；
+    游程编码（RLE）压缩的标注解码时展开为新数组。
+
+    Args:
+        path (str): 缓存文件路径。
+        offset (int): 数据在缓存文件中的起始位置。
+        shape (tuple): 标注图的(h, w)。
+        runs (int): 游程数，为-1时表示未压缩。
+    """
+    __slots__ = ['path', 'offset', 'shape', 'runs']
+
+    def __init__(self, path, offset, shape, runs=-1):
+        self.path = path
+        self.offset = offset
+        self.shape = shape
+        self.runs = runs
+
+    def decode(self):
+        mm = _open_labels(self.path)
+        if self.runs < 0:
+            return np.frombuffer(
+                mm,
+                dtype='uint8',
+                count=self.shape[0] * self.shape[1],
+                offset=self.offset).reshape(self.shape)
+        values = np.frombuffer(
+            mm, dtype='uint8', count=self.runs, offset=self.offset)
+        lengths = np.frombuffer(
+            mm,
+            dtype='uint32',
+            count=self.runs,
+            offset=_align(self.offset + self.runs))
+        return np.repeat(values, lengths).reshape(self.shape)
+
+    def __array__(self, dtype=None, copy=None):
+        label = self.decode()
+        if dtype is not None and np.dtype(dtype) != label.dtype:
+            label = label.astype(dtype)
+        return label
+
+    def __repr__(self):
+        return "CachedLabel({}, offset={}, shape={})".format(
+            self.path, self.offset, self.shape)
+
+
+def _align(pos, alignment=8):
+    return (pos + alignment - 1) // alignment * alignment
+
+
+def read_label(label):
+    """读取分割标注图，与seg_transforms中的解码方式一致。
+
+    Args:
+        label (str|RecordImage|np.ndarray): 标注文件路径、打包数据集中的标注数据或已读取的标注图。
+
+    Returns:
+        np.ndarray: 标注图。
+    """
+    from PIL import Image
+    if isinstance(label, np.ndarray):
+        return label
+    if not isinstance(label, str):
+        label = io.BytesIO(bytes(label))
+    return np.asarray(Image.open(label))
+
+
+def rle_encode(label):
+    """对标注图按行优先顺序进行游程编码。
+
+    Returns:
+        tuple: (values, lengths)，各游程的取值（uint8）及长度（uint32）。
+    """
+    flat = label.reshape(-1)
+    starts = np.flatnonzero(np.r_[True, flat[1:] != flat[:-1]])
+    lengths = np.diff(np.r_[starts, len(flat)]).astype('uint32')
+    return flat[starts], lengths
+
+
+def _label_signature(label):
+    if isinstance(label, np.ndarray):
+        return "{}:{}".format(label.shape,
+                              hashlib.md5(label.tobytes()).hexdigest())
+    path = label if isinstance(label, str) else getattr(label, 'path', None)
+    try:
+        st = os.stat(path)
+        stat = "{}:{}".format(st.st_mtime_ns, st.st_size)
+    except (OSError, TypeError):
+        stat = "-1:-1"
+    return "{}:{}".format(repr(label), stat)
+
+
+def _default_cache_dir():
+    # 优先使用共享内存文件系统，缓存文件只占用内存且可被各数据读取进程共享
+    if osp.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def _remove_file(path):
+    _label_mmaps.pop(path, None)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def build_label_cache(labels, cache_dir=None, compress=False):
+    """将分割标注一次性解码，按uint8保存在一个缓存文件中，之后每个样本的标注只需从文件映射中切片。
+
+    指定`cache_dir`时缓存文件以标注文件的路径、修改时间及大小计算key，再次创建数据集时直接复用；
+    未指定时缓存文件创建在共享内存（/dev/shm）或临时目录中，进程退出时删除。
+    非二维或非uint8的标注不进入缓存，仍按原方式读取。
+
+    Args:
+        labels (list): 各样本的标注，元素为标注文件路径、打包数据集中的标注数据或已读取的标注图。
+        cache_dir (str): 缓存文件的保存目录。默认为None。
+        compress (bool): 是否对标注进行游程编码（RLE）压缩，仅在压缩后更小时生效。默认为False。
+
+    Returns:
+        list: 与`labels`一一对应，进入缓存的标注为`CachedLabel`，其余为原始的标注。
+    """
+    md5 = hashlib.md5()
+    md5.update("v{}:{}".format(LABEL_CACHE_VERSION, compress).encode())
+    for label in labels:
+        md5.update(_label_signature(label).encode())
+    key = md5.hexdigest()
+    persistent = cache_dir is not None
+    if not persistent:
+        cache_dir = _default_cache_dir()
+        # 临时缓存在进程退出时删除，文件名带上进程号，同一数据集上同时运行的多个训练互不影响
+        key = '{}_{}'.format(key, os.getpid())
+    elif not osp.exists(cache_dir):
+        os.makedirs(cache_dir)
+    path = osp.join(cache_dir, 'labels_{}.bin'.format(key))
+    index_path = osp.join(cache_dir, 'labels_{}.npy'.format(key))
+    index = None
+    if persistent and osp.exists(path) and osp.exists(index_path):
+        try:
+            index = np.load(index_path)
+            logging.info("Label cache is loaded from {}".format(path))
+        except Exception as e:
+            logging.warning("Failed to load label cache from {}: {}".format(
+                path, e))
+            index = None
+    if index is None or len(index) != len(labels):
+        index = _write_label_cache(labels, cache_dir, path, index_path,
+                                   compress)
+        if not persistent:
+            atexit.register(_remove_file, path)
+            atexit.register(_remove_file, index_path)
+    cached = list()
+    for label, row in zip(labels, index.tolist()):
+        if row[_OFFSET] < 0:
+            cached.append(label)
+        else:
+            cached.append(
+                CachedLabel(path, row[_OFFSET], (row[_H], row[_W]), row[
+                    _RUNS]))
+    return cached
+
+
+def _write_label_cache(labels, cache_dir, path, index_path, compress):
+    index = np.full((len(labels), 4), -1, dtype='int64')
+    raw_bytes = 0
+    pos = 0
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for i, label in enumerate(labels):
+                label = read_label(label)
+                if label.ndim != 2 or label.dtype != np.uint8:
+                    continue
+                raw_bytes += label.size
+                index[i, _OFFSET] = pos
+                index[i, _H:_W + 1] = label.shape
+                chunks = [np.ascontiguousarray(label).reshape(-1)]
+                if compress:
+                    values, lengths = rle_encode(label)
+                    if _align(len(values)) + lengths.nbytes < label.size:
+                        index[i, _RUNS] = len(values)
+                        chunks = [
+                            values, np.zeros(
+                                _align(len(values)) - len(values),
+                                dtype='uint8'), lengths
+                        ]
+                for chunk in chunks:
+                    f.write(chunk.tobytes())
+                size = sum(chunk.nbytes for chunk in chunks)
+                # 每条记录按8字节对齐，便于游程长度以uint32直接映射
+                f.write(b'\0' * (_align(size) - size))
+                pos += _align(size)
+        np.save(tmp_path + '.npy', index)
+        os.chmod(tmp_path, 0o644)
+        os.rename(tmp_path, path)
+        os.rename(tmp_path + '.npy', index_path)
+    except Exception:
+        for p in [tmp_path, tmp_path + '.npy']:
+            if osp.exists(p):
+                os.remove(p)
+        raise
+    logging.info(
+        "{} of {} labels are cached in {}, {:.1f}MB ({:.1f}MB before compression)".
+        format(
+            int((index[:, _OFFSET] >= 0).sum()),
+            len(labels), path, pos / 1024.**2, raw_bytes / 1024.**2))
+    return index
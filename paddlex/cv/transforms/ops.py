@@ -19,6 +19,8 @@ from PIL import Image, ImageEnhance
 
 
 def normalize(im, mean, std, min_value=[0, 0, 0], max_value=[255, 255, 255]):
+    if im.dtype == np.uint8 and im.ndim == 3:
+        return normalize_uint8(im, mean, std, min_value, max_value)
     # Rescaling (min-max normalization)
     range_value = [max_value[i] - min_value[i] for i in range(len(max_value))]
     im = (im - min_value) / range_value
@@ -29,6 +31,24 @@ def normalize(im, mean, std, min_value=[0, 0, 0], max_value=[255, 255, 255]):
     return im.astype('float32')
 
 
+def normalize_uint8(im, mean, std, min_value=[0, 0, 0],
+                    max_value=[255, 255, 255]):
+    """对uint8图像进行标准化，结果与转为float32后调用`normalize`完全一致。
+
+    uint8图像每个通道只有256种取值，先按相同的计算过程得到各通道的查找表，
+    再逐通道查表写入输出，只需一次输出内存的分配。
+    """
+    channel = im.shape[-1]
+    values = np.arange(256, dtype='float32')[:, np.newaxis, np.newaxis]
+    lut = normalize(
+        np.repeat(values, channel, axis=2), mean, std, min_value,
+        max_value)[:, 0, :]
+    out = np.empty(im.shape, dtype='float32')
+    for c in range(channel):
+        np.take(lut[:, c], im[..., c], out=out[..., c])
+    return out
+
+
 def permute(im, to_bgr=False):
     im = np.swapaxes(im, 1, 2)
     im = np.swapaxes(im, 1, 0)
@@ -129,12 +149,19 @@ def hue(im, hue_lower, hue_upper):
     ityiq = np.array([[1.0, 0.956, 0.621], [1.0, -0.272, -0.647],
                       [1.0, -1.107, 1.705]])
     t = np.dot(np.dot(ityiq, bt), tyiq).T
+    if im.dtype == np.uint8:
+        return cv2.transform(im, t.T)
     im = np.dot(im, t)
     return im
 
 
 def saturation(im, saturation_lower, saturation_upper):
     delta = np.random.uniform(saturation_lower, saturation_upper)
+    if im.dtype == np.uint8:
+        # 灰度的计算权重与下方一致，即第0个通道的权重为0.299
+        gray = cv2.cvtColor(
+            cv2.cvtColor(im, cv2.COLOR_RGB2GRAY), cv2.COLOR_GRAY2RGB)
+        return cv2.addWeighted(im, delta, gray, 1.0 - delta, 0)
     gray = im * np.array([[[0.299, 0.587, 0.114]]], dtype=np.float32)
     gray = gray.sum(axis=2, keepdims=True)
     gray *= (1.0 - delta)
@@ -145,16 +172,28 @@ def saturation(im, saturation_lower, saturation_upper):
 
 def contrast(im, contrast_lower, contrast_upper):
     delta = np.random.uniform(contrast_lower, contrast_upper)
+    if im.dtype == np.uint8:
+        return lut_uint8(im, np.arange(256) * delta)
     im *= delta
     return im
 
 
 def brightness(im, brightness_lower, brightness_upper):
     delta = np.random.uniform(brightness_lower, brightness_upper)
+    if im.dtype == np.uint8:
+        return lut_uint8(im, np.arange(256) + delta)
     im += delta
     return im
 
 
+def lut_uint8(im, values):
+    """按查找表对uint8图像的每个像素值进行映射，`values`为0~255各像素值映射后的结果，
+    映射结果四舍五入并截断到[0, 255]。
+    """
+    lut = np.clip(np.round(values), 0, 255).astype('uint8')
+    return cv2.LUT(np.ascontiguousarray(im), lut)
+
+
 def rotate(im, rotate_lower, rotate_upper):
     rotate_delta = np.random.uniform(rotate_lower, rotate_upper)
     im = im.rotate(int(rotate_delta))
@@ -0,0 +1,246 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import time
+import multiprocessing
+import numpy as np
+
+# 每个操作的统计字段：调用次数、总耗时（纳秒）、新分配的字节数、输出的维数、形状及数据类型
+_COUNT, _TIME, _BYTES, _NDIM, _SHAPE, _DTYPE = 0, 1, 2, 3, 4, 8
+_NUM_FIELDS = 9
+_MAX_NDIM = _DTYPE - _SHAPE
+_NAME_LEN = 48
+# 数据读取的计时项：训练进程等待数据、训练进程处理数据、数据处理方因队列已满而等待
+READER_WAIT, TRAINER_BUSY, QUEUE_FULL = range(3)
+_READER_NAMES = ['trainer waiting on reader', 'trainer busy',
+                 'reader blocked on full queue']
+# 组batch时的补齐统计：补齐前的有效像素数、补齐后的总像素数
+_VALID_PIXELS, _PADDED_PIXELS = range(2)
+_DTYPES = [
+    np.dtype(t) for t in
+    ['uint8', 'int8', 'uint16', 'int16', 'uint32', 'int32', 'int64',
+     'float16', 'float32', 'float64', 'bool']
+]
+
+
+class TransformProfiler(object):
+    """数据处理流程的性能统计，记录每个操作的耗时、新分配的内存及输出的形状和数据类型，
+    以及数据读取中训练进程等待数据和数据处理方等待队列的时间，和组batch时补齐的像素比例。
+
+    统计结果保存在匿名共享内存映射（mmap）中，需在数据读取进程创建之前（即开始训练之前）创建，
+    fork出的进程继承后共同累加，在主进程中即可得到所有进程的汇总结果。
+    新分配的内存按输出图像中不与输入图像共享的数据量估计。
+
+    Args:
+        max_ops (int): 最多统计的操作数量（含图像解码）。默认为64。
+    """
+
+    def __init__(self, max_ops=64):
+        self.max_ops = max_ops
+        size = (max_ops * _NUM_FIELDS + len(_READER_NAMES) * 2 + 2) * 8
+        self._data = mmap.mmap(-1, size + max_ops * _NAME_LEN)
+        stats = np.frombuffer(self._data, dtype='int64', count=size // 8)
+        self._table = stats[:max_ops * _NUM_FIELDS].reshape(
+            (max_ops, _NUM_FIELDS))
+        self._reader = stats[max_ops * _NUM_FIELDS:-2].reshape(
+            (len(_READER_NAMES), 2))
+        self._padding = stats[-2:]
+        self._names = np.frombuffer(
+            self._data, dtype='uint8', offset=size).reshape((max_ops,
+                                                            _NAME_LEN))
+        self._lock = multiprocessing.Lock()
+
+    def __deepcopy__(self, memo):
+        # 复制transforms时共用同一份统计
+        return self
+
+    def record(self, index, name, seconds, inputs=None, outputs=None):
+        """累加第`index`个操作的一次调用。
+
+        Args:
+            index (int): 操作在数据处理流程中的序号，图像解码为0。
+            name (str): 操作的名称。
+            seconds (float): 本次调用的耗时（秒）。
+            inputs (np.ndarray): 操作的输入图像。默认为None。
+            outputs (np.ndarray): 操作的输出图像。默认为None。
+        """
+        if index >= self.max_ops:
+            return
+        nbytes = 0
+        ndim = -1
+        if isinstance(outputs, np.ndarray):
+            ndim = min(outputs.ndim, _MAX_NDIM)
+            if outputs is not inputs and (
+                    not isinstance(inputs, np.ndarray) or
+                    not np.may_share_memory(outputs, inputs)):
+                nbytes = outputs.nbytes
+        with self._lock:
+            row = self._table[index]
+            if row[_COUNT] == 0:
+                encoded = name.encode('utf-8')[:_NAME_LEN]
+                self._names[index] = 0
+                self._names[index, :len(encoded)] = np.frombuffer(
+                    encoded, dtype='uint8')
+            row[_COUNT] += 1
+            row[_TIME] += int(seconds * 1e9)
+            row[_BYTES] += nbytes
+            row[_NDIM] = ndim
+            if ndim >= 0:
+                row[_SHAPE:_SHAPE + ndim] = outputs.shape[:ndim]
+                row[_DTYPE] = _DTYPES.index(
+                    outputs.dtype) if outputs.dtype in _DTYPES else -1
+
+    def add_wait(self, kind, seconds):
+        """累加一次数据读取中的等待，`kind`为READER_WAIT、TRAINER_BUSY或QUEUE_FULL。
+        """
+        with self._lock:
+            self._reader[kind, 0] += 1
+            self._reader[kind, 1] += int(seconds * 1e9)
+
+    def record_padding(self, valid_pixels, padded_pixels):
+        """累加一个batch补齐前的有效像素数及补齐后的总像素数。
+        """
+        with self._lock:
+            self._padding[_VALID_PIXELS] += valid_pixels
+            self._padding[_PADDED_PIXELS] += padded_pixels
+
+    def timed_put(self, put, *args):
+        """调用`put(*args)`向队列放入数据，并将阻塞的时间计入QUEUE_FULL。
+        """
+        start = time.perf_counter()
+        result = put(*args)
+        self.add_wait(QUEUE_FULL, time.perf_counter() - start)
+        return result
+
+    def timed_batches(self, batches):
+        """逐个返回`batches`中的batch，并统计训练进程等待数据及处理数据的时间。
+        """
+        start = time.perf_counter()
+        for batch in batches:
+            fetched = time.perf_counter()
+            self.add_wait(READER_WAIT, fetched - start)
+            yield batch
+            start = time.perf_counter()
+            self.add_wait(TRAINER_BUSY, start - fetched)
+
+    def reset(self):
+        """清空已有的统计结果。
+        """
+        with self._lock:
+            self._table[...] = 0
+            self._reader[...] = 0
+            self._padding[...] = 0
+            self._names[...] = 0
+
+    def stats(self):
+        """返回统计结果。
+
+        Returns:
+            dict: 包含'ops'、'reader'及'padding'三项。'ops'为各操作统计结果组成的list，每项为包含
+                name、calls、total_ms、mean_ms、alloc_bytes（每次调用平均新分配的字节数）、
+                shape、dtype的dict；'reader'为各等待项的次数和总时间（秒）；'padding'为补齐部分
+                占batch总像素的比例，尚未组batch时为None。
+        """
+        with self._lock:
+            table = self._table.copy()
+            reader = self._reader.copy()
+            padding = self._padding.copy()
+            names = self._names.copy()
+        ops = list()
+        for index in range(self.max_ops):
+            row = table[index]
+            count = int(row[_COUNT])
+            if count == 0:
+                continue
+            ndim = int(row[_NDIM])
+            ops.append({
+                'index': index,
+                'name': names[index].tobytes().rstrip(b'\0').decode(
+                    'utf-8', 'ignore'),
+                'calls': count,
+                'total_ms': row[_TIME] / 1e6,
+                'mean_ms': row[_TIME] / 1e6 / count,
+                'alloc_bytes': int(row[_BYTES]) // count,
+                'shape': tuple(int(s) for s in row[_SHAPE:_SHAPE + ndim])
+                if ndim >= 0 else None,
+                'dtype': str(_DTYPES[row[_DTYPE]])
+                if ndim >= 0 and row[_DTYPE] >= 0 else None
+            })
+        waits = dict()
+        for kind, name in enumerate(_READER_NAMES):
+            waits[name] = {
+                'count': int(reader[kind, 0]),
+                'seconds': reader[kind, 1] / 1e9
+            }
+        padding_ratio = None
+        if padding[_PADDED_PIXELS] > 0:
+            padding_ratio = 1. - padding[_VALID_PIXELS] / padding[
+                _PADDED_PIXELS]
+        return {'ops': ops, 'reader': waits, 'padding': padding_ratio}
+
+    def report(self):
+        """返回统计结果的文本报表。
+        """
+        stats = self.stats()
+        ops = stats['ops']
+        total = sum(op['total_ms'] for op in ops) or 1.
+        lines = [
+            '{:<4}{:<28}{:>9}{:>12}{:>10}{:>7}{:>12}  {}'.format(
+                'idx', 'op', 'calls', 'total(s)', 'mean(ms)', '%',
+                'alloc(MB)', 'output')
+        ]
+        for op in ops:
+            output = '-' if op['shape'] is None else '{} {}'.format(
+                op['shape'], op['dtype'])
+            lines.append('{:<4}{:<28}{:>9}{:>12.2f}{:>10.3f}{:>7.1f}{:>12.2f}  {}'.
+                         format(op['index'], op['name'][:27], op['calls'],
+                                op['total_ms'] / 1e3, op['mean_ms'],
+                                op['total_ms'] / total * 100,
+                                op['alloc_bytes'] / 1024.**2, output))
+        reader = stats['reader']
+        wait = reader[_READER_NAMES[READER_WAIT]]
+        busy = reader[_READER_NAMES[TRAINER_BUSY]]
+        full = reader[_READER_NAMES[QUEUE_FULL]]
+        if wait['count'] > 0:
+            ratio = wait['seconds'] / max(wait['seconds'] + busy['seconds'],
+                                          1e-9)
+            lines.append(
+                'trainer waited {:.2f}s on the reader over {} batches ({:.1f}% of the time), '
+                'reader blocked {:.2f}s on full queues'.format(
+                    wait['seconds'], wait['count'], ratio * 100,
+                    full['seconds']))
+        if stats['padding'] is not None:
+            lines.append('padding takes {:.1f}% of batch pixels'.format(
+                stats['padding'] * 100))
+        return '\n'.join(lines)
+
+    def add_scalars(self, log_writer, step, prefix='Transforms'):
+        """将各操作的平均耗时及数据读取的等待时间写入VisualDL。
+
+        Args:
+            log_writer (visualdl.LogWriter): VisualDL存储器。
+            step (int): 写入的步数。
+            prefix (str): 标签的前缀。默认为'Transforms'。
+        """
+        stats = self.stats()
+        for op in stats['ops']:
+            log_writer.add_scalar('{}/{}_{}(ms)'.format(
+                prefix, op['index'], op['name']), op['mean_ms'], step)
+        for name, wait in stats['reader'].items():
+            log_writer.add_scalar('{}/{}(s)'.format(prefix, name),
+                                  wait['seconds'], step)
+        if stats['padding'] is not None:
+            log_writer.add_scalar('{}/padding_ratio'.format(prefix),
+                                  stats['padding'], step)
@@ -15,7 +15,14 @@
 
 from .ops import *
 from .imgaug_support import execute_imgaug
+from .image_cache import ImageCache, imdecode
+from .label_cache import CachedLabel
+from .profiler import TransformProfiler
+from .batch_ops import BatchResize, BatchNormalize, BatchRandomHorizontalFlip
+from .batch_ops import BatchRandomDistort
+import io
 import random
+import time
 import os.path as osp
 import numpy as np
 from PIL import Image
@@ -54,6 +61,9 @@ class Compose(SegTransform):
                             'must be equal or larger than 1!')
         self.transforms = transforms
         self.batch_transforms = None
+        self.image_cache = None
+        self.fused = False
+        self.profiler = None
         self.to_rgb = False
         # 检查transforms里面的操作，目前支持PaddleX定义的或者是imgaug操作
         for op in self.transforms:
@@ -65,7 +75,17 @@ class Compose(SegTransform):
                     )
 
     @staticmethod
-    def read_img(img_path, input_channel=3):
+    def read_img(img_path, input_channel=3, cache=None):
+        if cache is not None:
+            return cache.read((img_path, input_channel),
+                              lambda: Compose.read_img(img_path, input_channel))
+        if not isinstance(img_path, str):
+            # 打包数据集中的图像以`RecordImage`传入
+            if getattr(img_path, 'ext', None) == '.npy':
+                return np.load(io.BytesIO(bytes(img_path)))
+            if input_channel == 3:
+                return imdecode(img_path)
+            return imdecode(img_path, cv2.IMREAD_UNCHANGED)
         img_format = imghdr.what(img_path)
         name, ext = osp.splitext(img_path)
         if img_format == 'tiff' or ext == '.img':
@@ -93,7 +113,11 @@ class Compose(SegTransform):
             raise Exception('Image format {} is not supported!'.format(ext))
 
     @staticmethod
-    def decode_image(im_path, label, input_channel=3):
+    def decode_image(im_path,
+                     label,
+                     input_channel=3,
+                     cache=None,
+                     keep_uint8=False):
         if isinstance(im_path, np.ndarray):
             if len(im_path.shape) != 3:
                 raise Exception(
@@ -102,11 +126,14 @@ class Compose(SegTransform):
             im = im_path
         else:
             try:
-                im = Compose.read_img(im_path, input_channel).astype('float32')
+                im = Compose.read_img(im_path, input_channel, cache)
+                if not keep_uint8 or im.dtype != np.uint8:
+                    im = im.astype('float32')
             except:
                 raise ValueError('Can\'t read The image file {}!'.format(
                     im_path))
-        im = im.astype('float32')
+        if not keep_uint8 or im.dtype != np.uint8:
+            im = im.astype('float32')
         if label is not None:
             if isinstance(label, np.ndarray):
                 if len(label.shape) != 2:
@@ -114,8 +141,12 @@ class Compose(SegTransform):
                         "label should be 2-dimensions, but now is {}-dimensions".
                         format(len(label.shape)))
 
+            elif isinstance(label, CachedLabel):
+                label = label.decode()
             else:
                 try:
+                    if not isinstance(label, str):
+                        label = io.BytesIO(bytes(label))
                     label = np.asarray(Image.open(label))
                 except:
                     ValueError('Can\'t read The label file {}!'.format(label))
@@ -140,14 +171,26 @@ class Compose(SegTransform):
         """
 
         input_channel = getattr(self, 'input_channel', 3)
-        im, label = self.decode_image(im, label, input_channel)
+        profiler = self.profiler
+        if profiler is not None:
+            start = time.perf_counter()
+        im, label = self.decode_image(im, label, input_channel,
+                                      self.image_cache, self.fused)
         if self.to_rgb and input_channel == 3:
             im = cv2.cvtColor(im, cv2.COLOR_BGR2RGB)
         if im_info is None:
             im_info = [('origin_shape', im.shape[0:2])]
         if label is not None:
             origin_label = label.copy()
-        for op in self.transforms:
+        if profiler is not None:
+            profiler.record(0, 'Decode', time.perf_counter() - start, None, im)
+        for i, op in enumerate(self.transforms):
+            if profiler is not None:
+                start = time.perf_counter()
+                inputs = im
+            if im.dtype == np.uint8 and type(op) not in _UINT8_TRANSFORMS:
+                # 融合流程中遇到需要float32输入的操作时再进行转换
+                im = im.astype('float32')
             if isinstance(op, SegTransform):
                 outputs = op(im, im_info, label)
                 im = outputs[0]
@@ -161,12 +204,53 @@ class Compose(SegTransform):
                     outputs = (im, im_info, label)
                 else:
                     outputs = (im, im_info)
+            if profiler is not None:
+                profiler.record(i + 1,
+                                type(op).__name__,
+                                time.perf_counter() - start, inputs, im)
         if self.transforms[-1].__class__.__name__ == 'ArrangeSegmenter':
             if self.transforms[-1].mode == 'eval':
                 if label is not None:
                     outputs = (im, im_info, origin_label)
         return outputs
 
+    def set_image_cache(self, max_bytes):
+        """开启解码图像缓存，各epoch及各数据读取进程共享已解码的图像，只对图像文件解码一次。
+
+        缓存位于所有数据预处理/增强操作之前，超过上限时淘汰最久未使用的图像；
+        需在训练开始前设置。
+
+        Args:
+            max_bytes (int): 缓存占用内存的上限（字节），为0或None时关闭缓存。
+        """
+        self.image_cache = ImageCache(max_bytes) if max_bytes else None
+
+    def set_fused(self, fused=True):
+        """开启融合的预处理流程，减少中间结果的float32图像的分配和读写。
+
+        开启后图像解码后保持uint8，数据增强及缩放、裁剪、翻转等操作直接在uint8图像上进行
+        （亮度、对比度等颜色变换通过查找表及OpenCV的uint8运算实现），Normalize通过查表
+        一次得到float32结果；遇到其它操作时先转换为float32，之后的处理与未开启时相同。
+        uint8下每步的结果会取整并截断到[0, 255]，与float32下的结果存在少量差异；
+        裁剪、翻转及标准化的结果与未开启时完全一致。
+
+        Args:
+            fused (bool): 是否开启融合的预处理流程。默认为True。
+        """
+        self.fused = fused
+
+    def set_profile(self, profile=True):
+        """开启数据处理流程的性能统计，记录图像解码及每个操作的耗时、新分配的内存及输出的形状和数据类型，
+        同时统计多线程/多进程读取时训练进程等待数据及数据处理方等待队列的时间。
+
+        各数据读取进程的统计结果汇总在共享内存中，可通过`self.profiler.report()`获取报表；
+        训练时每个epoch结束后输出报表，开启VisualDL时同时写入各项耗时。需在开始训练前调用。
+
+        Args:
+            profile (bool): 是否开启性能统计。默认为True。
+        """
+        self.profiler = TransformProfiler() if profile else None
+
     def add_augmenters(self, augmenters):
         if not isinstance(augmenters, list):
             raise Exception(
@@ -1150,7 +1234,8 @@ class RandomDistort(SegTransform):
                     ori_im = ops[id](**params)
             dis_ims.append(ori_im)
         im = np.concatenate(dis_ims, axis=-1)
-        im = im.astype('float32')
+        if im.dtype != np.uint8:
+            im = im.astype('float32')
         if label is None:
             return (im, im_info)
         else:
@@ -1284,3 +1369,10 @@ class ComposedSegTransforms(Compose):
                         mean=mean, std=std)
                 ]
         super(ComposedSegTransforms, self).__init__(transforms)
+
+
+# 融合的预处理流程中可直接处理uint8图像的操作
+_UINT8_TRANSFORMS = (RandomHorizontalFlip, RandomVerticalFlip, Resize,
+                     ResizeByLong, ResizeByShort, ResizeRangeScaling,
+                     ResizeStepScaling, Padding, RandomPaddingCrop, RandomBlur,
+                     RandomRotate, RandomScaleAspect, RandomDistort, Normalize)
@@ -13,17 +13,28 @@
 # limitations under the License.
 import os
 import os.path as osp
+import copy
+import time
+import platform
+import pickle
+import threading
+import traceback
+import collections
+import concurrent.futures
 import cv2
 import numpy as np
 import yaml
 import multiprocessing as mp
+from six.moves import queue
 import paddlex
 import paddle.fluid as fluid
 from paddlex.cv.transforms import build_transforms
+from paddlex.cv.datasets.shared_queue.batch_buffer import specs_size, split_buffer
 from paddlex.cv.models import BaseClassifier
 from paddlex.cv.models import PPYOLO, FasterRCNN, MaskRCNN
 from paddlex.cv.models import DeepLabv3p
 import paddlex.utils.logging as logging
+from paddlex.utils.result_cache import ResultCache, transforms_signature
 
 
 class Predictor:
@@ -36,7 +47,8 @@ class Predictor:
                  use_trt=False,
                  use_glog=False,
                  memory_optimize=True,
-                 max_trt_batch_size=1):
+                 max_trt_batch_size=1,
+                 reuse_buffers=False):
         """ 创建Paddle Predictor
 
             Args:
@@ -49,6 +61,8 @@ class Predictor:
                 use_glog: 是否启用glog日志, 默认False
                 memory_optimize: 是否启动内存优化，默认True
                 max_trt_batch_size: 在使用TensorRT时配置的最大batch size，默认1
+                reuse_buffers: 是否复用预处理的输入缓冲区，开启后预处理结果直接补齐写入按batch大小
+                    缓存的缓冲区，预测服务稳定运行时不再为输入反复申请内存，默认False
         """
         if not osp.isdir(model_dir):
             raise Exception("[ERROR] Path {} not exist.".format(model_dir))
@@ -87,6 +101,9 @@ class Predictor:
         # 主要用于batch_predict接口
         thread_num = mp.cpu_count() if mp.cpu_count() < 8 else 8
         self.thread_pool = mp.pool.ThreadPool(thread_num)
+        self._input_buffers = _InputBuffers() if reuse_buffers else None
+        self._tensors = None
+        self.result_cache = None
         self.input_channel = 3
         if 'input_channel' in self.info['_init_params']:
             self.input_channel = self.info['_init_params']['input_channel']
@@ -96,6 +113,33 @@ class Predictor:
         self.thread_pool.join()
         self.thread_pool = mp.pool.ThreadPool(thread_num)
 
+    def set_result_cache(self, max_size=1024, ttl=None, cache_dir=None):
+        """ 开启预测结果缓存，重复提交的图像（文件内容或像素数据相同）直接返回缓存的结果
+
+            Args:
+                max_size: 内存中最多缓存的结果数，为0时关闭缓存，默认1024
+                ttl: 结果的有效时间（秒），默认None，即不过期
+                cache_dir: 磁盘缓存目录，内存中未命中时从磁盘读取，默认None，即只使用内存缓存
+        """
+        if max_size <= 0 and cache_dir is None:
+            self.result_cache = None
+            return
+        params_file = osp.join(self.model_dir, '__params__')
+        namespace = osp.abspath(self.model_dir)
+        if osp.exists(params_file):
+            namespace += ':{}'.format(os.stat(params_file).st_mtime_ns)
+        self.result_cache = ResultCache(
+            max_size=max_size,
+            ttl=ttl,
+            cache_dir=cache_dir,
+            namespace=namespace)
+
+    def _cache_key(self, image, topk):
+        if self.result_cache is None:
+            return None
+        return self.result_cache.key(
+            image, transforms_signature(self.transforms), topk)
+
     def create_predictor(self,
                          use_gpu=True,
                          gpu_id=0,
@@ -144,12 +188,15 @@ class Predictor:
         predictor = fluid.core.create_paddle_predictor(config)
         return predictor
 
-    def preprocess(self, image, thread_pool=None):
+    def preprocess(self, image, thread_pool=None, alloc=None):
         """ 对图像做预处理
 
             Args:
                 image(list|tuple): 数组中的元素可以是图像路径，也可以是解码后的排列格式为（H，W，C）
                     且类型为float32且为BGR格式的数组。
+                thread_pool(multiprocessing.pool.ThreadPool): 并行处理各图像的线程池，默认None
+                alloc(callable): 图像输入缓冲区的申请函数，参见`paddlex.cv.datasets.pack_images`，
+                    默认None，即使用新申请的内存
         """
         res = dict()
         if self.model_type == "classifier":
@@ -158,7 +205,8 @@ class Predictor:
                 self.transforms,
                 self.model_type,
                 self.model_name,
-                thread_pool=thread_pool)
+                thread_pool=thread_pool,
+                alloc=alloc)
             res['image'] = im
         elif self.model_type == "detector":
             if self.model_name in ["PPYOLO", "YOLOv3"]:
@@ -168,7 +216,8 @@ class Predictor:
                     self.model_type,
                     self.model_name,
                     thread_pool=thread_pool,
-                    input_channel=self.input_channel)
+                    input_channel=self.input_channel,
+                    alloc=alloc)
                 res['image'] = im
                 res['im_size'] = im_size
             if self.model_name.count('RCNN') > 0:
@@ -178,7 +227,8 @@ class Predictor:
                     self.model_type,
                     self.model_name,
                     thread_pool=thread_pool,
-                    input_channel=self.input_channel)
+                    input_channel=self.input_channel,
+                    alloc=alloc)
                 res['image'] = im
                 res['im_info'] = im_resize_info
                 res['im_shape'] = im_shape
@@ -189,7 +239,8 @@ class Predictor:
                 self.model_type,
                 self.model_name,
                 thread_pool=thread_pool,
-                input_channel=self.input_channel)
+                input_channel=self.input_channel,
+                alloc=alloc)
             res['image'] = im
             res['im_info'] = im_info
         return res
@@ -248,22 +299,38 @@ class Predictor:
             Args:
                 inputs(tuple): 预处理过后的数据
         """
+        input_tensors, output_tensors = self._get_tensors()
         for k, v in inputs.items():
-            try:
-                tensor = self.predictor.get_input_tensor(k)
-            except:
+            if k not in input_tensors:
                 continue
-            tensor.copy_from_cpu(v)
+            input_tensors[k].copy_from_cpu(v)
         self.predictor.zero_copy_run()
-        output_names = self.predictor.get_output_names()
         output_results = list()
-        for name in output_names:
-            output_tensor = self.predictor.get_output_tensor(name)
+        for output_tensor in output_tensors:
             output_tensor_lod = output_tensor.lod()
             output_results.append(
                 [output_tensor.copy_to_cpu(), output_tensor_lod])
         return output_results
 
+    def _get_tensors(self):
+        # 输入输出的ZeroCopyTensor在Predictor的生命周期内有效，只需查找一次；
+        # self.predictor被替换（如clone）后重新查找
+        if self._tensors is None or self._tensors[0] is not self.predictor:
+            input_tensors = dict()
+            for name in self.predictor.get_input_names():
+                input_tensors[name] = self.predictor.get_input_tensor(name)
+            output_tensors = [
+                self.predictor.get_output_tensor(name)
+                for name in self.predictor.get_output_names()
+            ]
+            self._tensors = (self.predictor, input_tensors, output_tensors)
+        return self._tensors[1], self._tensors[2]
+
+    def _alloc(self):
+        if self._input_buffers is None:
+            return None
+        return self._input_buffers.alloc
+
     def predict(self, image, topk=1, transforms=None):
         """ 图片预测
 
@@ -274,18 +341,17 @@ class Predictor:
         """
         if transforms is not None:
             self.transforms = transforms
-        preprocessed_input = self.preprocess([image])
+        key = self._cache_key(image, topk)
+        if key is not None:
+            result = self.result_cache.get(key)
+            if result is not None:
+                return result
+        preprocessed_input = self.preprocess([image], alloc=self._alloc())
         model_pred = self.raw_predict(preprocessed_input)
-        im_shape = None if 'im_shape' not in preprocessed_input else preprocessed_input[
-            'im_shape']
-        im_info = None if 'im_info' not in preprocessed_input else preprocessed_input[
-            'im_info']
-        results = self.postprocess(
-            model_pred,
-            topk=topk,
-            batch_size=1,
-            im_shape=im_shape,
-            im_info=im_info)
+        results = self._postprocess_batch(preprocessed_input, model_pred, 1,
+                                          topk)
+        if key is not None:
+            self.result_cache.put(key, results[0])
 
         return results[0]
 
@@ -301,17 +367,832 @@ class Predictor:
         """
         if transforms is not None:
             self.transforms = transforms
-        preprocessed_input = self.preprocess(image_list, self.thread_pool)
+        if self.result_cache is not None:
+            return self._cached_batch_predict(image_list, topk)
+        preprocessed_input = self.preprocess(
+            image_list, self.thread_pool, alloc=self._alloc())
         model_pred = self.raw_predict(preprocessed_input)
+        results = self._postprocess_batch(preprocessed_input, model_pred,
+                                          len(image_list), topk)
+
+        return results
+
+    def _cached_batch_predict(self, image_list, topk):
+        # 只对缓存未命中的图像组batch预测，batch内重复的图像只预测一次
+        keys = [self._cache_key(image, topk) for image in image_list]
+        results = [self.result_cache.get(key) for key in keys]
+        pending = collections.OrderedDict()
+        for i, (key, result) in enumerate(zip(keys, results)):
+            if result is None:
+                pending.setdefault(key if key is not None else -i - 1,
+                                   list()).append(i)
+        if len(pending) == 0:
+            return results
+        images = [image_list[ids[0]] for ids in pending.values()]
+        preprocessed_input = self.preprocess(
+            images, self.thread_pool, alloc=self._alloc())
+        model_pred = self.raw_predict(preprocessed_input)
+        preds = self._postprocess_batch(preprocessed_input, model_pred,
+                                        len(images), topk)
+        for (key, ids), pred in zip(pending.items(), preds):
+            if not isinstance(key, int):
+                self.result_cache.put(key, pred)
+            results[ids[0]] = pred
+            for i in ids[1:]:
+                results[i] = copy.deepcopy(pred)
+        return results
+
+    def _postprocess_batch(self, preprocessed_input, model_pred, batch_size,
+                           topk):
         im_shape = None if 'im_shape' not in preprocessed_input else preprocessed_input[
             'im_shape']
         im_info = None if 'im_info' not in preprocessed_input else preprocessed_input[
             'im_info']
-        results = self.postprocess(
+        return self.postprocess(
             model_pred,
             topk=topk,
-            batch_size=len(image_list),
+            batch_size=batch_size,
             im_shape=im_shape,
             im_info=im_info)
 
+    def predict_stream(self,
+                       images,
+                       batch_size=1,
+                       topk=1,
+                       transforms=None,
+                       queue_size=2):
+        """ 流水线方式预测一组图片
+
+            预处理、模型预测、后处理分别在不同的线程中进行，通过有界队列衔接：第k个batch预测的同时，
+            第k+1个batch在做预处理，第k-1个batch在做后处理，CPU上的预处理和后处理时间大部分被
+            模型预测时间掩盖。
+
+            Args:
+                images(iterable): 待预测的图片，元素为图像路径或解码后的BGR图像数组，可以是生成器。
+                batch_size(int): 每次模型预测的图片数，最后一个batch可能不足。默认为1。
+                topk(int): 分类预测时使用，表示预测前topk的结果。默认为1。
+                transforms (paddlex.cls.transforms): 数据预处理操作。默认为None。
+                queue_size(int): 各阶段之间最多缓存的batch数。默认为2。
+
+            Returns:
+                generator: 按输入顺序逐张返回预测结果，与predict接口的返回值相同。
+        """
+        if transforms is not None:
+            self.transforms = transforms
+        stop = threading.Event()
+        preprocessed = queue.Queue(queue_size)
+        predicted = queue.Queue(queue_size)
+
+        def put(q, item):
+            # 下游停止消费时及时退出，避免阻塞在已满的队列上
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def preprocess_worker():
+            # 流水线中同时有多个batch在途，不使用按batch大小复用的输入缓冲区
+            try:
+                batch = list()
+                for image in images:
+                    batch.append(image)
+                    if len(batch) < batch_size:
+                        continue
+                    if not put(preprocessed,
+                               (len(batch),
+                                self.preprocess(batch, self.thread_pool))):
+                        return
+                    batch = list()
+                if len(batch) > 0:
+                    put(preprocessed, (len(batch),
+                                       self.preprocess(batch,
+                                                       self.thread_pool)))
+                put(preprocessed, None)
+            except Exception as e:
+                put(preprocessed, e)
+
+        def predict_worker():
+            while not stop.is_set():
+                item = preprocessed.get()
+                if item is None or isinstance(item, Exception):
+                    put(predicted, item)
+                    return
+                num, preprocessed_input = item
+                try:
+                    model_pred = self.raw_predict(preprocessed_input)
+                except Exception as e:
+                    put(predicted, e)
+                    return
+                if not put(predicted, (num, preprocessed_input, model_pred)):
+                    return
+
+        workers = [
+            threading.Thread(target=preprocess_worker),
+            threading.Thread(target=predict_worker)
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        try:
+            while True:
+                item = predicted.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                num, preprocessed_input, model_pred = item
+                for result in self._postprocess_batch(
+                        preprocessed_input, model_pred, num, topk):
+                    yield result
+        finally:
+            stop.set()
+            # 唤醒可能阻塞在空队列上的预测线程
+            try:
+                preprocessed.put_nowait(None)
+            except queue.Full:
+                pass
+
+
+class _InputBuffers(object):
+    """按batch大小缓存的输入缓冲区，每种batch大小一块，图像尺寸变大时重新申请。
+
+    `alloc`返回的数组在下一次以相同batch大小调用前有效；Predictor在`raw_predict`中通过
+    copy_from_cpu将输入拷贝到预测引擎，之后缓冲区即可复用。
+    """
+
+    def __init__(self):
+        self._buffers = dict()
+
+    def alloc(self, specs):
+        offsets, size = specs_size(specs)
+        batch_size = specs[0][0][0]
+        buff = self._buffers.get(batch_size, None)
+        if buff is None or buff.nbytes < size:
+            buff = np.empty(max(size, 1), dtype='uint8')
+            self._buffers[batch_size] = buff
+        return split_buffer(buff, specs, offsets)
+
+
+class _Request(object):
+    __slots__ = ['image', 'future', 'enqueue_time']
+
+    def __init__(self, image, future):
+        self.image = image
+        self.future = future
+        self.enqueue_time = time.perf_counter()
+
+
+class BatchingPredictor(object):
+    """在Predictor外层进行动态组batch的预测服务。
+
+    多个线程（或asyncio任务）提交的单张图片请求进入同一个队列，由后台线程合并为不超过
+    `max_batch_size`张的batch调用`Predictor.batch_predict`，再将结果分发回各请求的future。
+    后台线程从队列中取出第一个请求后，最多再等待`max_wait_ms`毫秒凑满batch，因此排队带来的额外
+    延迟有上限；Predictor只在后台线程中使用，不需要调用方保证线程安全。
+
+    Args:
+        predictor (paddlex.deploy.Predictor): 用于预测的Predictor，不应再被其他线程直接使用。
+        max_batch_size (int): 每个batch的最大图片数。使用TensorRT时不应超过创建Predictor时的
+            max_trt_batch_size。默认为8。
+        max_wait_ms (float): 凑batch时最多等待的时间（毫秒）。默认为5。
+        topk (int): 分类预测时使用，表示预测前topk的结果。默认为1。
+        max_queue_size (int): 等待预测的请求数上限，超出时`submit`阻塞；为0时不限制。默认为0。
+        stats_window (int): 统计延迟时保留的最近请求数。默认为10000。
+    """
+
+    def __init__(self,
+                 predictor,
+                 max_batch_size=8,
+                 max_wait_ms=5,
+                 topk=1,
+                 max_queue_size=0,
+                 stats_window=10000):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size should be at least 1")
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.topk = topk
+        self._queue = queue.Queue(max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._queue_ms = collections.deque(maxlen=stats_window)
+        self._infer_ms = collections.deque(maxlen=stats_window)
+        self._batch_sizes = collections.deque(maxlen=stats_window)
+        self._num_requests = 0
+        self._num_batches = 0
+        self._submit_lock = threading.Lock()
+        self._closed = False
+        self._closing = False
+        self._worker = threading.Thread(target=self._loop)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, image):
+        """提交一张图片的预测请求。
+
+        Args:
+            image (str|np.ndarray): 图像路径；或者是解码后的排列格式为（H, W, C）且类型为float32且为BGR格式的数组。
+
+        Returns:
+            concurrent.futures.Future: 预测完成后其结果与`Predictor.predict`的返回值相同；
+                future的queue_ms及infer_ms属性分别为该请求的排队时间和所在batch的预测时间（毫秒）。
+        """
+        future = concurrent.futures.Future()
+        # 与close互斥，保证关闭后不再有请求排在结束标记之后
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("BatchingPredictor has been closed")
+            self._queue.put(_Request(image, future))
+        return future
+
+    def predict(self, image, timeout=None):
+        """提交预测请求并等待结果，可在多个线程中同时调用。
+
+        Args:
+            image (str|np.ndarray): 图像路径或解码后的BGR图像。
+            timeout (float): 等待结果的最长时间（秒）。默认为None，即一直等待。
+        """
+        return self.submit(image).result(timeout)
+
+    def predict_async(self, image):
+        """在asyncio中提交预测请求，返回可await的asyncio.Future。
+        """
+        import asyncio
+        return asyncio.wrap_future(self.submit(image))
+
+    def _next_batch(self):
+        request = self._queue.get()
+        if request is None:
+            return None
+        batch = [request]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000.
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    request = self._queue.get(timeout=remaining)
+                else:
+                    request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # 队列可能有长度限制，不将结束标记放回队列，当前batch处理完后退出
+                self._closing = True
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self, batch):
+        images = [request.image for request in batch]
+        try:
+            return self.predictor.batch_predict(images, topk=self.topk)
+        except Exception as e:
+            if len(batch) == 1:
+                return [e]
+        # batch中个别图片出错时逐张预测，避免影响同一batch中的其他请求
+        results = list()
+        for image in images:
+            try:
+                results.append(
+                    self.predictor.batch_predict(
+                        [image], topk=self.topk)[0])
+            except Exception as e:
+                results.append(e)
         return results
+
+    def _loop(self):
+        while not self._closing:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            batch = [
+                request for request in batch
+                if request.future.set_running_or_notify_cancel()
+            ]
+            if len(batch) == 0:
+                continue
+            start = time.perf_counter()
+            results = self._run(batch)
+            end = time.perf_counter()
+            infer_ms = (end - start) * 1000
+            with self._stats_lock:
+                self._num_requests += len(batch)
+                self._num_batches += 1
+                self._batch_sizes.append(len(batch))
+                for request in batch:
+                    self._queue_ms.append(
+                        (start - request.enqueue_time) * 1000)
+                    self._infer_ms.append(infer_ms)
+            for request, result in zip(batch, results):
+                request.future.queue_ms = (start - request.enqueue_time
+                                           ) * 1000
+                request.future.infer_ms = infer_ms
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+        # 关闭时仍未处理的请求（与close同时提交）直接返回异常
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None and \
+                    request.future.set_running_or_notify_cancel():
+                request.future.set_exception(
+                    RuntimeError("BatchingPredictor has been closed"))
+
+    def stats(self):
+        """返回最近请求的延迟统计。
+
+        Returns:
+            dict: 包含请求数、batch数、平均batch大小，以及排队时间（queue_ms）、预测时间（infer_ms）
+                和总延迟（total_ms）的平均值、p50、p90、p99（毫秒）。
+        """
+        with self._stats_lock:
+            queue_ms = np.array(self._queue_ms)
+            infer_ms = np.array(self._infer_ms)
+            batch_sizes = np.array(self._batch_sizes)
+            stats = {
+                'requests': self._num_requests,
+                'batches': self._num_batches,
+                'mean_batch_size': float(batch_sizes.mean())
+                if len(batch_sizes) > 0 else 0.
+            }
+        for name, values in [('queue_ms', queue_ms), ('infer_ms', infer_ms),
+                             ('total_ms', queue_ms + infer_ms)]:
+            if len(values) == 0:
+                stats[name] = None
+                continue
+            stats[name] = {
+                'mean': float(values.mean()),
+                'p50': float(np.percentile(values, 50)),
+                'p90': float(np.percentile(values, 90)),
+                'p99': float(np.percentile(values, 99))
+            }
+        return stats
+
+    def reset_stats(self):
+        """清空延迟统计。
+        """
+        with self._stats_lock:
+            self._queue_ms.clear()
+            self._infer_ms.clear()
+            self._batch_sizes.clear()
+            self._num_requests = 0
+            self._num_batches = 0
+
+    def close(self, timeout=None):
+        """停止接收新请求，处理完已提交的请求后结束后台线程。
+        """
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(mp.cpu_count()))
+
+
+def _pin_cores(cores):
+    # 在Linux下作用于调用线程，之后该线程创建的计算线程继承相同的绑核设置
+    if cores and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError as e:
+            logging.warning("Failed to pin cores {}: {}".format(cores, e))
+
+
+def _clone_instance(base, cores, create_args):
+    """创建与`base`共享模型结构及参数的Predictor实例，在实际运行该实例的线程/进程中调用。
+    """
+    _pin_cores(cores)
+    instance = copy.copy(base)
+    # 预处理在实例自身的线程中串行完成，transforms各实例独立，避免并发修改
+    instance.thread_pool = None
+    instance.transforms = copy.deepcopy(base.transforms)
+    if base._input_buffers is not None:
+        instance._input_buffers = _InputBuffers()
+    # 结果缓存（线程安全）在线程模式下由各实例共用，多进程模式下各进程的内存缓存相互独立
+    if hasattr(base.predictor, 'clone'):
+        instance.predictor = base.predictor.clone()
+    else:
+        instance.predictor = base.create_predictor(**create_args)
+    return instance
+
+
+def _run_task(instance, images, topk, single):
+    results = instance.batch_predict(images, topk=topk)
+    return results[0] if single else results
+
+
+def _dump_result(task_id, ok, value, trace=None):
+    """在worker进程中序列化结果，序列化失败时以包含异常信息的RuntimeError返回。
+    结果以bytes放入队列，由dispatcher反序列化，失败时可对应到具体的请求。
+    """
+    try:
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if not ok:
+            # 自定义构造函数的异常对象可能可以序列化却无法反序列化
+            pickle.loads(payload)
+    except Exception:
+        ok = False
+        payload = pickle.dumps(
+            RuntimeError("{}\n{}".format(trace or repr(value),
+                                          traceback.format_exc())))
+    return task_id, ok, payload
+
+
+def _process_worker(base, cores, create_args, task_queue, result_queue):
+    try:
+        instance = _clone_instance(base, cores, create_args)
+    except Exception as e:
+        # 以None为task_id通知dispatcher实例创建失败
+        result_queue.put(_dump_result(None, False, e, traceback.format_exc()))
+        return
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, images, topk, single = task
+        try:
+            value = _run_task(instance, images, topk, single)
+        except Exception as e:
+            result = _dump_result(task_id, False, e, traceback.format_exc())
+        else:
+            result = _dump_result(task_id, True, value)
+        result_queue.put(result)
+
+
+class PredictorPool(object):
+    """CPU上的多实例预测池。
+
+    单个Predictor使用大量MKL-DNN线程时扩展性较差，预测池创建`num_instances`个Predictor，
+    每个使用`threads_per_instance`个计算线程并绑定到不重叠的CPU核上，请求在各实例间分发。
+    各实例通过Predictor的clone接口创建，与第一个实例共享加载后的模型结构和参数。
+    多进程模式下子进程由fork创建，参数内存以写时复制的方式共享；Paddle预测在Python中
+    不释放GIL时，多线程模式下各实例的计算无法并行，因此默认使用多进程。
+    多线程模式下全部实例创建失败时构造函数抛出异常；多进程模式下实例在子进程中创建，
+    全部子进程退出后提交请求抛出RuntimeError。
+
+    Args:
+        model_dir (str): 模型路径（必须是导出的部署或量化模型）。
+        num_instances (int): Predictor实例数。默认为None，即可用CPU核数除以threads_per_instance。
+        threads_per_instance (int): 每个实例的计算线程数。默认为None，指定num_instances时为可用
+            CPU核数除以num_instances，否则为4。
+        use_mkl (bool): 是否使用mkldnn计算库。默认为True。
+        pin_cores (bool): 是否将各实例绑定到不同的CPU核上（仅Linux支持）。默认为True。
+        cores (list): 可使用的CPU核编号。默认为None，即当前进程可使用的全部CPU核。
+        mode (str): 实例运行在'process'（子进程）或'thread'（线程）中。默认为'process'
+            （Windows和Mac下会强制使用thread）。
+        use_glog (bool): 是否启用glog日志。默认为False。
+        memory_optimize (bool): 是否启动内存优化。默认为True。
+    """
+
+    def __init__(self,
+                 model_dir,
+                 num_instances=None,
+                 threads_per_instance=None,
+                 use_mkl=True,
+                 pin_cores=True,
+                 cores=None,
+                 mode='process',
+                 use_glog=False,
+                 memory_optimize=True):
+        if cores is None:
+            cores = _available_cores()
+        cores = list(cores)
+        if threads_per_instance is None:
+            threads_per_instance = max(
+                len(cores) // num_instances, 1) if num_instances else 4
+        if num_instances is None:
+            num_instances = max(len(cores) // threads_per_instance, 1)
+        if num_instances * threads_per_instance > len(cores):
+            logging.warning(
+                "{} instances x {} threads exceed the {} available cores".
+                format(num_instances, threads_per_instance, len(cores)))
+        if mode == 'process' and (platform.platform().startswith("Darwin") or
+                                  platform.platform().startswith("Windows")):
+            mode = 'thread'
+        if mode not in ['process', 'thread']:
+            raise ValueError("mode should be 'process' or 'thread'")
+        self.num_instances = num_instances
+        self.threads_per_instance = threads_per_instance
+        self.mode = mode
+        create_args = dict(
+            use_gpu=False,
+            use_mkl=use_mkl,
+            mkl_thread_num=threads_per_instance,
+            use_glog=use_glog,
+            memory_optimize=memory_optimize)
+        self.base = Predictor(
+            model_dir,
+            use_gpu=False,
+            use_mkl=use_mkl,
+            mkl_thread_num=threads_per_instance,
+            use_glog=use_glog,
+            memory_optimize=memory_optimize)
+        self.core_groups = list()
+        for i in range(num_instances):
+            group = [
+                cores[(i * threads_per_instance + j) % len(cores)]
+                for j in range(threads_per_instance)
+            ] if pin_cores else None
+            self.core_groups.append(group)
+        self._futures = dict()
+        self._futures_lock = threading.Lock()
+        self._submit_lock = threading.Lock()
+        self._next_id = 0
+        self._closed = False
+        self._workers = list()
+        self._num_exited = 0
+        if mode == 'thread':
+            self._task_queue = queue.Queue()
+            self._init_errors = list()
+            started = list()
+            for group in self.core_groups:
+                event = threading.Event()
+                worker = threading.Thread(
+                    target=self._thread_worker,
+                    args=(group, create_args, event))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+                started.append(event)
+            for event in started:
+                event.wait()
+            if len(self._init_errors) == len(self._workers):
+                raise self._init_errors[0]
+            if len(self._init_errors) > 0:
+                logging.warning(
+                    "{} of {} PredictorPool instances failed to start: {}".
+                    format(
+                        len(self._init_errors),
+                        len(self._workers), self._init_errors[0]))
+        else:
+            ctx = mp.get_context('fork')
+            self._task_queue = ctx.Queue()
+            self._result_queue = ctx.Queue()
+            for group in self.core_groups:
+                worker = ctx.Process(
+                    target=_process_worker,
+                    args=(self.base, group, create_args, self._task_queue,
+                          self._result_queue))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+            self._dispatcher = threading.Thread(target=self._dispatch)
+            self._dispatcher.daemon = True
+            self._dispatcher.start()
+
+    def _thread_worker(self, cores, create_args, started):
+        try:
+            instance = _clone_instance(self.base, cores, create_args)
+        except Exception as e:
+            # 由__init__汇总，全部实例创建失败时抛出
+            self._init_errors.append(e)
+            return
+        finally:
+            started.set()
+        while True:
+            task = self._task_queue.get()
+            if task is None:
+                break
+            future, images, topk, single = task
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(_run_task(instance, images, topk, single))
+            except Exception as e:
+                future.set_exception(e)
+
+    def _dispatch(self):
+        while True:
+            try:
+                item = self._result_queue.get(timeout=1)
+            except queue.Empty:
+                # 关闭过程中各进程正常退出，等待close放入的结束标记
+                if self._closed:
+                    continue
+                num_exited = sum(not worker.is_alive()
+                                 for worker in self._workers)
+                # 退出的进程取走的请求无法确定，只在有新的进程退出时返回异常
+                if num_exited > self._num_exited:
+                    self._num_exited = num_exited
+                    self._fail_pending(
+                        RuntimeError("A PredictorPool worker exited"))
+                continue
+            except Exception as e:
+                logging.warning(
+                    "Failed to get a result from PredictorPool workers: {}".
+                    format(e))
+                self._fail_pending(e)
+                continue
+            if item is None:
+                break
+            task_id, ok, payload = item
+            try:
+                result = pickle.loads(payload)
+            except Exception:
+                ok = False
+                result = RuntimeError(traceback.format_exc())
+            if task_id is None:
+                logging.warning(
+                    "Failed to create a PredictorPool instance: {}".format(
+                        result))
+                continue
+            with self._futures_lock:
+                future = self._futures.pop(task_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+
+    def _fail_pending(self, error):
+        with self._futures_lock:
+            futures = list(self._futures.values())
+            self._futures.clear()
+        for future in futures:
+            future.set_exception(error)
+
+    def _submit(self, images, topk, single):
+        future = concurrent.futures.Future()
+        # 与close互斥，保证关闭后不再有请求排在结束标记之后
+        with self._submit_lock:
+            if self._closed:
+                raise RuntimeError("PredictorPool has been closed")
+            if self.mode == 'process' and not any(
+                    worker.is_alive() for worker in self._workers):
+                raise RuntimeError("All PredictorPool instances have exited")
+            if self.mode == 'thread':
+                self._task_queue.put((future, images, topk, single))
+                return future
+            future.set_running_or_notify_cancel()
+            with self._futures_lock:
+                task_id = self._next_id
+                self._next_id += 1
+                self._futures[task_id] = future
+            self._task_queue.put((task_id, images, topk, single))
+        return future
+
+    def submit(self, image, topk=1):
+        """提交一张图片的预测请求，由空闲的实例处理。
+
+        Args:
+            image (str|np.ndarray): 图像路径；或者是解码后的排列格式为（H, W, C）且类型为float32且为BGR格式的数组。
+            topk (int): 分类预测时使用，表示预测前topk的结果。默认为1。
+
+        Returns:
+            concurrent.futures.Future: 结果与`Predictor.predict`的返回值相同。
+        """
+        return self._submit([image], topk, True)
+
+    def submit_batch(self, image_list, topk=1):
+        """提交一组图片的预测请求，由同一个实例以一个batch处理，future的结果与
+        `Predictor.batch_predict`的返回值相同。
+        """
+        return self._submit(list(image_list), topk, False)
+
+    def predict(self, image, topk=1):
+        """单张图片预测，可在多个线程中同时调用。
+        """
+        return self.submit(image, topk).result()
+
+    def batch_predict(self, image_list, topk=1):
+        """批量图片预测，可在多个线程中同时调用。
+        """
+        return self.submit_batch(image_list, topk).result()
+
+    def close(self):
+        """处理完已提交的请求后结束各实例。
+        """
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+        for _ in self._workers:
+            self._task_queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        error = RuntimeError("PredictorPool has been closed")
+        # 实例异常退出时队列中可能仍有未处理的请求，直接返回异常
+        while True:
+            try:
+                task = self._task_queue.get_nowait()
+            except queue.Empty:
+                break
+            if task is not None and self.mode == 'thread' and \
+                    task[0].set_running_or_notify_cancel():
+                task[0].set_exception(error)
+        if self.mode == 'process':
+            self._result_queue.put(None)
+            self._dispatcher.join()
+        self._fail_pending(error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def benchmark_predictor_pool(model_dir,
+                             images,
+                             configs=None,
+                             batch_size=1,
+                             num_requests=200,
+                             warmup=10,
+                             **kwargs):
+    """在不同的实例数×线程数配置下测试PredictorPool的吞吐量及延迟，用于选择最优配置。
+
+    每组配置先预热`warmup`个请求，再一次性提交`num_requests`个请求并等待全部完成。
+
+    Args:
+        model_dir (str): 模型路径（必须是导出的部署或量化模型）。
+        images (list): 测试使用的图片（路径或BGR图像数组），循环使用。
+        configs (list): 待测试的(num_instances, threads_per_instance)列表。默认为None，
+            即线程数取1、2、4、…，实例数取可用CPU核数除以线程数的全部组合。
+        batch_size (int): 每个请求的图片数。默认为1。
+        num_requests (int): 每组配置测试的请求数。默认为200。
+        warmup (int): 每组配置预热的请求数。默认为10。
+        **kwargs: 传给PredictorPool的其他参数，如use_mkl、mode、cores。
+
+    Returns:
+        list: 各组配置的结果，按吞吐量从高到低排序。每项为包含num_instances、threads_per_instance、
+            images_per_sec、p50_ms、p99_ms的dict。
+    """
+    if configs is None:
+        num_cores = len(kwargs.get('cores', None) or _available_cores())
+        configs = list()
+        threads = 1
+        while threads <= num_cores:
+            configs.append((num_cores // threads, threads))
+            threads *= 2
+    images = list(images)
+    results = list()
+    for num_instances, threads_per_instance in configs:
+        with PredictorPool(
+                model_dir,
+                num_instances=num_instances,
+                threads_per_instance=threads_per_instance,
+                **kwargs) as pool:
+
+            def batch(i):
+                return [
+                    images[(i * batch_size + j) % len(images)]
+                    for j in range(batch_size)
+                ]
+
+            for future in [
+                    pool.submit_batch(batch(i)) for i in range(warmup)
+            ]:
+                future.result()
+            latencies = list()
+
+            def done(future, submit_time):
+                latencies.append(time.perf_counter() - submit_time)
+
+            start = time.perf_counter()
+            futures = list()
+            for i in range(num_requests):
+                future = pool.submit_batch(batch(i))
+                future.add_done_callback(
+                    lambda f, t=time.perf_counter(): done(f, t))
+                futures.append(future)
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+        result = {
+            'num_instances': num_instances,
+            'threads_per_instance': threads_per_instance,
+            'images_per_sec': num_requests * batch_size / elapsed,
+            'p50_ms': float(np.percentile(latencies, 50)) * 1000,
+            'p99_ms': float(np.percentile(latencies, 99)) * 1000
+        }
+        logging.info(
+            "instances={num_instances} threads={threads_per_instance}: "
+            "{images_per_sec:.1f} images/s, p50 {p50_ms:.1f}ms, "
+            "p99 {p99_ms:.1f}ms".format(**result))
+        results.append(result)
+    results.sort(key=lambda r: -r['images_per_sec'])
+    if len(results) > 0:
+        logging.info(
+            "Best: {num_instances} instances x {threads_per_instance} threads, "
+            "{images_per_sec:.1f} images/s".format(**results[0]))
+    return results
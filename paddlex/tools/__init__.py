@@ -17,3 +17,4 @@
 from .convert import *
 from .split import *
 from .dataset_generate import *
+from .pack import *
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os.path as osp
+import random
+import paddlex.utils.logging as logging
+
+
+def pack_dataset(dataset, save_dir, shard_size=256 * 1024**2, shuffle=True):
+    """将已创建的数据集打包为分片文件，打包结果可通过`paddlex.datasets.PackedImageNet`、
+    `PackedDetection`及`PackedSegDataset`读取。
+
+    Args:
+        dataset (paddlex.datasets): 待打包的数据集，支持ImageNet、VOCDetection、
+            CocoDetection、SegDataset及对应的EasyData数据集。
+        save_dir (str): 打包文件的保存目录。
+        shard_size (int): 单个分片文件的最大字节数。默认为256MB。
+        shuffle (bool): 是否在打包时打乱样本顺序，使各分片内的样本分布一致。默认为True。
+
+    Returns:
+        str: 数据集的类型，为'imagenet'、'det'或'seg'。
+    """
+    from paddlex.cv.datasets import ImageNet, VOCDetection, SegDataset, EasyDataSeg
+    from paddlex.cv.datasets.record import RecordWriter
+    if isinstance(dataset, ImageNet):
+        dataset_type = 'imagenet'
+    elif isinstance(dataset, VOCDetection):
+        dataset_type = 'det'
+    elif isinstance(dataset, (SegDataset, EasyDataSeg)):
+        # EasyDataSeg的标注为解析后的标注图，打包时编码为PNG
+        dataset_type = 'seg'
+    else:
+        raise Exception("Dataset type {} is not supported to pack.".format(
+            type(dataset).__name__))
+    indices = list(range(len(dataset.file_list)))
+    if shuffle:
+        random.shuffle(indices)
+    writer = RecordWriter(save_dir, shard_size)
+    annotations = list()
+    for count, i in enumerate(indices):
+        sample = dataset.file_list[i]
+        if not isinstance(sample[0], str):
+            raise Exception(
+                "Only samples read from image files can be packed.")
+        if dataset_type == 'seg':
+            writer.add(sample[0], sample[1])
+        else:
+            writer.add(sample[0])
+            annotations.append(sample[1])
+        if (count + 1) % 1000 == 0:
+            logging.info("{}/{} samples packed.".format(count + 1,
+                                                         len(indices)))
+    if dataset_type == 'det':
+        # 检测数据集同时保存COCO格式的标注，用于评估
+        annotations = (annotations, dataset.coco_gt.dataset)
+    writer.close(dataset_type, list(dataset.labels), annotations)
+    logging.info("{} samples packed into {} shards in {}".format(
+        len(indices), len(writer.shards), save_dir))
+    return dataset_type
+
+
+def dataset_pack(dataset_dir,
+                 dataset_format,
+                 save_dir,
+                 file_list=None,
+                 shard_size=256 * 1024**2,
+                 shuffle=True):
+    """读取dataset_dir下标准格式的数据集并打包。
+
+    Args:
+        dataset_dir (str): 数据集所在的目录路径。
+        dataset_format (str): 数据集格式，为'imagenet'、'voc'、'coco'或'seg'。
+        save_dir (str): 打包文件的保存目录。
+        file_list (str): 数据集dataset_dir下的样本列表文件名（COCO格式为标注文件名）。
+            默认为None，即'train_list.txt'（COCO格式为'train.json'）。
+        shard_size (int): 单个分片文件的最大字节数。默认为256MB。
+        shuffle (bool): 是否在打包时打乱样本顺序。默认为True。
+    """
+    import paddlex as pdx
+    # 打包只读取样本列表及标注，不需要数据处理流程
+    transforms = list()
+    if dataset_format == 'coco':
+        if file_list is None:
+            file_list = 'train.json'
+        dataset = pdx.datasets.CocoDetection(
+            data_dir=osp.join(dataset_dir, 'JPEGImages'),
+            ann_file=osp.join(dataset_dir, file_list),
+            transforms=transforms)
+    else:
+        if file_list is None:
+            file_list = 'train_list.txt'
+        kwargs = dict(
+            data_dir=dataset_dir,
+            file_list=osp.join(dataset_dir, file_list),
+            label_list=osp.join(dataset_dir, 'labels.txt'),
+            transforms=transforms)
+        if dataset_format == 'imagenet':
+            dataset = pdx.datasets.ImageNet(**kwargs)
+        elif dataset_format == 'voc':
+            dataset = pdx.datasets.VOCDetection(**kwargs)
+        elif dataset_format == 'seg':
+            dataset = pdx.datasets.SegDataset(**kwargs)
+        else:
+            raise Exception("Dataset format {} is not supported to pack.".
+                            format(dataset_format))
+    pack_dataset(dataset, save_dir, shard_size, shuffle)
+    print("Dataset Pack Done.")
+    print("Samples: {}".format(len(dataset.file_list)))
+    print("Packed files saved in {}".format(save_dir))
@@ -21,3 +21,4 @@ from .utils import path_normalization
 from .download import download
 from .download import decompress
 from .download import download_and_decompress
+from .result_cache import ResultCache
@@ -0,0 +1,243 @@
+# copyright (c) 2020 PaddlePaddle Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import os.path as osp
+import copy
+import time
+import pickle
+import hashlib
+import tempfile
+import threading
+import collections
+import numpy as np
+from . import logging
+
+_SIMPLE_TYPES = (int, float, str, bool, type(None))
+
+
+def _config_value(value):
+    """将transforms的属性转为可稳定复现的值，无法表示的属性（如随机数生成器、统计对象）返回None。
+    """
+    if isinstance(value, _SIMPLE_TYPES):
+        return value
+    if isinstance(value, np.ndarray):
+        return ('ndarray', value.dtype.str, value.shape, value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return tuple(_config_value(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(
+            sorted((str(k), _config_value(v)) for k, v in value.items()))
+    return None
+
+
+def transforms_signature(transforms):
+    """返回transforms配置的文本描述，用作预测结果缓存key的一部分。
+
+    Arrange类操作及Compose的input_channel在首次预测时才由arrange_transforms设置，
+    且由模型决定，不计入描述。
+
+    Args:
+        transforms (paddlex.cls.transforms.Compose|list): 数据预处理操作。
+
+    Returns:
+        str: 由各操作的类名及属性组成的描述。
+    """
+    if transforms is None:
+        return 'None'
+    ops = getattr(transforms, 'transforms', transforms)
+    parts = list()
+    if ops is not transforms:
+        parts.append(
+            _op_signature(transforms, exclude=('transforms', 'input_channel')))
+    for op in ops:
+        if type(op).__name__.startswith('Arrange'):
+            continue
+        parts.append(_op_signature(op))
+    return ';'.join(parts)
+
+
+def _op_signature(op, exclude=()):
+    attrs = list()
+    for k, v in sorted(vars(op).items()):
+        if k.startswith('_') or k in exclude:
+            continue
+        attrs.append((k, _config_value(v)))
+    return repr((type(op).__name__, attrs))
+
+
+class ResultCache(object):
+    """以图像内容为key的预测结果缓存。
+
+    key由图像内容（图像路径时为文件的字节，np.ndarray时为像素数据及形状、类型）的哈希值、
+    `namespace`及调用方给出的附加信息（如transforms配置、topk）组成，重复提交的图像直接返回
+    缓存的结果，跳过预处理和预测。内存中按LRU策略最多保留`max_size`条结果；指定`cache_dir`时，
+    结果同时以pickle文件写入磁盘，内存中未命中时从磁盘读取，可在多个进程或多次运行之间共享。
+    返回的结果均为缓存的深拷贝，修改返回值不影响缓存。
+
+    Args:
+        max_size (int): 内存中最多缓存的结果数。默认为1024。
+        ttl (float): 结果的有效时间（秒），过期后视为未命中。默认为None，即不过期。
+        cache_dir (str): 磁盘缓存目录。默认为None，即只使用内存缓存。
+        namespace (str): 计入key的模型标识，用于区分共用磁盘缓存目录的不同模型。默认为''。
+    """
+
+    def __init__(self, max_size=1024, ttl=None, cache_dir=None,
+                 namespace=''):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.namespace = namespace
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir is not None and not osp.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, image, *extra):
+        """计算图像的缓存key。
+
+        Args:
+            image (str|np.ndarray): 图像路径，或解码后的图像数组。
+            *extra: 其他影响预测结果的参数，以repr计入key。
+
+        Returns:
+            str: 缓存key，图像既不是路径也不是数组时返回None，表示不使用缓存。
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(repr((self.namespace, ) + extra).encode())
+        if isinstance(image, str):
+            with open(image, 'rb') as f:
+                h.update(f.read())
+        elif isinstance(image, np.ndarray):
+            h.update(repr((image.dtype.str, image.shape)).encode())
+            h.update(np.ascontiguousarray(image).view('uint8').data)
+        else:
+            return None
+        return h.hexdigest()
+
+    def get(self, key):
+        """查找`key`对应的结果，未命中时返回None。
+        """
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                expire, value = entry
+                if expire is None or expire > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(value)
+                del self._entries[key]
+        value = self._load(key, now)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, value, now)
+        return copy.deepcopy(value)
+
+    def put(self, key, value):
+        """缓存`key`对应的结果。
+        """
+        if key is None:
+            return
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._insert(key, value, time.time())
+        self._dump(key, value)
+
+    def _insert(self, key, value, now):
+        if self.max_size <= 0:
+            return
+        expire = None if self.ttl is None else now + self.ttl
+        self._entries[key] = (expire, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _path(self, key):
+        return osp.join(self.cache_dir, key[:2], key + '.pkl')
+
+    def _load(self, key, now):
+        if self.cache_dir is None:
+            return None
+        path = self._path(key)
+        try:
+            if self.ttl is not None and osp.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, IOError):
+            return None
+        except Exception as e:
+            logging.warning("Failed to load cached result {}: {}".format(
+                path, e))
+            return None
+
+    def _dump(self, key, value):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        try:
+            if not osp.exists(osp.dirname(path)):
+                os.makedirs(osp.dirname(path), exist_ok=True)
+            # 先写临时文件再重命名，其他进程不会读到写了一半的文件
+            fd, tmp_path = tempfile.mkstemp(dir=osp.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logging.warning("Failed to save cached result {}: {}".format(
+                path, e))
+
+    def stats(self):
+        """返回缓存的统计。
+
+        Returns:
+            dict: 包含size（内存中的结果数）、hits（内存命中次数）、disk_hits（磁盘命中次数）、
+                misses（未命中次数）及hit_rate（命中率）。
+        """
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.disk_hits) / total
+                if total > 0 else 0.
+            }
+
+    def reset_stats(self):
+        """清空命中统计。
+        """
+        with self._lock:
+            self.hits = 0
+            self.disk_hits = 0
+            self.misses = 0
+
+    def clear(self):
+        """清空内存中的缓存，磁盘缓存不受影响。
+        """
+        with self._lock:
+            self._entries.clear()